@@ -0,0 +1,315 @@
+"""
+Deterministic stand-ins for the chat models, embeddings and search tools used by the workflows,
+so the graphs can be benchmarked offline. Output depends only on the input (and seed), latency is simulated.
+"""
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import zipfile
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence, get_args, get_origin
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel
+
+MODEL_NAME = "fake-benchmark-chat"
+
+
+def _seed(*parts: Any) -> int:
+    return int.from_bytes(hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def make_vocabulary(size: int = 2000, seed: int = 0) -> list[str]:
+    """Pronounceable pseudo words, so the splitter and embeddings see realistic word lengths"""
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bdfghklmnprstvz" for v in "aeiou"]
+    return ["".join(rng.choices(syllables, k=rng.randint(1, 4))) for _ in range(size)]
+
+
+VOCABULARY = make_vocabulary()
+
+
+def fake_text(n_words: int, *seed: Any) -> str:
+    rng = random.Random(_seed(*seed))
+    return " ".join(rng.choices(VOCABULARY, k=n_words))
+
+
+def synthetic_documents(n: int, words_per_doc: int = 300, seed: int = 0) -> list[Document]:
+    return [
+        Document(
+            page_content=fake_text(words_per_doc, seed, i),
+            metadata={"source": f"doc_{i}.txt", "page": i % 10},
+        )
+        for i in range(n)
+    ]
+
+
+def synthetic_pdf(pages: int, words_per_page: int = 300, seed: int = 0) -> bytes:
+    """Minimal PDF with one text stream per page, the text of a page wrapped into lines of 12 words"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        words = fake_text(words_per_page, seed, page).split()
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        stream = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream.encode("latin-1")))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+    pdf, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def synthetic_epub(chapters: int, paragraphs_per_chapter: int = 40, words_per_paragraph: int = 60, seed: int = 0) -> bytes:
+    """EPUB 3 zip with a cover page without text, then one XHTML document per chapter with a heading and paragraphs"""
+    items = [("cover", "<div><img src='cover.png'/></div>")]
+    for chapter in range(chapters):
+        paragraphs = "".join(
+            f"<p>{fake_text(words_per_paragraph, seed, chapter, i)}</p>" for i in range(paragraphs_per_chapter)
+        )
+        items.append((f"chapter_{chapter}", f"<h1>Chapter {chapter + 1}</h1>{paragraphs}"))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as book:
+        book.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        book.writestr(
+            "META-INF/container.xml",
+            '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            "</rootfiles></container>",
+        )
+        manifest = "".join(f'<item id="{name}" href="{name}.xhtml" media-type="application/xhtml+xml"/>' for name, _ in items)
+        spine = "".join(f'<itemref idref="{name}"/>' for name, _ in items)
+        book.writestr(
+            "OEBPS/content.opf",
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="id">synthetic</dc:identifier>'
+            f"<dc:title>Synthetic book</dc:title><dc:language>en</dc:language></metadata>"
+            f"<manifest>{manifest}</manifest><spine>{spine}</spine></package>",
+        )
+        for name, body in items:
+            book.writestr(
+                f"OEBPS/{name}.xhtml",
+                '<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml">'
+                f"<head><title>{name}</title><style>p {{ margin: 0 }}</style></head><body>{body}</body></html>",
+            )
+    return buffer.getvalue()
+
+
+def count_tokens(text: str) -> int:
+    return len(text.split())
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model returning `output_tokens` pseudo words derived from the hash of the prompt.
+    `latency` is waited before the first token and `token_latency` per token, in seconds.
+    With bound tools it makes `tool_calls_per_turn` calls in one turn, going round the tools,
+    and answers after it got the tool results,
+    `with_structured_output` fills the required fields of the schema from the generated text.
+    """
+    latency: float = 0.0
+    token_latency: float = 0.0
+    output_tokens: int = 50
+    seed: int = 0
+    tool_names: List[str] = []
+    tool_calls_per_turn: int = 1
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark-chat"
+
+    def _text(self, messages: List[BaseMessage]) -> str:
+        return fake_text(self.output_tokens, self.seed, [m.content for m in messages])
+
+    def _message(self, messages: List[BaseMessage]) -> AIMessage:
+        text = self._text(messages)
+        tool_calls = []
+        if self.tool_names and not isinstance(messages[-1], ToolMessage):
+            words = text.split()
+            tool_calls = [{
+                "name": self.tool_names[i % len(self.tool_names)],
+                "args": {"query": " ".join(words[5 * i:5 * i + 5])},
+                "id": f"call_{_seed(text, i) % 10**8}",
+            } for i in range(self.tool_calls_per_turn)]
+        input_tokens = sum(count_tokens(str(m.content)) for m in messages)
+        return AIMessage(
+            content="" if tool_calls else text,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": input_tokens + self.output_tokens,
+            },
+            response_metadata={"model_name": MODEL_NAME},
+        )
+
+    def _delay(self) -> float:
+        return self.latency + self.token_latency * self.output_tokens
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> ChatResult:
+        time.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    def _chunks(self, message: AIMessage) -> list[AIMessageChunk]:
+        if message.tool_calls:
+            # tool calls are not split, they arrive as a single chunk
+            return [AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                    for i, c in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            )]
+        words = message.content.split(" ")
+        chunks = [AIMessageChunk(content=w if i == 0 else " " + w) for i, w in enumerate(words)]
+        # usage is summed over chunks, report it once on the last one
+        chunks[-1].usage_metadata = message.usage_metadata
+        chunks[-1].response_metadata = message.response_metadata
+        return chunks
+
+    def _stream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for chunk in self._chunks(self._message(messages)):
+            time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._message(messages)):
+            await asyncio.sleep(self.token_latency)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakeChatModel":
+        return self.model_copy(update={"tool_names": [convert_to_openai_tool(t)["function"]["name"] for t in tools]})
+
+    def with_structured_output(self, schema: Any, *, include_raw: bool = False, **kwargs: Any) -> Runnable:
+        if include_raw:
+            return self | RunnableLambda(
+                lambda message: {"raw": message, "parsed": fill_schema(schema, message.content), "parsing_error": None}
+            )
+        return self | RunnableLambda(lambda message: fill_schema(schema, message.content))
+
+
+def _fill_value(annotation: Any, text: str) -> Any:
+    if type(None) in get_args(annotation):
+        annotation = next(a for a in get_args(annotation) if a is not type(None))
+    if get_origin(annotation) is list:
+        item = get_args(annotation)[0] if get_args(annotation) else str
+        return [_fill_value(item, part) for part in re.split(r"(?<=\w) (?=\w)", text)[:3]]
+    if annotation is int:
+        return _seed(text) % 100
+    if annotation is bool:
+        return _seed(text) % 2 == 0
+    return text
+
+
+def fill_schema(schema: type[BaseModel], text: str) -> BaseModel:
+    """Instance of the pydantic schema with every required field derived from text"""
+    return schema(**{
+        name: _fill_value(field.annotation, text)
+        for name, field in schema.model_fields.items()
+        if field.is_required()
+    })
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Feature hashing bag of words embeddings, texts sharing words get similar vectors.
+    `latency` simulates the round trip of one embeddings request, documents are sent in batches of `batch_size`.
+    With `matryoshka_dims` every word is also hashed into the leading dimensions, so like text-embedding-3
+    the truncated vector is a coarser embedding of the same text.
+    `max_requests` limits the requests in flight, like the connection pool of the API client.
+    """
+
+    def __init__(
+        self, size: int = 256, latency: float = 0.0, batch_size: int = 1000, matryoshka_dims: int = 0, max_requests: int = 0
+    ):
+        self.size = size
+        self.latency = latency
+        self.batch_size = batch_size
+        self.matryoshka_dims = matryoshka_dims
+        self._requests = threading.BoundedSemaphore(max_requests) if max_requests else contextlib.nullcontext()
+
+    def _request(self, batches: int) -> None:
+        with self._requests:
+            time.sleep(self.latency * batches)
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            h = _seed(word)
+            sign = 1.0 if (h >> 32) & 1 else -1.0
+            vector[h % self.size] += sign
+            if self.matryoshka_dims:
+                vector[(h >> 16) % self.matryoshka_dims] += sign
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._request(-(-len(texts) // self.batch_size))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._request(1)
+        return self._embed(text)
+
+
+def fake_search_tool(latency: float = 0.0, name: str = "fake_search") -> BaseTool:
+    """Search tool returning a deterministic snippet after `latency` seconds"""
+
+    def search(query: str) -> str:
+        time.sleep(latency)
+        return fake_text(100, "search", query)
+
+    async def asearch(query: str) -> str:
+        await asyncio.sleep(latency)
+        return fake_text(100, "search", query)
+
+    return StructuredTool.from_function(
+        func=search, coroutine=asearch, name=name, description="Searches the web for the query"
+    )
@@ -0,0 +1,58 @@
+"""
+Import time of the workflow and rag modules, measured with `python -X importtime`.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --modules workflows/plan.py rag/rag.py
+"""
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+MODULES = [
+    "workflows/cv.py",
+    "workflows/plan.py",
+    "workflows/research.py",
+    "workflows/repl.py",
+    "workflows/greenhouse_search.py",
+    "rag/rag.py",
+]
+
+
+def import_time(path: str, repeat: int = 3) -> dict:
+    """Returns best cumulative import time of the module in microseconds, modules import each other by name so run from its directory"""
+    module = pathlib.Path(path)
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module.stem}"],
+            cwd=ROOT / module.parent,
+            capture_output=True,
+            text=True,
+            env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        )
+        if proc.returncode != 0:
+            return {"module": path, "error": proc.stderr.strip().splitlines()[-1]}
+        # last line of the importtime report is the imported module itself:
+        # "import time:    self [us] | cumulative | imported package"
+        line = [l for l in proc.stderr.splitlines() if l.startswith("import time:")][-1]
+        cumulative = int(line.split("|")[1])
+        best = cumulative if best is None else min(best, cumulative)
+    return {"module": path, "cumulative_us": best}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for path in args.modules:
+        print(json.dumps(import_time(path, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
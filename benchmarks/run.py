@@ -0,0 +1,561 @@
+"""
+Offline end-to-end benchmarks of the rag and workflow graphs, with the chat models, embeddings
+and search tools replaced by the deterministic fakes in benchmarks/fakes.py.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --benchmarks retrieval rag_graph --scales 100 1000 --output results.jsonl
+    python benchmarks/run.py --latency 0.2 --token-latency 0.01
+
+Every result is printed as one JSON line with the git commit it was measured on, so the output of
+different commits can be compared directly. Scale is the corpus size for ingestion, (filtered_)retrieval,
+chunk_memory, matryoshka and rag_graph, number of query threads for concurrent_retrieval,
+number of concurrent sessions for query_batching,
+number of pages of the uploaded file for upload_parsing and pdf_parsing,
+number of chapters of the book for epub_ingestion, number of concurrent applications
+for cover_letter, number of plan steps for plan_executor and number of tool calls in the agent turn
+for tool_step.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import json
+import logging
+import pathlib
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+from unittest.mock import patch
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "workflows"))
+# appended, rag/streamlit.py must not shadow the streamlit package
+sys.path.append(str(ROOT / "rag"))
+
+from langchain_core.runnables import RunnableLambda  # noqa: E402
+
+from fakes import (  # noqa: E402
+    FakeChatModel, HashEmbeddings, fake_search_tool, fake_text, synthetic_documents, synthetic_epub, synthetic_pdf,
+)
+from instrumentation import InstrumentationHandler  # noqa: E402
+
+SCALES = {
+    "ingestion": [100, 1000, 5000],
+    "retrieval": [100, 1000, 5000],
+    "filtered_retrieval": [100, 1000, 5000],
+    "concurrent_retrieval": [1, 2, 4, 8],
+    "query_batching": [1, 8, 32],
+    "chunk_memory": [1000, 10000, 50000],
+    "matryoshka": [1000, 10000, 50000],
+    "upload_parsing": [10, 100, 500],
+    "pdf_parsing": [100, 500, 1500],
+    "epub_ingestion": [10, 100, 500],
+    "rag_graph": [100, 1000],
+    "cover_letter": [1, 8, 32],
+    "plan_executor": [4, 8, 16],
+    "tool_step": [1, 2, 4, 8],
+}
+QUERIES = 50
+
+
+def _git_commit() -> str:
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return proc.stdout.strip() or "unknown"
+
+
+def _percentiles(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def _fake_llm(args) -> FakeChatModel:
+    return FakeChatModel(latency=args.latency, token_latency=args.token_latency, output_tokens=args.output_tokens)
+
+
+def _queries(n: int) -> list[str]:
+    return [fake_text(8, "query", i) for i in range(n)]
+
+
+@contextlib.contextmanager
+def _fake_vector_store(args, **embedding_options):
+    import retriever
+    retriever.get_index_registry.cache_clear()
+    embeddings = HashEmbeddings(latency=args.embedding_latency, **embedding_options)
+    with tempfile.TemporaryDirectory() as index_dir, \
+            patch.object(retriever, "INDEX_DIR", index_dir), \
+            patch.object(retriever, "get_embeddings", lambda: embeddings):
+        yield retriever
+    retriever.get_index_registry.cache_clear()
+
+
+def bench_ingestion(scale: int, args) -> dict:
+    docs = synthetic_documents(scale)
+    with _fake_vector_store(args) as retriever:
+        start = time.perf_counter()
+        retriever.DocumentRetriever(documents=docs)
+        seconds = time.perf_counter() - start
+        with retriever.get_index_registry().open(retriever.DEFAULT_NAMESPACE) as index:
+            chunks = len(index)
+    return {"seconds": seconds, "throughput": scale / seconds, "unit": "docs/s", "chunks": chunks}
+
+
+def bench_retrieval(scale: int, args) -> dict:
+    with _fake_vector_store(args) as retriever:
+        doc_retriever = retriever.DocumentRetriever(documents=synthetic_documents(scale))
+        latencies, context_chars = [], []
+        for query in _queries(QUERIES):
+            start = time.perf_counter()
+            docs = doc_retriever.invoke(query)
+            latencies.append(time.perf_counter() - start)
+            context_chars.append(sum(len(doc.page_content) for doc in docs))
+    seconds = sum(latencies)
+    return {
+        "seconds": seconds,
+        "throughput": QUERIES / seconds,
+        "unit": "queries/s",
+        **_percentiles(latencies),
+        # size of the context the generate node would send, lower means less duplicated text
+        "context_chars": statistics.mean(context_chars),
+    }
+
+
+def bench_filtered_retrieval(scale: int, args) -> dict:
+    # queries restricted to 1% of the uploaded files, only their chunks are scored
+    sources = [f"doc_{i}.txt" for i in range(0, scale, 100)]
+    with _fake_vector_store(args) as retriever:
+        doc_retriever = retriever.DocumentRetriever(documents=synthetic_documents(scale))
+        latencies = []
+        for query in _queries(QUERIES):
+            start = time.perf_counter()
+            doc_retriever.invoke(query, filters={"source": sources})
+            latencies.append(time.perf_counter() - start)
+    seconds = sum(latencies)
+    return {"seconds": seconds, "throughput": QUERIES / seconds, "unit": "queries/s", **_percentiles(latencies)}
+
+
+def bench_concurrent_retrieval(scale: int, args) -> dict:
+    # scale threads query a 2000 document index while another thread keeps ingesting documents
+    with _fake_vector_store(args) as retriever:
+        doc_retriever = retriever.DocumentRetriever(documents=synthetic_documents(2000))
+        stop = threading.Event()
+
+        def ingest():
+            batch = 0
+            while not stop.is_set():
+                batch += 1
+                retriever.DocumentRetriever.store_documents(synthetic_documents(10, seed=batch))
+
+        def query(thread: int):
+            for query in _queries(QUERIES):
+                doc_retriever.invoke(query)
+
+        writer = threading.Thread(target=ingest)
+        writer.start()
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(scale) as pool:
+            list(pool.map(query, range(scale)))
+        seconds = time.perf_counter() - start
+        stop.set()
+        writer.join()
+        with retriever.get_index_registry().open(retriever.DEFAULT_NAMESPACE) as index:
+            segments = len(index.segments)
+    return {"seconds": seconds, "throughput": scale * QUERIES / seconds, "unit": "queries/s", "segments": segments}
+
+
+def bench_query_batching(scale: int, args) -> dict:
+    # scale sessions query at once, embeddings requests take --embedding-latency (20 ms if not set)
+    # and at most 4 are in flight, like the connection pool of the API client
+    args = argparse.Namespace(**{**vars(args), "embedding_latency": args.embedding_latency or 0.02})
+    result = {"unit": "queries/s"}
+    with _fake_vector_store(args, max_requests=4) as retriever:
+        retriever.DocumentRetriever(documents=synthetic_documents(2000))
+        for mode, batch_queries in (("single", False), ("batched", True)):
+            doc_retriever = retriever.DocumentRetriever(batch_queries=batch_queries)
+            latencies = []
+
+            def query(session: int):
+                for query in _queries(QUERIES // 5):
+                    start = time.perf_counter()
+                    doc_retriever.invoke(f"{query} {session}")
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(scale) as pool:
+                list(pool.map(query, range(scale)))
+            seconds = time.perf_counter() - start
+            result[mode] = {"throughput": len(latencies) / seconds, **_percentiles(latencies)}
+    return {"seconds": seconds, "throughput": result["batched"]["throughput"], **result}
+
+
+def _chunk_memory(layout: str, scale: int) -> dict:
+    # runs in a fresh process, so peak RSS only covers this layout
+    from chunks import ChunkColumns
+    from retriever import split_documents
+    docs = synthetic_documents(scale, words_per_doc=100)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    store = []
+    # split and stored in batches like uploads, only the chunks of one batch exist as split Documents at once
+    for i in range(0, scale, 500):
+        splits = split_documents(docs[i:i + 500])
+        if layout == "documents":
+            store.extend(splits)
+        else:
+            store.append(ChunkColumns([split.page_content for split in splits], [split.metadata for split in splits]))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"peak_rss_mb": peak / 1024, "chunks_rss_mb": (peak - baseline) / 1024}
+
+
+def bench_chunk_memory(scale: int, args) -> dict:
+    # memory of the chunk texts and metadata as Document objects and as ChunkColumns, vectors not included
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context, max_tasks_per_child=1) as pool:
+        result = {layout: pool.submit(_chunk_memory, layout, scale).result() for layout in ("documents", "columns")}
+    return {"seconds": time.perf_counter() - start, **result}
+
+
+class _UploadedFile(io.BytesIO):
+    # like streamlit's UploadedFile, a BytesIO with the file name
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+def _parse_upload_from_temp_file(retriever, file: _UploadedFile) -> None:
+    # how uploads were parsed before load_uploaded_bytes, kept as the baseline
+    from document_loader import load_document
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_filepath = os.path.join(temp_dir, file.name)
+        with open(temp_filepath, "wb") as f:
+            f.write(file.getvalue())
+        retriever._with_upload_metadata(load_document(temp_filepath), file.name)
+
+
+def _parse_copy_kb(extension: str, pages: int, data: bytes) -> float:
+    import pdf_pages
+    return len(data) / 1024 if extension == "pdf" and pages >= pdf_pages.PARALLEL_MIN_PAGES else 0
+
+
+def bench_upload_parsing(scale: int, args) -> dict:
+    # scale pages of a PDF, or as many words in a text file, parsed through a temp file and from memory
+    import retriever
+    uploads = {
+        "txt": fake_text(300 * scale, "upload").encode("utf-8"),
+        "pdf": synthetic_pdf(scale),
+    }
+    methods = {
+        "temp_file": lambda file: _parse_upload_from_temp_file(retriever, file),
+        "memory": lambda file: retriever.load_uploaded_bytes(file.getbuffer(), file.name),
+    }
+    result, seconds = {}, 0.0
+    logging.disable(logging.INFO)
+    try:
+        for extension, data in uploads.items():
+            for method, parse in methods.items():
+                file = _UploadedFile(data, f"upload.{extension}")
+                try:
+                    latencies = []
+                    for _ in range(5):
+                        start = time.perf_counter()
+                        parse(file)
+                        latencies.append(time.perf_counter() - start)
+                    # allocations while parsing, including the copies of the upload
+                    tracemalloc.start()
+                    parse(file)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                except ImportError as e:
+                    result[f"{extension}_{method}"] = {"error": f"{type(e).__name__}: {e}"}
+                    continue
+                seconds += sum(latencies)
+                result[f"{extension}_{method}"] = {
+                    "upload_kb": len(data) / 1024,
+                    "p50_ms": statistics.median(latencies) * 1000,
+                    "peak_alloc_kb": peak / 1024,
+                    # written to the temp file and read back by the loader, from memory only PDFs large
+                    # enough for the worker processes get one temporary copy
+                    "disk_kb": 2 * len(data) / 1024 if method == "temp_file" else _parse_copy_kb(extension, scale, data),
+                }
+    finally:
+        logging.disable(logging.NOTSET)
+    return {"seconds": seconds, **result}
+
+
+def bench_pdf_parsing(scale: int, args) -> dict:
+    # scale pages parsed by PyPDFParser in this process and in page ranges by the process pool
+    from langchain_community.document_loaders.parsers.pdf import PyPDFParser
+    from langchain_core.documents.base import Blob
+    import pdf_pages
+    data = synthetic_pdf(scale)
+    start = time.perf_counter()
+    pages = len(list(PyPDFParser().lazy_parse(Blob.from_data(data, path="large.pdf"))))
+    sequential = time.perf_counter() - start
+    # started outside the measurement, the pool lives as long as the app
+    pdf_pages.get_pdf_pool().submit(int).result()
+    start = time.perf_counter()
+    first_range = None
+    for _ in pdf_pages.iter_pdf_pages(io.BytesIO(data), "large.pdf"):
+        first_range = first_range or time.perf_counter() - start
+    parallel = time.perf_counter() - start
+    return {
+        "seconds": parallel,
+        "throughput": pages / parallel,
+        "unit": "pages/s",
+        "sequential_seconds": sequential,
+        "speedup": sequential / parallel,
+        # splitting and embedding can start after this
+        "first_range_seconds": first_range,
+        "cpus": os.cpu_count(),
+    }
+
+
+def bench_epub_ingestion(scale: int, args) -> dict:
+    # a book of scale chapters loaded, split and indexed with unstructured's element mode and by chapters
+    import document_loader
+    result, seconds = {}, 0.0
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as directory, _fake_vector_store(args) as retriever:
+        path = os.path.join(directory, "book.epub")
+        with open(path, "wb") as f:
+            f.write(synthetic_epub(scale))
+        for mode, loader in (("elements", document_loader.EpubReader), ("chapters", document_loader.EpubChapterLoader)):
+            try:
+                start = time.perf_counter()
+                docs = loader(path).load()
+                retriever.DocumentRetriever.store_documents(docs, namespace=mode)
+                elapsed = time.perf_counter() - start
+                # allocations of loading and splitting, measured separately as tracing slows everything down
+                tracemalloc.start()
+                retriever.split_documents(loader(path).load())
+                peak = tracemalloc.get_traced_memory()[1]
+            except ImportError as e:
+                result[mode] = {"error": f"{type(e).__name__}: {e}"}
+                continue
+            finally:
+                tracemalloc.stop()
+            with retriever.get_index_registry().open(mode) as index:
+                chunks = len(index)
+            seconds += elapsed
+            result[mode] = {"documents": len(docs), "chunks": chunks, "seconds": elapsed, "peak_alloc_mb": peak / 2**20}
+    logging.disable(logging.NOTSET)
+    return {"seconds": seconds, **result}
+
+
+def bench_matryoshka(scale: int, args) -> dict:
+    # two stage search over 256 of 1536 dimensions against exact full dimension search, on the same corpus
+    from index import NamespaceIndex
+    embedding = HashEmbeddings(size=1536, matryoshka_dims=256)
+    docs = synthetic_documents(scale, words_per_doc=200)
+    with tempfile.TemporaryDirectory() as directory:
+        exact = NamespaceIndex(embedding)
+        coarse = NamespaceIndex(embedding, coarse_dims=256, directory=pathlib.Path(directory))
+        for index in (exact, coarse):
+            for i in range(0, scale, 500):
+                index.add_documents(docs[i:i + 500])
+            index.merge()
+        queries = [embedding.embed_query(q) for q in _queries(QUERIES)]
+        latencies, recalls = {"exact": [], "coarse": []}, []
+        for query in queries:
+            results = {}
+            for name, index in (("exact", exact), ("coarse", coarse)):
+                start = time.perf_counter()
+                results[name] = {row["text"] for row in index.search(query, k=5)}
+                latencies[name].append(time.perf_counter() - start)
+            recalls.append(len(results["exact"] & results["coarse"]) / len(results["exact"]))
+        result = {
+            "seconds": sum(latencies["coarse"]),
+            "throughput": QUERIES / sum(latencies["coarse"]),
+            "unit": "queries/s",
+            "recall_at_5": statistics.mean(recalls),
+            "exact_p50_ms": statistics.median(latencies["exact"]) * 1000,
+            "coarse_p50_ms": statistics.median(latencies["coarse"]) * 1000,
+            "exact_vector_bytes": sum(segment.vectors.nbytes for segment in exact.segments),
+            "coarse_vector_bytes": sum(segment.coarse.nbytes for segment in coarse.segments),
+        }
+        coarse.release()
+    return result
+
+
+def bench_rag_graph(scale: int, args) -> dict:
+    from langchain_core.messages import HumanMessage
+    with _fake_vector_store(args) as retriever:
+        import rag
+        doc_retriever = retriever.DocumentRetriever(documents=synthetic_documents(scale))
+        handler = InstrumentationHandler()
+        rag.get_graph.cache_clear()
+        with patch.object(rag, "get_chat_model", lambda: _fake_llm(args)), \
+                patch.object(rag, "get_retriever", lambda: doc_retriever):
+            graph = rag.get_graph()
+            first_token, latencies = [], []
+            for i, query in enumerate(_queries(QUERIES // 5)):
+                config = {"configurable": {"thread_id": f"bench-{i}"}, "callbacks": [handler]}
+                start = time.perf_counter()
+                for n, _ in enumerate(graph.stream({"messages": [HumanMessage(query)]}, config, stream_mode="messages")):
+                    if n == 0:
+                        first_token.append(time.perf_counter() - start)
+                latencies.append(time.perf_counter() - start)
+        rag.get_graph.cache_clear()
+    seconds = sum(latencies)
+    return {
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds,
+        "unit": "questions/s",
+        **_percentiles(latencies),
+        "first_token_p50_ms": statistics.median(first_token) * 1000,
+        "tokens": handler.summary()["totals"],
+    }
+
+
+def bench_cover_letter(scale: int, args) -> dict:
+    import cv
+    fake = _fake_llm(args)
+    chains = [cv.job_description_chain, cv.critique_chain, cv.revise_chain]
+    handler = InstrumentationHandler()
+    for chain in chains:
+        chain.get.cache_clear()
+    with patch.object(cv.llm, "get", lambda: fake), patch.object(cv.strong_llm, "get", lambda: fake):
+        graph = cv.build_graph()
+        inputs = [
+            {"resume_str": fake_text(400, "resume", i), "job_url_content": fake_text(2000, "job", i)}
+            for i in range(scale)
+        ]
+        start = time.perf_counter()
+        graph.batch(inputs, config={"callbacks": [handler], "max_concurrency": scale})
+        seconds = time.perf_counter() - start
+    for chain in chains:
+        chain.get.cache_clear()
+    return {"seconds": seconds, "throughput": scale / seconds, "unit": "letters/s", "tokens": handler.summary()["totals"]}
+
+
+def _synthetic_plan(steps: int):
+    from plan import Plan
+    # three independent searches followed by a step combining them, repeated
+    return Plan(
+        steps=[fake_text(10, "step", i) for i in range(steps)],
+        dependencies=[[i - 3, i - 2, i - 1] if i % 4 == 0 else [] for i in range(1, steps + 1)],
+    )
+
+
+def bench_plan_executor(scale: int, args) -> dict:
+    import plan
+    from langgraph.prebuilt import create_react_agent
+    fake = _fake_llm(args)
+    tools = [fake_search_tool(latency=args.tool_latency)]
+    planner = plan.planner_prompt | fake | RunnableLambda(lambda _: _synthetic_plan(scale))
+    executor = create_react_agent(model=fake, tools=tools, prompt=plan.executor_prompt, state_schema=plan.ExecutorState)
+    handler = InstrumentationHandler()
+    with patch.object(plan.llm, "get", lambda: fake), \
+            patch.object(plan.planner, "get", lambda: planner), \
+            patch.object(plan.executor_agent, "get", lambda: executor):
+        graph = plan.build_graph()
+        start = time.perf_counter()
+        asyncio.run(graph.ainvoke({"task": fake_text(20, "task")}, config={"callbacks": [handler]}))
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "throughput": scale / seconds, "unit": "steps/s", "tokens": handler.summary()["totals"]}
+
+
+def _agent_step_ms(tools, calls: int, run) -> float:
+    from langgraph.prebuilt import create_react_agent
+    agent = create_react_agent(model=FakeChatModel(tool_calls_per_turn=calls), tools=tools)
+    start = time.perf_counter()
+    run(agent, {"messages": [("user", fake_text(20, "question"))]})
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_tool_step(scale: int, args) -> dict:
+    from tool_timeouts import with_timeouts
+    # without --tool-latency the searches take 0.2s, one of them ten times as long
+    latency = args.tool_latency or 0.2
+    names = [f"search_{i}" for i in range(scale)]
+    tools = [fake_search_tool(latency * (10 if i == scale - 1 else 1), name) for i, name in enumerate(names)]
+    start = time.perf_counter()
+    # one call after the other, as a node executing tool calls in order would
+    for tool in tools:
+        tool.invoke({"query": "query"})
+    sequential_ms = (time.perf_counter() - start) * 1000
+    limited = with_timeouts(tools, {names[-1]: 2 * latency})
+    return {
+        "unit": "ms per agent step",
+        "sequential_ms": sequential_ms,
+        "concurrent_ms": _agent_step_ms(tools, scale, lambda agent, inputs: agent.invoke(inputs)),
+        "timeout_ms": _agent_step_ms(limited, scale, lambda agent, inputs: agent.invoke(inputs)),
+        "async_timeout_ms": _agent_step_ms(limited, scale, lambda agent, inputs: asyncio.run(agent.ainvoke(inputs))),
+    }
+
+
+BENCHMARKS = {
+    "ingestion": bench_ingestion,
+    "retrieval": bench_retrieval,
+    "filtered_retrieval": bench_filtered_retrieval,
+    "concurrent_retrieval": bench_concurrent_retrieval,
+    "query_batching": bench_query_batching,
+    "chunk_memory": bench_chunk_memory,
+    "matryoshka": bench_matryoshka,
+    "upload_parsing": bench_upload_parsing,
+    "pdf_parsing": bench_pdf_parsing,
+    "epub_ingestion": bench_epub_ingestion,
+    "rag_graph": bench_rag_graph,
+    "cover_letter": bench_cover_letter,
+    "plan_executor": bench_plan_executor,
+    "tool_step": bench_tool_step,
+}
+
+
+def run(name: str, scale: int, args) -> dict:
+    result = {"benchmark": name, "scale": scale}
+    try:
+        # the graphs print their intermediate results, keep them out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            result.update(BENCHMARKS[name](scale, args))
+    except ImportError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--benchmarks", nargs="*", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument("--scales", nargs="*", type=int, help="overrides the default scales of every benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token of every llm call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated token")
+    parser.add_argument("--output-tokens", type=int, default=50)
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="seconds per embeddings request")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="seconds per search tool call")
+    parser.add_argument("--output", type=str, help="file the JSON lines are appended to")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+    environment = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "latency": args.latency,
+        "token_latency": args.token_latency,
+    }
+    output = open(args.output, "a") if args.output else None
+    for name in args.benchmarks:
+        for scale in args.scales or SCALES[name]:
+            line = json.dumps({**run(name, scale, args), **environment})
+            print(line)
+            if output:
+                output.write(line + "\n")
+    if output:
+        output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Per-call latency of the sandbox worker pool (workflows/sandbox.py) compared to
+spawning a fresh interpreter for every call.
+
+    python benchmarks/sandbox_latency.py --calls 20
+"""
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "workflows"))
+from sandbox import DEFAULT_PRELOAD, SandboxPool  # noqa: E402
+
+SNIPPETS = {
+    "print": "print(sum(range(1000)))",
+    "numpy": "import numpy as np\nprint(np.linspace(0, 1, 1000).mean())",
+}
+
+
+def _summary(name: str, mode: str, latencies: list[float]) -> dict:
+    return {
+        "snippet": name,
+        "mode": mode,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def fresh_interpreter(code: str, calls: int) -> list[float]:
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], capture_output=True, check=False)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def pool(sandbox: SandboxPool, code: str, calls: int) -> list[float]:
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        sandbox.execute(code)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    with SandboxPool(size=1, preload=DEFAULT_PRELOAD) as sandbox:
+        # first call waits for the worker to finish preloading
+        sandbox.execute("pass")
+        for name, code in SNIPPETS.items():
+            print(json.dumps(_summary(name, "fresh_interpreter", fresh_interpreter(code, args.calls))))
+            print(json.dumps(_summary(name, "pool", pool(sandbox, code, args.calls))))
+
+
+if __name__ == "__main__":
+    main()
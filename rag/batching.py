@@ -0,0 +1,114 @@
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from index import NamespaceIndex
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _query_model(embedding: Embeddings) -> Embeddings:
+    # embed_query of CacheBackedEmbeddings goes straight to the model, batched queries do the same
+    # instead of going through embed_documents, which would write every query to the document cache
+    return getattr(embedding, "underlying_embeddings", embedding)
+
+
+@dataclasses.dataclass
+class _Request:
+    index: NamespaceIndex
+    query: str
+    k: int
+    filters: Optional[dict]
+    future: concurrent.futures.Future
+
+
+class QueryBatcher:
+    """
+    Micro-batches retrieval queries of concurrent sessions. The queries arriving within window_ms
+    of the first one (at most max_batch) are embedded with one embeddings request, and the queries
+    on the same index with the same filters are scored with one matrix-matrix product.
+    Every caller still gets its own top k. The window is only waited while other searches are
+    in progress, a lone session is not delayed. Batches are processed by `workers` threads,
+    so a slow embeddings request does not hold up collecting the next batch.
+    """
+
+    def __init__(self, window_ms: float = 5.0, max_batch: int = 32, workers: int = 4):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._requests: queue.Queue[Optional[_Request]] = queue.Queue()
+        # callers inside search, queued or waiting for their batch
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-batch")
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def search(
+        self, index: NamespaceIndex, query: str, k: int, filters: Optional[dict] = None
+    ) -> tuple[List[float], List[dict]]:
+        """Query embedding and top k rows of index.search, blocks until the batch of the query is processed"""
+        future = concurrent.futures.Future()
+        with self._active_lock:
+            self._active += 1
+        try:
+            self._requests.put(_Request(index, query, k, filters, future))
+            return future.result()
+        finally:
+            with self._active_lock:
+                self._active -= 1
+
+    def _collect(self) -> None:
+        while (first := self._requests.get()) is not None:
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch and self._active > len(batch):
+                try:
+                    request = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    # closing, process what was collected and stop
+                    self._requests.put(None)
+                    break
+                batch.append(request)
+            self._executor.submit(self._process, batch)
+
+    def _process(self, batch: List[_Request]) -> None:
+        try:
+            by_embedding: dict[int, List[_Request]] = {}
+            for request in batch:
+                by_embedding.setdefault(id(request.index.embedding), []).append(request)
+            embeddings = {}
+            for requests in by_embedding.values():
+                model = _query_model(requests[0].index.embedding)
+                vectors = model.embed_documents([request.query for request in requests])
+                embeddings.update(zip(map(id, requests), vectors))
+            groups: dict[tuple, List[_Request]] = {}
+            for request in batch:
+                key = (id(request.index), json.dumps(request.filters, sort_keys=True, default=str))
+                groups.setdefault(key, []).append(request)
+            for requests in groups.values():
+                results = requests[0].index.search_batch(
+                    [embeddings[id(request)] for request in requests],
+                    max(request.k for request in requests),
+                    requests[0].filters,
+                )
+                for request, rows in zip(requests, results):
+                    request.future.set_result((embeddings[id(request)], rows[:request.k]))
+        except Exception as e:
+            LOGGER.exception(f"batch of {len(batch)} queries failed")
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    def close(self) -> None:
+        self._requests.put(None)
+        self._collector.join()
+        self._executor.shutdown()
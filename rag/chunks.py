@@ -0,0 +1,184 @@
+import json
+import numbers
+from typing import Any, Iterable, Optional, Sequence
+
+import numpy as np
+
+from metadata_index import INDEXED_FIELDS, UPLOADED_AT
+
+# rough size of one distinct interned metadata value
+VALUE_OVERHEAD_BYTES = 100
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _key(value: Any) -> str:
+    # metadata values may be unhashable, e.g. lists of languages from unstructured
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class ChunkColumns:
+    """
+    Texts and metadata of the chunks of one index segment in columnar form, instead of one
+    Document with its own metadata dict per chunk. Texts are one UTF-8 buffer with offsets.
+    Metadata fields that are numbers on every chunk (page, start_index, uploaded_at) are numpy
+    columns, other fields are interned: a code per chunk (-1 when missing) into the list of
+    distinct values. Chunks are materialized only for search results, see text() and metadata().
+    The filterable fields and the upload time are indexed: row positions sorted by the field,
+    so a filter value or time range is a binary search and a slice instead of a scan of every row.
+
+    Filters look like {"source": ["a.pdf"], "extension": ".pdf", "page": [1, 2],
+    "uploaded_after": 1700000000.0, "uploaded_before": 1800000000.0}. Conditions on different
+    fields are combined with AND, list of values of one field with OR.
+    """
+
+    def __init__(self, texts: Sequence[str], metadatas: Sequence[dict]):
+        encoded = [text.encode("utf-8") for text in texts]
+        self.buffer = b"".join(encoded)
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=self.offsets[1:])
+        # fields in the order they first appear, so materialized metadata keeps the loader's order
+        self.fields = list(dict.fromkeys(field for metadata in metadatas for field in metadata))
+        self.numeric: dict[str, np.ndarray] = {}
+        self.interned: dict[str, tuple[np.ndarray, list]] = {}
+        for field in self.fields:
+            values = [metadata.get(field) for metadata in metadatas]
+            if all(_is_number(value) for value in values):
+                dtype = np.int64 if all(isinstance(value, numbers.Integral) for value in values) else np.float64
+                self.numeric[field] = np.array(values, dtype=dtype)
+            else:
+                self.interned[field] = self._intern(values)
+        # sorted keys (value or code) and the row positions in that order, per indexed field
+        self.sorted: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        # code of every distinct value of the interned indexed fields
+        self.codes: dict[str, dict[str, int]] = {}
+        for field in (*INDEXED_FIELDS, UPLOADED_AT):
+            keys = self._uploaded_at() if field == UPLOADED_AT else self._keys(field)
+            if keys is not None:
+                order = np.argsort(keys, kind="stable").astype(np.int32)
+                self.sorted[field] = (keys[order], order)
+            if field in self.interned and field != UPLOADED_AT:
+                self.codes[field] = {_key(value): code for code, value in enumerate(self.interned[field][1])}
+
+    @staticmethod
+    def _intern(values: Iterable[Any]) -> tuple[np.ndarray, list]:
+        codes, table, distinct = [], [], {}
+        for value in values:
+            if value is None:
+                codes.append(-1)
+                continue
+            code = distinct.setdefault(_key(value), len(table))
+            if code == len(table):
+                table.append(value)
+            codes.append(code)
+        return np.array(codes, dtype=np.int32), table
+
+    @classmethod
+    def concat(cls, parts: Sequence["ChunkColumns"]) -> "ChunkColumns":
+        texts = [part.text(i) for part in parts for i in range(len(part))]
+        return cls(texts, [part.metadata(i) for part in parts for i in range(len(part))])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            len(self.buffer) + self.offsets.nbytes
+            + sum(column.nbytes for column in self.numeric.values())
+            + sum(codes.nbytes + VALUE_OVERHEAD_BYTES * len(table) for codes, table in self.interned.values())
+            + sum(keys.nbytes + order.nbytes for keys, order in self.sorted.values())
+        )
+
+    def text(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def metadata(self, i: int) -> dict:
+        metadata = {}
+        for field in self.fields:
+            if field in self.numeric:
+                metadata[field] = self.numeric[field][i].item()
+            else:
+                codes, table = self.interned[field]
+                if codes[i] >= 0:
+                    metadata[field] = table[codes[i]]
+        return metadata
+
+    def values(self, field: str) -> list:
+        """Distinct values of the field, e.g. the uploaded sources for the filter options"""
+        if field in self.numeric:
+            return np.unique(self.numeric[field]).tolist()
+        if field in self.interned:
+            codes, table = self.interned[field]
+            return sorted((table[code] for code in np.unique(codes) if code >= 0), key=str)
+        return []
+
+    def _keys(self, field: str) -> Optional[np.ndarray]:
+        if field in self.numeric:
+            return self.numeric[field]
+        if field in self.interned:
+            return self.interned[field][0]
+        return None
+
+    def _uploaded_at(self) -> Optional[np.ndarray]:
+        if UPLOADED_AT in self.numeric:
+            return self.numeric[UPLOADED_AT].astype(np.float64)
+        if UPLOADED_AT in self.interned:
+            codes, table = self.interned[UPLOADED_AT]
+            # nan sorts last, chunks without upload time are never in a range
+            return np.array([np.nan if code < 0 else float(table[code]) for code in codes])
+        return None
+
+    def _equals_any(self, field: str, values: Sequence[Any]) -> np.ndarray:
+        """Sorted row positions where the field has one of the values"""
+        if field in self.numeric:
+            wanted = list({value for value in values if _is_number(value)})
+        elif field in self.codes:
+            wanted = list({self.codes[field][key] for key in map(_key, values) if key in self.codes[field]})
+        elif field in self.interned:
+            keys = {_key(value) for value in values}
+            wanted = [code for code, value in enumerate(self.interned[field][1]) if _key(value) in keys]
+        else:
+            return np.zeros(0, dtype=np.int32)
+        if field not in self.sorted:
+            return np.flatnonzero(np.isin(self._keys(field), wanted))
+        keys, order = self.sorted[field]
+        lo = np.searchsorted(keys, wanted, "left")
+        hi = np.searchsorted(keys, wanted, "right")
+        return np.sort(np.concatenate([order[start:stop] for start, stop in zip(lo, hi)] or [np.zeros(0, np.int32)]))
+
+    def _uploaded_between(self, after: Optional[float], before: Optional[float]) -> np.ndarray:
+        if UPLOADED_AT not in self.sorted:
+            return np.zeros(0, dtype=np.int32)
+        keys, order = self.sorted[UPLOADED_AT]
+        lo = 0 if after is None else np.searchsorted(keys, after, "left")
+        hi = np.searchsorted(keys, np.inf if before is None else before, "right")
+        return np.sort(order[lo:hi])
+
+    def rows_with(self, field: str, values: Sequence[Any]) -> np.ndarray:
+        """Sorted row positions where the field has one of the values, any field, not only the filterable ones"""
+        return self._equals_any(field, values)
+
+    def take(self, positions: Sequence[int]) -> "ChunkColumns":
+        return ChunkColumns([self.text(i) for i in positions], [self.metadata(i) for i in positions])
+
+    def matching(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        """Sorted row positions matching all filters, None when there is nothing to filter on"""
+        if not filters:
+            return None
+        matches = []
+        for field, value in filters.items():
+            if field in INDEXED_FIELDS:
+                matches.append(self._equals_any(field, value if isinstance(value, (list, tuple, set)) else [value]))
+            elif field not in ("uploaded_after", "uploaded_before"):
+                raise ValueError(f"Unsupported metadata filter {field}")
+        if "uploaded_after" in filters or "uploaded_before" in filters:
+            matches.append(self._uploaded_between(filters.get("uploaded_after"), filters.get("uploaded_before")))
+        # intersected starting from the fewest rows
+        matches.sort(key=len)
+        rows = matches[0]
+        for other in matches[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
@@ -1,16 +1,22 @@
+import io
 import logging
 import os
 import pathlib
 import tempfile
-from typing import Any, List, Union
+from typing import Any, Iterator, List, Union
 
 from langchain_community.document_loaders.epub import UnstructuredEPubLoader
 from langchain_community.document_loaders.pdf import PyPDFLoader
 from langchain_community.document_loaders.text import TextLoader
+from langchain_community.document_loaders.unstructured import UnstructuredFileIOLoader
 from langchain_community.document_loaders.word_document import UnstructuredWordDocumentLoader
+from langchain_core.document_loaders import BaseLoader
 from langchain_core.documents import Document
 from streamlit.logger import get_logger
 
+from epub import iter_epub_chapters
+from pdf_pages import iter_pdf_pages
+
 logging.basicConfig(encoding="utf-8", level=logging.INFO)
 LOGGER = get_logger(__name__)
 
@@ -18,19 +24,78 @@ class EpubReader(UnstructuredEPubLoader):
     def __init__(self, file_path: Union[str,List[str]], **unstructured_kwargs: Any):
         super().__init__(file_path, **unstructured_kwargs, mode="elements", strategy="fast")
 
+class EpubChapterLoader(BaseLoader):
+    """One document per chapter, streamed from the zip container (EpubReader makes one per paragraph or title)"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        yield from iter_epub_chapters(self.file_path, self.file_path)
+
 class DocumentLoaderException(Exception):
     pass
 
+# uploaded bytes, e.g. the memoryview of UploadedFile.getbuffer()
+Buffer = Union[bytes, memoryview]
+
+class BufferReader(io.RawIOBase):
+    """Seekable binary file over a buffer, reads it in place where io.BytesIO copies anything but bytes"""
+
+    def __init__(self, data: Buffer):
+        self.view = memoryview(data).cast("B")
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = max(0, min(len(buffer), len(self.view) - self.position))
+        buffer[:size] = self.view[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        start = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, start + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+def _parse_pdf(data: Buffer, filename: str) -> List[Document]:
+    # pypdf reads the buffer in place, same documents and metadata as PyPDFLoader, large PDFs in parallel
+    return [doc for docs in iter_pdf_pages(BufferReader(data), filename) for doc in docs]
+
+def _parse_text(data: Buffer, filename: str) -> List[Document]:
+    return [Document(page_content=str(data, "utf-8"), metadata={"source": filename})]
+
+def _parse_docx(data: Buffer, filename: str) -> List[Document]:
+    return UnstructuredFileIOLoader(BufferReader(data), metadata_filename=filename).load()
+
+def _parse_epub(data: Buffer, filename: str) -> List[Document]:
+    return list(iter_epub_chapters(BufferReader(data), filename))
+
 class DocumentLoader(object):
     """Loads in a document with a supported extention"""
 
     supported_extensions = {
         ".pdf": PyPDFLoader,
         ".txt": TextLoader,
-        ".epub": EpubReader,
+        ".epub": EpubChapterLoader,
         ".docx": UnstructuredWordDocumentLoader,
         ".doc": UnstructuredWordDocumentLoader,
     }
+    # parse uploads from memory, other supported extensions (.doc is converted by libreoffice) need a file
+    memory_parsers = {
+        ".pdf": _parse_pdf,
+        ".txt": _parse_text,
+        ".epub": _parse_epub,
+        ".docx": _parse_docx,
+    }
 
 def load_document(temp_filepath: str) -> list[Document]:
     ext = pathlib.Path(temp_filepath).suffix
@@ -42,3 +107,27 @@ def load_document(temp_filepath: str) -> list[Document]:
     docs = loaded.load()
     logging.info(docs)
     return docs
+
+def load_bytes(data: Buffer, filename: str) -> list[Document]:
+    """Loads an uploaded file from memory, only loaders that need a path get a temporary file"""
+    ext = pathlib.Path(filename).suffix
+    if ext not in DocumentLoader.supported_extensions:
+        raise DocumentLoaderException(f"Invalid extension type {ext}")
+    parser = DocumentLoader.memory_parsers.get(ext)
+    if parser:
+        docs = parser(data, filename)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_filepath = os.path.join(temp_dir, pathlib.Path(filename).name)
+            with open(temp_filepath, "wb") as f:
+                f.write(data)
+            docs = load_document(temp_filepath)
+    logging.info(f"loaded {len(docs)} documents from {filename}")
+    return docs
+
+def lazy_load_file(path: str, filename: str) -> Iterator[list[Document]]:
+    """Like load_bytes for a stored upload, PDFs are yielded in ranges of pages as they are parsed (see iter_pdf_pages)"""
+    if pathlib.Path(filename).suffix == ".pdf":
+        yield from iter_pdf_pages(pathlib.Path(path), filename)
+    else:
+        yield load_bytes(pathlib.Path(path).read_bytes(), filename)
@@ -0,0 +1,139 @@
+import codecs
+import html.parser
+import posixpath
+import re
+import urllib.parse
+import xml.etree.ElementTree as ET
+import zipfile
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+from langchain_core.documents import Document
+
+CONTAINER_NS = {"container": "urn:oasis:names:tc:opendocument:xmlns:container"}
+OPF_NS = {"opf": "http://www.idpf.org/2007/opf", "dc": "http://purl.org/dc/elements/1.1/"}
+
+# elements that start a new paragraph in the chapter text
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "blockquote", "pre", "li", "dt", "dd", "tr", "br",
+    "figcaption", "caption", "h1", "h2", "h3", "h4", "h5", "h6",
+}
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+# headings that start a new section, books often put several chapters into one spine item
+SECTION_HEADINGS = {"h1", "h2", "h3"}
+SKIPPED_TAGS = {"head", "script", "style"}
+XML_ENCODING = re.compile(rb"""^\s*<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z0-9._:-]+)["']""")
+
+
+class _ChapterParser(html.parser.HTMLParser):
+    """
+    Sections of one XHTML chapter, paragraphs and the first heading of each. An h1-h3 heading after
+    text starts a new section, consecutive headings (e.g. part and chapter title) start only one.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections: List[List[str]] = [[]]
+        self.titles: List[Optional[str]] = [None]
+        self._text: List[str] = []
+        self._skipping = 0
+        self._heading: Optional[List[str]] = None
+        self._in_heading = 0
+        # the current section has text besides its headings
+        self._body = False
+
+    def _flush(self) -> None:
+        paragraph = re.sub(r"\s+", " ", "".join(self._text)).strip()
+        if paragraph:
+            self.sections[-1].append(paragraph)
+            self._body = self._body or not self._in_heading
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skipping += 1
+        elif tag in BLOCK_TAGS:
+            self._flush()
+            if tag in SECTION_HEADINGS and self._body:
+                self.sections.append([])
+                self.titles.append(None)
+                self._body = False
+            if tag in HEADINGS:
+                self._in_heading += 1
+                if self.titles[-1] is None and self._heading is None:
+                    self._heading = []
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in BLOCK_TAGS:
+            if tag in HEADINGS and self._heading is not None:
+                self.titles[-1] = re.sub(r"\s+", " ", "".join(self._heading)).strip() or None
+                self._heading = None
+            self._flush()
+            if tag in HEADINGS:
+                self._in_heading = max(0, self._in_heading - 1)
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self._text.append(data)
+            if self._heading is not None:
+                self._heading.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _decode(data: bytes) -> str:
+    """Text of an XHTML document in the encoding of its BOM or XML declaration, UTF-8 by default"""
+    for bom, encoding in ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+        if data.startswith(bom):
+            return data.decode(encoding, errors="replace")
+    encoding = "utf-8"
+    if match := XML_ENCODING.match(data[:200]):
+        try:
+            encoding = codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            pass
+    # a broken chapter loses a few characters instead of failing the whole book
+    return data.decode(encoding, errors="replace")
+
+
+def _spine(book: zipfile.ZipFile) -> tuple[List[str], Optional[str]]:
+    """Paths of the XHTML documents in reading order and the book title"""
+    container = ET.fromstring(book.read("META-INF/container.xml"))
+    opf_path = container.find(".//container:rootfile", CONTAINER_NS).get("full-path")
+    opf = ET.fromstring(book.read(opf_path))
+    manifest = {item.get("id"): item for item in opf.iterfind("opf:manifest/opf:item", OPF_NS)}
+    base = posixpath.dirname(opf_path)
+    paths = []
+    for ref in opf.iterfind("opf:spine/opf:itemref", OPF_NS):
+        item = manifest.get(ref.get("idref"))
+        if item is not None and "html" in item.get("media-type", ""):
+            paths.append(posixpath.normpath(posixpath.join(base, urllib.parse.unquote(item.get("href")))))
+    title = opf.findtext("opf:metadata/dc:title", namespaces=OPF_NS)
+    return paths, title
+
+
+def iter_epub_chapters(file: Union[str, BinaryIO], source: str) -> Iterator[Document]:
+    """
+    One document per section of a chapter (spine item), split at h1-h3 headings, with paragraphs
+    separated by blank lines, read one chapter at a time from the zip container. Metadata has the
+    chapter position in the book, the section position in the chapter, the first heading of the
+    section as title and the book title. Sections without text, like cover images, are skipped.
+    """
+    with zipfile.ZipFile(file) as book:
+        paths, book_title = _spine(book)
+        for chapter, path in enumerate(paths):
+            parser = _ChapterParser()
+            with book.open(path) as f:
+                parser.feed(_decode(f.read()))
+            parser.close()
+            sections = [(paragraphs, title) for paragraphs, title in zip(parser.sections, parser.titles) if paragraphs]
+            for section, (paragraphs, title) in enumerate(sections):
+                metadata = {"source": source, "chapter": chapter, "section": section}
+                if title:
+                    metadata["title"] = title
+                if book_title:
+                    metadata["book_title"] = book_title
+                yield Document(page_content="\n\n".join(paragraphs), metadata=metadata)
@@ -0,0 +1,382 @@
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import json
+import logging
+import os
+import pathlib
+import re
+import shutil
+import threading
+import uuid
+from typing import Any, Iterator, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from chunks import ChunkColumns
+
+LOGGER = logging.getLogger(__name__)
+
+# with coarse search, this many candidates per result are re-scored with the full vectors
+RESCORE_FACTOR = 8
+# once an index has more segments, MERGE_FACTOR adjacent ones with the fewest rows are merged into one
+MAX_SEGMENTS = 8
+MERGE_FACTOR = 4
+
+# one background thread compacts the segments of all indexes
+_MERGER = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="segment-merger")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.ascontiguousarray(vectors / np.where(norms == 0, 1, norms), dtype=np.float32)
+
+
+class Segment:
+    """
+    Immutable batch of chunks, the unit of writes to an index. Vectors are one normalized float32 matrix,
+    ids an int64 array and texts and metadata are stored in columns (see ChunkColumns), rows are only
+    turned into python objects for search results. Never modified after it is created, so readers need no locks.
+
+    With coarse_dims (for Matryoshka embeddings like text-embedding-3-*, whose leading dimensions
+    are a usable embedding on their own) only the re-normalized leading dimensions are kept in memory
+    and searched, the full vectors are memory mapped from a file in directory and read only to
+    re-score the best RESCORE_FACTOR * k candidates.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        vectors: np.ndarray,
+        chunks: ChunkColumns,
+        coarse_dims: Optional[int] = None,
+        directory: Optional[pathlib.Path] = None,
+    ):
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.chunks = chunks
+        self.path: Optional[pathlib.Path] = None
+        self.coarse: Optional[np.ndarray] = None
+        if coarse_dims and directory is not None and vectors.shape[1] > coarse_dims:
+            self.coarse = _normalize(vectors[:, :coarse_dims])
+            directory.mkdir(parents=True, exist_ok=True)
+            self.path = directory / f"{uuid.uuid4()}.npy"
+            np.save(self.path, vectors)
+            self.vectors = np.load(self.path, mmap_mode="r")
+        else:
+            self.vectors = vectors
+        in_memory = self.coarse if self.coarse is not None else self.vectors
+        self.nbytes = in_memory.nbytes + self.ids.nbytes + chunks.nbytes
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def merge(cls, segments: Sequence["Segment"], **kwargs) -> "Segment":
+        return cls(
+            np.concatenate([segment.ids for segment in segments]),
+            np.concatenate([segment.vectors for segment in segments]),
+            ChunkColumns.concat([segment.chunks for segment in segments]),
+            **kwargs,
+        )
+
+    def search(self, queries: np.ndarray, k: int, filters: Optional[dict]) -> List[tuple[np.ndarray, np.ndarray]]:
+        """Scores and row positions of the top k rows matching the filters, for every row of the query matrix"""
+        positions = self.chunks.matching(filters)
+        rows = np.arange(len(self.ids)) if positions is None else positions
+        if self.coarse is None:
+            # one matrix product scores all queries of a batch
+            scores = (self.vectors if positions is None else self.vectors[rows]) @ queries.T
+            return [_top(scores[:, j], rows, k) for j in range(len(queries))]
+        coarse = self.coarse if positions is None else self.coarse[rows]
+        coarse_scores = coarse @ _normalize(queries[:, :self.coarse.shape[1]]).T
+        candidates = [_top(coarse_scores[:, j], rows, k * RESCORE_FACTOR)[1] for j in range(len(queries))]
+        # candidates of all queries are read once, sorted, so the memory mapped file is read front to back
+        union = np.unique(np.concatenate(candidates))
+        scores = self.vectors[union] @ queries.T
+        return [_top(scores[np.searchsorted(union, c), j], c, k) for j, c in enumerate(candidates)]
+
+    def row(self, i: int) -> dict:
+        return {"id": str(self.ids[i]), "vector": self.vectors[i], "text": self.chunks.text(i), "metadata": self.chunks.metadata(i)}
+
+    def release(self) -> None:
+        """Removes the file of the full vectors, mappings still held by running searches stay valid (POSIX)"""
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+
+def _top(scores: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    if len(rows) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+        return scores[top], rows[top]
+    return scores, rows
+
+
+class NamespaceIndex:
+    """
+    Chunks of one session or tenant, stored LSM style as a tuple of immutable segments.
+    Writers embed a batch, build a new segment and publish a new tuple with it appended,
+    readers search the tuple they saw when they started. A background merger compacts
+    small segments, so the number of segments a query visits stays bounded.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        max_segments: int = MAX_SEGMENTS,
+        coarse_dims: Optional[int] = None,
+        directory: Optional[pathlib.Path] = None,
+    ):
+        self.embedding = embedding
+        self.max_segments = max_segments
+        # two stage search over leading dimensions, full vectors memory mapped from directory (see Segment)
+        self.segment_options = {"coarse_dims": coarse_dims, "directory": directory}
+        self.segments: tuple[Segment, ...] = ()
+        self._write_lock = threading.Lock()
+        # eviction and persist may write the index to disk at the same time
+        self._dump_lock = threading.Lock()
+        self._merging = False
+        # chunk ids, unique within the index
+        self._ids = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(segment.nbytes for segment in self.segments)
+
+    def _publish(self, segment: Segment) -> None:
+        with self._write_lock:
+            self.segments = self.segments + (segment,)
+            if len(self.segments) > self.max_segments and not self._merging:
+                self._merging = True
+                _MERGER.submit(self._background_merge)
+
+    def add_documents(self, splits: List[Document]) -> List[str]:
+        # embedding and building the segment need no lock, only publishing it does
+        vectors = np.asarray(self.embedding.embed_documents([split.page_content for split in splits]), dtype=np.float32)
+        ids = np.fromiter(self._ids, dtype=np.int64, count=len(splits))
+        if len(ids):
+            chunks = ChunkColumns([split.page_content for split in splits], [split.metadata for split in splits])
+            self._publish(Segment(ids, vectors, chunks, **self.segment_options))
+        return [str(doc_id) for doc_id in ids]
+
+    def search(self, embedding: Sequence[float], k: int, filters: Optional[dict] = None) -> List[dict]:
+        """Top k rows ({"id", "vector", "text", "metadata"}) by cosine similarity, among rows matching the filters"""
+        return self.search_batch([embedding], k, filters)[0]
+
+    def search_batch(self, embeddings: Sequence[Sequence[float]], k: int, filters: Optional[dict] = None) -> List[List[dict]]:
+        """search for several query embeddings at once, every segment is scored with one matrix product"""
+        segments = self.segments
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+        hits = [(segment, segment.search(queries, k, filters)) for segment in segments]
+        results = []
+        for j in range(len(queries)):
+            scores = np.concatenate([h[1][j][0] for h in hits]) if hits else np.zeros(0)
+            owners = np.concatenate([np.full(len(h[1][j][0]), i) for i, h in enumerate(hits)]) if hits else np.zeros(0)
+            rows = np.concatenate([h[1][j][1] for h in hits]) if hits else np.zeros(0)
+            order = np.argsort(-scores, kind="stable")[:k]
+            results.append([hits[owners[i]][0].row(int(rows[i])) for i in order])
+        return results
+
+    def remove(self, field: str, values: Sequence[Any]) -> int:
+        """Removes the chunks whose metadata field has one of the values, returns how many were removed"""
+        removed = 0
+        with self._write_lock:
+            segments = []
+            for segment in self.segments:
+                positions = segment.chunks.rows_with(field, values)
+                if len(positions) == 0:
+                    segments.append(segment)
+                    continue
+                removed += len(positions)
+                keep = np.setdiff1d(np.arange(len(segment)), positions)
+                if len(keep):
+                    chunks = segment.chunks.take(keep)
+                    segments.append(Segment(segment.ids[keep], segment.vectors[keep], chunks, **self.segment_options))
+            dropped = [segment for segment in self.segments if segment not in segments]
+            self.segments = tuple(segments)
+        for segment in dropped:
+            segment.release()
+        return removed
+
+    def values(self, field: str) -> list:
+        """Distinct values of the metadata field over all segments"""
+        return sorted({value for segment in self.segments for value in segment.chunks.values(field)}, key=str)
+
+    def merge(self) -> None:
+        """Merges adjacent segments until there are at most max_segments of them"""
+        while len(self.segments) > self.max_segments:
+            snapshot = self.segments
+            sizes = [len(segment) for segment in snapshot]
+            factor = min(MERGE_FACTOR, len(snapshot))
+            start = min(range(len(snapshot) - factor + 1), key=lambda i: sum(sizes[i:i + factor]))
+            merged = Segment.merge(snapshot[start:start + factor], **self.segment_options)
+            with self._write_lock:
+                # writers only append and there is a single merger, only remove can replace the merged run
+                replaced = self.segments[start:start + factor] == snapshot[start:start + factor]
+                if replaced:
+                    self.segments = self.segments[:start] + (merged,) + self.segments[start + factor:]
+            # after a remove the merge is done again on the new segments
+            for segment in snapshot[start:start + factor] if replaced else (merged,):
+                segment.release()
+
+    def release(self) -> None:
+        for segment in self.segments:
+            segment.release()
+
+    def _background_merge(self) -> None:
+        try:
+            self.merge()
+        except Exception:
+            LOGGER.exception("merging index segments failed")
+            with self._write_lock:
+                self._merging = False
+            return
+        with self._write_lock:
+            # segments published while the last merge was running
+            self._merging = len(self.segments) > self.max_segments
+            if self._merging:
+                _MERGER.submit(self._background_merge)
+
+    def dump(self, path: pathlib.Path) -> None:
+        """Vectors are saved as one float32 matrix, texts and metadata as JSON lines in the same order"""
+        path.mkdir(parents=True, exist_ok=True)
+        with self._dump_lock:
+            segments = self.segments
+            vectors = np.concatenate([segment.vectors for segment in segments]) if segments else np.zeros((0, 0), np.float32)
+            # written next to the last dump and renamed, a crash while writing leaves the last dump intact
+            with open(path / "vectors.npy.tmp", "wb") as f:
+                np.save(f, vectors)
+            with open(path / "rows.jsonl.tmp", "w", encoding="utf-8") as f:
+                for segment in segments:
+                    for i in range(len(segment)):
+                        f.write(json.dumps({"text": segment.chunks.text(i), "metadata": segment.chunks.metadata(i)}) + "\n")
+            os.replace(path / "rows.jsonl.tmp", path / "rows.jsonl")
+            os.replace(path / "vectors.npy.tmp", path / "vectors.npy")
+
+    @classmethod
+    def load(cls, path: pathlib.Path, embedding: Embeddings, **kwargs) -> "NamespaceIndex":
+        index = cls(embedding, **kwargs)
+        vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        with open(path / "rows.jsonl", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        if rows:
+            # ids are renumbered, they only identify chunks within a running index
+            ids = np.fromiter(index._ids, dtype=np.int64, count=len(rows))
+            chunks = ChunkColumns([r["text"] for r in rows], [r["metadata"] for r in rows])
+            index.segments = (Segment(ids, vectors, chunks, **index.segment_options),)
+        return index
+
+
+def _safe_name(namespace: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", namespace)
+
+
+class IndexRegistry:
+    """
+    Namespaced indexes, one per session or tenant, loaded from disk on first use.
+    When the indexes in memory exceed the memory budget, least recently used ones that are not
+    in use are written to disk and dropped. Use `open(namespace)` to pin an index while reading or writing it.
+    """
+
+    def __init__(self, embedding: Embeddings, directory: str, memory_budget_mb: float, coarse_dims: Optional[int] = None):
+        self.embedding = embedding
+        self.directory = pathlib.Path(directory)
+        self.memory_budget = memory_budget_mb * 2**20
+        self.coarse_dims = coarse_dims
+        self._indexes: collections.OrderedDict[str, NamespaceIndex] = collections.OrderedDict()
+        self._pins: collections.Counter[str] = collections.Counter()
+        # namespaces being written to disk by evict
+        self._evicting: set[str] = set()
+        self._lock = threading.RLock()
+
+    def _path(self, namespace: str) -> pathlib.Path:
+        return self.directory / _safe_name(namespace)
+
+    def _get(self, namespace: str) -> NamespaceIndex:
+        index = self._indexes.get(namespace)
+        if index is None:
+            path = self._path(namespace)
+            options = {"coarse_dims": self.coarse_dims, "directory": path / "segments"}
+            # full vectors of segments from an earlier run, only the dumped vectors.npy is used
+            shutil.rmtree(path / "segments", ignore_errors=True)
+            if (path / "vectors.npy").exists():
+                LOGGER.info(f"loading index {namespace} from {path}")
+                index = NamespaceIndex.load(path, self.embedding, **options)
+            else:
+                index = NamespaceIndex(self.embedding, **options)
+            self._indexes[namespace] = index
+        self._indexes.move_to_end(namespace)
+        return index
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(index.nbytes for index in self._indexes.values())
+
+    def _victims(self) -> List[tuple[str, NamespaceIndex, tuple]]:
+        """Least recently used, unpinned indexes to write to disk, with the segments to write"""
+        victims = []
+        with self._lock:
+            usage = self.memory_usage()
+            for namespace, index in self._indexes.items():
+                if usage <= self.memory_budget:
+                    break
+                if self._pins[namespace] or namespace in self._evicting:
+                    continue
+                self._evicting.add(namespace)
+                victims.append((namespace, index, index.segments))
+                usage -= index.nbytes
+        return victims
+
+    def evict(self) -> List[str]:
+        """
+        Writes least recently used, unpinned indexes to disk until the memory budget is met.
+        Indexes are written without holding the registry lock, so queries of other namespaces go on,
+        and only dropped once written. An index opened or changed meanwhile stays in memory.
+        """
+        evicted = []
+        for namespace, index, segments in self._victims():
+            try:
+                index.dump(self._path(namespace))
+            finally:
+                with self._lock:
+                    self._evicting.discard(namespace)
+            with self._lock:
+                if self._pins[namespace] or index.segments is not segments or self._indexes.get(namespace) is not index:
+                    continue
+                del self._indexes[namespace]
+            index.release()
+            evicted.append(namespace)
+            LOGGER.info(f"evicted index {namespace} to disk")
+        return evicted
+
+    def persist(self, namespace: str) -> None:
+        """Writes the index of the namespace to disk now, e.g. before an upload is reported as indexed"""
+        with self.open(namespace) as index:
+            index.dump(self._path(namespace))
+
+    @contextlib.contextmanager
+    def open(self, namespace: str) -> Iterator[NamespaceIndex]:
+        with self._lock:
+            index = self._get(namespace)
+            self._pins[namespace] += 1
+        try:
+            yield index
+        finally:
+            with self._lock:
+                self._pins[namespace] -= 1
+            # the caller's reads and writes succeeded, a failed eviction keeps the index in memory
+            try:
+                self.evict()
+            except Exception:
+                LOGGER.exception("evicting indexes to disk failed")
+
+    def namespaces(self) -> List[str]:
+        """Namespaces in memory, most recently used last"""
+        with self._lock:
+            return list(self._indexes)
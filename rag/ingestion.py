@@ -0,0 +1,121 @@
+import dataclasses
+import logging
+import pathlib
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional, Union
+
+LOGGER = logging.getLogger(__name__)
+
+QUEUED = "queued"
+PARSING = "parsing"
+EMBEDDING = "embedding"
+INDEXED = "indexed"
+FAILED = "failed"
+FINISHED = (INDEXED, FAILED)
+
+
+@dataclasses.dataclass
+class Job:
+    id: str
+    namespace: str
+    filename: str
+    path: str
+    status: str
+    error: Optional[str]
+    created_at: float
+    updated_at: float
+
+
+# processes one job, reports progress with set_status(PARSING | EMBEDDING)
+JobHandler = Callable[[Job, Callable[[str], None]], None]
+
+
+class IngestionQueue:
+    """
+    Persistent queue of uploaded files waiting to be indexed, processed by background worker threads.
+    Jobs and their statuses are kept in SQLite and uploaded bytes on disk, so jobs that were
+    not finished when the process stopped are picked up again on the next start.
+    """
+
+    def __init__(self, directory: str, handler: JobHandler, workers: int = 1):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.handler = handler
+        self._db = sqlite3.connect(self.directory / "jobs.sqlite", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, namespace TEXT, filename TEXT, path TEXT, "
+            "status TEXT, error TEXT, created_at REAL, updated_at REAL)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._pending: queue.Queue[Optional[str]] = queue.Queue()
+        for job in self._query("SELECT * FROM jobs WHERE status NOT IN (?, ?) ORDER BY created_at", FINISHED):
+            self._set_status(job.id, QUEUED)
+            self._pending.put(job.id)
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _query(self, sql: str, params=()) -> List[Job]:
+        with self._lock:
+            return [Job(*row) for row in self._db.execute(sql, params).fetchall()]
+
+    def _set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?", (status, error, time.time(), job_id)
+            )
+            self._db.commit()
+
+    def submit(self, namespace: str, filename: str, data: Union[bytes, memoryview]) -> str:
+        """Stores the uploaded file and queues it, returns the job id"""
+        job_id = str(uuid.uuid4())
+        path = self.directory / job_id / pathlib.Path(filename).name
+        path.parent.mkdir(parents=True)
+        path.write_bytes(data)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, namespace, filename, str(path), QUEUED, None, now, now),
+            )
+            self._db.commit()
+        self._pending.put(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        jobs = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def jobs(self, namespace: str) -> List[Job]:
+        return self._query("SELECT * FROM jobs WHERE namespace = ? ORDER BY created_at", (namespace,))
+
+    def _work(self) -> None:
+        while (job_id := self._pending.get()) is not None:
+            job = self.get(job_id)
+            try:
+                self.handler(job, lambda status: self._set_status(job_id, status))
+                self._set_status(job_id, INDEXED)
+            except Exception as e:
+                LOGGER.exception(f"ingestion of {job.filename} failed")
+                self._set_status(job_id, FAILED, f"{type(e).__name__}: {e}")
+            finally:
+                self._pending.task_done()
+            # kept on disk while the job is unfinished, so it can be retried after a restart
+            shutil.rmtree(pathlib.Path(job.path).parent, ignore_errors=True)
+
+    def join(self) -> None:
+        """Waits until every queued job is processed"""
+        self._pending.join()
+
+    def close(self) -> None:
+        for _ in self._workers:
+            self._pending.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._db.close()
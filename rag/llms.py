@@ -1,21 +1,34 @@
-from langchain.embeddings import CacheBackedEmbeddings
-from langchain.storage import LocalFileStore
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+import functools
 
+# process wide rate limit schedulers of the workflows, the entry point puts them on the path (see streamlit.py)
+from rate_limit import openai_client_options
 
-chat_model = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0,
-    timeout=None,
-    max_retries=2,
-)
 
-store = LocalFileStore("./cache/")
-# This is a function to generate embeddings, given document
-underlying_embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small",
-)
-EMBEDDINGS = CacheBackedEmbeddings.from_bytes_store(
-    underlying_embeddings, store, namespace=underlying_embeddings.model
-)
+# clients are created on first use, importing this module does no work
+@functools.cache
+def get_chat_model():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0,
+        timeout=None,
+        # retried by the shared scheduler, once per request instead of once per client
+        **openai_client_options(),
+    )
 
+
+@functools.cache
+def get_embeddings():
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+    from langchain_openai import OpenAIEmbeddings
+
+    store = LocalFileStore("./cache/")
+    # This is a function to generate embeddings, given document
+    underlying_embeddings = OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        **openai_client_options(),
+    )
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying_embeddings, store, namespace=underlying_embeddings.model
+    )
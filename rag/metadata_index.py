@@ -0,0 +1,15 @@
+import pathlib
+
+# metadata fields chunks can be filtered on, filters on them match any of the given values (see ChunkColumns)
+INDEXED_FIELDS = ("source", "page", "extension")
+# upload time is filtered by range
+UPLOADED_AT = "uploaded_at"
+# ingestion job that indexed the chunk, the chunks of a job that is run again are removed first
+JOB_ID = "job_id"
+
+
+def with_default_metadata(metadata: dict) -> dict:
+    """Adds file extension derived from the source, so every chunk can be filtered by file type"""
+    if "extension" not in metadata and "source" in metadata:
+        return {**metadata, "extension": pathlib.Path(str(metadata["source"])).suffix.lower()}
+    return metadata
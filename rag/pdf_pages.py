@@ -0,0 +1,112 @@
+import atexit
+import concurrent.futures
+import contextlib
+import functools
+import multiprocessing
+import os
+import pathlib
+import shutil
+import tempfile
+import uuid
+from typing import BinaryIO, Iterator, List, Union
+
+from langchain_community.document_loaders.parsers.pdf import PyPDFParser
+from langchain_core.documents import Document
+from langchain_core.documents.base import Blob
+from pydantic import PrivateAttr
+
+# smaller PDFs are parsed in the calling process, starting the pool is not worth it
+PARALLEL_MIN_PAGES = 100
+PAGES_PER_RANGE = 50
+
+
+@functools.cache
+def get_pdf_pool() -> concurrent.futures.ProcessPoolExecutor:
+    # spawned, forking would copy the threads of the app; workers only import this module
+    pool = concurrent.futures.ProcessPoolExecutor(os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+    # workers are stopped when the app exits, ranges not started yet are dropped
+    atexit.register(pool.shutdown, cancel_futures=True)
+    return pool
+
+
+# (token, reader) of the PDF the worker parsed last, reading the page tree of a large PDF takes longer
+# than extracting a range, a worker that gets several ranges of the same PDF reads it once
+_reader = (None, None)
+
+
+def parse_page_range(token: str, path: str, metadata: dict, start: int, stop: int) -> List[Document]:
+    """Documents of pages [start, stop) as PyPDFParser creates them in page mode, runs in a pool worker"""
+    global _reader
+    import pypdf
+
+    if _reader[0] != token:
+        _reader = (token, pypdf.PdfReader(path))
+    reader = _reader[1]
+    labels = reader.page_labels
+    return [
+        Document(
+            page_content=reader.pages[page].extract_text(extraction_mode="plain").strip(),
+            metadata={**metadata, "page": page, "page_label": labels[page]},
+        )
+        for page in range(start, stop)
+    ]
+
+
+class _StreamBlob(Blob):
+    """Blob of an open binary file, Blob.from_data only takes bytes and a view of an upload would be copied"""
+    _stream: BinaryIO = PrivateAttr()
+
+    @contextlib.contextmanager
+    def as_bytes_io(self) -> Iterator[BinaryIO]:
+        self._stream.seek(0)
+        yield self._stream
+
+
+def iter_pdf_pages(source: Union[BinaryIO, pathlib.Path], filename: str) -> Iterator[List[Document]]:
+    """
+    Page documents of the PDF (binary file or path) in page order, one list per range of PAGES_PER_RANGE pages.
+    Large PDFs are extracted by a process pool, a range is yielded as soon as it and all ranges
+    before it are done, so the caller can split and embed them while later pages are parsed.
+    """
+    if isinstance(source, pathlib.Path):
+        blob = Blob.from_path(source, metadata={"source": filename})
+    else:
+        blob = _StreamBlob(path=filename)
+        blob._stream = source
+    pages = PyPDFParser().lazy_parse(blob)
+    # the first page also gives the document metadata every page carries
+    first = next(pages, None)
+    if first is None:
+        return
+    total = first.metadata["total_pages"]
+    if total < PARALLEL_MIN_PAGES:
+        yield [first, *pages]
+        return
+    pages.close()
+    metadata = {key: value for key, value in first.metadata.items() if key not in ("page", "page_label")}
+    if isinstance(source, pathlib.Path):
+        yield from _parse_ranges(first, str(source), metadata, total)
+        return
+    # workers read one temporary copy of the file, instead of getting the bytes pickled with every range
+    with tempfile.TemporaryDirectory() as directory:
+        path = pathlib.Path(directory) / "upload.pdf"
+        source.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(source, f)
+        yield from _parse_ranges(first, str(path), metadata, total)
+
+
+def _parse_ranges(first: Document, path: str, metadata: dict, total: int) -> Iterator[List[Document]]:
+    pool, token = get_pdf_pool(), str(uuid.uuid4())
+    futures = [
+        pool.submit(parse_page_range, token, path, metadata, start, min(start + PAGES_PER_RANGE, total))
+        for start in range(1, total, PAGES_PER_RANGE)
+    ]
+    try:
+        yield [first, *futures[0].result()]
+        for future in futures[1:]:
+            yield future.result()
+    finally:
+        # the caller stopped early or a range failed
+        for future in futures:
+            future.cancel()
@@ -1,8 +1,11 @@
+import functools
+
 from langchain_core.messages import AIMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
 
 from typing import List, Annotated
-from llms import chat_model
+from llms import get_chat_model
 from langchain_core.documents import Document
 from retriever import DocumentRetriever
 from typing_extensions import TypedDict
@@ -24,8 +27,6 @@ final_prompt = (
     "Always return the full revised document, even if not changes are needed."
 )
 
-
-retriever = DocumentRetriever()
 prompt = ChatPromptTemplate.from_messages(
     [
         ("system", system_prompt),
@@ -46,9 +47,15 @@ class State(TypedDict):
     answer: str
     messages: Annotated[list, add_messages]
 
-def retrieve(state: State):
-    # retrieve the most relevant documents from the vector store
-    retrieved_docs = retriever.invoke(state["messages"][-1].content)
+def retrieve(state: State, config: RunnableConfig):
+    # retrieve the most relevant documents from the index of the session (or tenant) namespace,
+    # optionally only from the chunks matching the metadata filters in the config
+    configurable = config.get("configurable", {})
+    retrieved_docs = get_retriever().invoke(
+        state["messages"][-1].content,
+        filters=configurable.get("filters"),
+        namespace=configurable.get("namespace"),
+    )
     print(retrieved_docs)
     return {"context": retrieved_docs}
 
@@ -59,7 +66,7 @@ def generate(state: State):
         "question": state["messages"][-1].content,
         "context": docs_content
     })
-    response = chat_model.invoke(messages)
+    response = get_chat_model().invoke(messages)
     print(response.content)
     return {
         "answer": response.content
@@ -70,24 +77,32 @@ def doc_finalizer(state: State):
     final_prompt_template = final_prompt.invoke({
         "answer": state["answer"]
     })
-    response = chat_model.invoke(final_prompt_template)
+    response = get_chat_model().invoke(final_prompt_template)
     print(f"doc_finalizer: {response}")
     return {
         "messages": [AIMessage(response.content)]
     }
 
-memory = MemorySaver()
-graph = (
-    StateGraph(State)
-    .add_sequence([
-        retrieve,
-        generate,
-        doc_finalizer
-    ])
-    .add_edge(START, "retrieve")
-    .add_edge(doc_finalizer, END)
-    .compile(checkpointer=memory)
-)
+@functools.cache
+def get_retriever() -> DocumentRetriever:
+    return DocumentRetriever()
+
+@functools.cache
+def get_graph():
+    # retriever, checkpointer and the compiled graph are built on first use, not on import
+    memory = MemorySaver()
+    return (
+        StateGraph(State)
+        .add_sequence([
+            retrieve,
+            generate,
+            doc_finalizer
+        ])
+        .add_edge(START, "retrieve")
+        .add_edge("doc_finalizer", END)
+        .compile(checkpointer=memory)
+    )
+
 config = {
     "configurable": {"thread_id": "abc123"}
 }
\ No newline at end of file
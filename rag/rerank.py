@@ -0,0 +1,113 @@
+import functools
+import re
+from typing import Callable, Iterable, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+# scores query, texts pairs in one batch, higher is more relevant
+Scorer = Callable[[str, Sequence[str]], Sequence[float]]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    spread = scores.max() - scores.min()
+    return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+
+def mmr(
+    query: Sequence[float],
+    matrix: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    relevance: Optional[Sequence[float]] = None,
+) -> list[int]:
+    """
+    Maximal marginal relevance over the candidate embedding matrix, returns row indices in selection order.
+    Relevance defaults to cosine similarity to the query, scores of a re-ranker can be passed instead.
+    Pairwise similarities are computed once as one matrix product, every selection step is a vector update.
+    """
+    if len(matrix) == 0:
+        return []
+    matrix = _normalize_rows(np.asarray(matrix, dtype=np.float32))
+    if relevance is None:
+        relevance = matrix @ _normalize_rows(np.asarray(query, dtype=np.float32))
+    else:
+        # re-ranker scores are on their own scale, bring them to [0, 1] like cosine similarities
+        relevance = _min_max(np.asarray(relevance, dtype=np.float32))
+    pairwise = matrix @ matrix.T
+    selected = [int(np.argmax(relevance))]
+    max_similarity = pairwise[selected[0]].copy()
+    for _ in range(min(k, len(matrix)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_similarity, pairwise[best], out=max_similarity)
+    return selected
+
+
+def _span(doc: Document) -> Optional[tuple]:
+    """(source, position, start, end) of the chunk in its document, None for chunks without start_index"""
+    start = doc.metadata.get("start_index")
+    if start is None:
+        return None
+    # page of a PDF, chapter and section of an EPUB
+    position = tuple(doc.metadata.get(key) for key in ("page", "chapter", "section"))
+    return doc.metadata.get("source"), position, start, start + len(doc.page_content)
+
+
+def _overlaps(a: Optional[tuple], b: Optional[tuple]) -> bool:
+    return a is not None and b is not None and a[:2] == b[:2] and a[2] <= b[3] and b[2] <= a[3]
+
+
+def _merge(a: Document, b: Document) -> Document:
+    """One passage covering both overlapping chunks, keeps id and metadata of a"""
+    first, second = (a, b) if _span(a)[2] <= _span(b)[2] else (b, a)
+    first_end, (_, _, second_start, second_end) = _span(first)[3], _span(second)
+    text = first.page_content + (second.page_content[first_end - second_start:] if second_end > first_end else "")
+    return Document(id=a.id, page_content=text, metadata={**a.metadata, "start_index": _span(first)[2]})
+
+
+def collapse_overlapping(docs: Iterable[Document], k: int) -> list[Document]:
+    """
+    Takes docs in ranking order until k distinct passages are collected (docs may be a generator,
+    the ones after are never created), chunks of the same
+    source and page (or EPUB section) whose character ranges overlap or touch are merged into one passage,
+    so the text shared by overlapping chunks is sent to the llm only once.
+    """
+    passages: list[Document] = []
+    for doc in docs:
+        i = next((i for i, passage in enumerate(passages) if _overlaps(_span(passage), _span(doc))), None)
+        if i is not None:
+            passages[i] = _merge(passages[i], doc)
+        elif len(passages) < k:
+            passages.append(doc)
+        else:
+            break
+    return passages
+
+
+def lexical_scorer(query: str, texts: Sequence[str]) -> list[float]:
+    """Dependency free scorer, fraction of the query terms present in the text"""
+    terms = set(re.findall(r"\w+", query.lower()))
+    if not terms:
+        return [0.0] * len(texts)
+    return [len(terms & set(re.findall(r"\w+", text.lower()))) / len(terms) for text in texts]
+
+
+@functools.cache
+def cross_encoder_scorer(model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 32) -> Scorer:
+    """Local cross-encoder re-ranker (needs sentence-transformers), scores all candidates in batches"""
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name)
+
+    def score(query: str, texts: Sequence[str]) -> list[float]:
+        return model.predict([(query, text) for text in texts], batch_size=batch_size).tolist()
+
+    return score
@@ -1,70 +1,174 @@
-import os
-import tempfile
-from typing import List, Any
+import functools
+import pathlib
+import time
+from typing import List, Any, Optional
+
+import numpy as np
 
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.vectorstores import InMemoryVectorStore
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from document_loader import load_document
-from llms import EMBEDDINGS
+from batching import QueryBatcher
+from document_loader import Buffer, lazy_load_file, load_bytes
+from llms import get_embeddings
+from index import IndexRegistry
+from ingestion import EMBEDDING, PARSING, IngestionQueue, Job
+from metadata_index import JOB_ID, with_default_metadata
+from rerank import Scorer, collapse_overlapping, mmr
+from rate_limit import BATCH, lane
+
+
+# indexes of sessions not used recently are written here when the memory budget is exceeded
+INDEX_DIR = "./cache/indexes/"
+INDEX_MEMORY_BUDGET_MB = 512
+# text-embedding-3-small is a Matryoshka embedding, its first 256 of 1536 dimensions are searched in memory
+# and the best candidates re-scored with the full vectors from disk (None searches full vectors in memory)
+COARSE_DIMS = 256
+DEFAULT_NAMESPACE = "default"
+# uploaded files waiting for indexing and the job table
+INGESTION_DIR = "./cache/uploads/"
+INGESTION_WORKERS = 2
+# queries of concurrent sessions arriving within the window are embedded and scored together
+QUERY_BATCH_WINDOW_MS = 5
+QUERY_BATCH_SIZE = 32
+
+@functools.cache
+def get_index_registry() -> IndexRegistry:
+    # created on first use, so importing the retriever does not build the embeddings client
+    return IndexRegistry(get_embeddings(), INDEX_DIR, INDEX_MEMORY_BUDGET_MB, coarse_dims=COARSE_DIMS)
+
+def _ingest_job(job: Job, set_status) -> None:
+    set_status(PARSING)
+    registry = get_index_registry()
+    # a job picked up again after a restart may have indexed some of its chunks before
+    with registry.open(job.namespace) as index:
+        index.remove(JOB_ID, [job.id])
+    uploaded_at = time.time()
+    # large PDFs come in page ranges, earlier ranges are split and embedded while later ones are parsed
+    for docs in lazy_load_file(job.path, job.filename):
+        set_status(EMBEDDING)
+        for doc in _with_upload_metadata(docs, job.filename, uploaded_at):
+            doc.metadata[JOB_ID] = job.id
+        # embedding uploads is batch work, queries of the chat go first
+        with lane(BATCH):
+            DocumentRetriever.store_documents(docs, job.namespace)
+    # indexes are otherwise only written to disk when evicted, the job is marked indexed after this
+    registry.persist(job.namespace)
 
-VECTOR_STORE = InMemoryVectorStore(embedding=EMBEDDINGS)
+@functools.cache
+def get_ingestion_queue() -> IngestionQueue:
+    # uploads are indexed in the background, queries keep using the chunks indexed so far
+    return IngestionQueue(INGESTION_DIR, _ingest_job, workers=INGESTION_WORKERS)
+
+@functools.cache
+def get_query_batcher() -> QueryBatcher:
+    return QueryBatcher(QUERY_BATCH_WINDOW_MS, QUERY_BATCH_SIZE)
 
 def split_documents(docs: List[Document]) -> List[Document]:
     # Split documents into chunks using RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1500, chunk_overlap=200
+        chunk_size=1500, chunk_overlap=200, add_start_index=True
     )
     return text_splitter.split_documents(docs)
 
+def _with_upload_metadata(docs: List[Document], filename: str, uploaded_at: Optional[float] = None) -> List[Document]:
+    uploaded_at = uploaded_at or time.time()
+    for doc in docs:
+        # loaders set the temporary path as source, filters use the uploaded file name
+        doc.metadata.update(
+            source=filename,
+            extension=pathlib.Path(filename).suffix.lower(),
+            uploaded_at=uploaded_at,
+        )
+    return docs
+
+def load_uploaded_bytes(data: Buffer, filename: str) -> List[Document]:
+    # parsed from memory, no copy of the upload is written to disk and read back
+    return _with_upload_metadata(load_bytes(data, filename), filename)
+
 class DocumentRetriever(BaseRetriever):
     documents: List[Document] = []
+    # index searched and extended by this retriever, unless another namespace is passed to invoke
+    namespace: str = DEFAULT_NAMESPACE
     k: int = 5
+    # candidates taken from the vector search for the diversity and re-ranking stage
+    fetch_k: int = 20
+    # pick the k results from the candidates with maximal marginal relevance (1.0 = relevance only)
+    use_mmr: bool = True
+    lambda_mult: float = 0.5
+    # optional local scorer, e.g. rerank.cross_encoder_scorer(), replaces cosine relevance of the candidates
+    reranker: Optional[Scorer] = None
+    # embed and score the query together with the queries of other sessions (see QueryBatcher)
+    batch_queries: bool = True
 
     def model_post_init(self, ctx: Any) -> None:
-        self.store_documents(self.documents)
+        if self.documents:
+            self.store_documents(self.documents, self.namespace)
+            # the index keeps the chunks, holding the raw documents as well would keep every text twice
+            self.documents = []
 
     @staticmethod
-    def store_documents(docs: List[Document]) -> None:
+    def store_documents(docs: List[Document], namespace: str = DEFAULT_NAMESPACE) -> None:
         splits = split_documents(docs)
-        VECTOR_STORE.add_documents(splits)
+        for split in splits:
+            split.metadata = with_default_metadata(split.metadata)
+        with get_index_registry().open(namespace) as index:
+            index.add_documents(splits)
 
-    def add_uploaded_docs(self, uploaded_files):
-        # Add list of uploaded files to the vector store
+    def add_uploaded_docs(self, uploaded_files, namespace: Optional[str] = None):
+        # Add list of uploaded files to the vector store, in the caller's thread.
+        # The app indexes uploads with get_ingestion_queue().submit instead, see _ingest_job
         docs = []
-        try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                for file in uploaded_files:
-                    try:
-                        temp_filepath = os.path.join(temp_dir, file.name)
-                        with open(temp_filepath, "wb") as f:
-                            f.write(file.getvalue())
-                        loaded_docs = load_document(temp_filepath)
-                        docs.extend(loaded_docs)
-                    except (IOError, OSError) as e:
-                        print(f"Error processing file {file.name}: {e}")
-                        continue
-                    except Exception as e:
-                        print(f"Error loading document {file.name}: {e}")
-                        continue
-                
-                if docs:
-                    self.documents.extend(docs)
-                    self.store_documents(docs)
-        except Exception as e:
-            print(f"Error creating temporary directory: {e}")
+        for file in uploaded_files:
+            try:
+                # getbuffer is a view of the uploaded bytes, getvalue would copy them
+                docs.extend(load_uploaded_bytes(file.getbuffer(), file.name))
+            except (IOError, OSError) as e:
+                print(f"Error processing file {file.name}: {e}")
+                continue
+            except Exception as e:
+                print(f"Error loading document {file.name}: {e}")
+                continue
+
+        if docs:
+            self.store_documents(docs, namespace or self.namespace)
 
     def _get_relevant_documents(
-        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+        filters: Optional[dict] = None, namespace: Optional[str] = None
     ) -> list[Document]:
         """
-        using default similarity search, find top k most relevant documents.
+        using similarity search, find fetch_k candidates and select the k most relevant,
+        diverse passages of them (see _select). Only the index of the namespace is searched.
+        With metadata filters (see ChunkColumns), only the chunks matching them are scored,
+        e.g. retriever.invoke(query, filters={"source": ["report.pdf"]}, namespace=session_id).
         """
-        if len(self.documents) == 0:
-            return []
-        return VECTOR_STORE.similarity_search(query=query, k=self.k)
-
+        with get_index_registry().open(namespace or self.namespace) as index:
+            if len(index) == 0:
+                return []
+            k = self.fetch_k if self.use_mmr or self.reranker else self.k
+            if self.batch_queries:
+                embedding, rows = get_query_batcher().search(index, query, k, filters)
+            else:
+                embedding = index.embedding.embed_query(query)
+                rows = index.search(embedding, k, filters)
+        return self._select(query, embedding, rows)
 
+    def _select(self, query: str, embedding: List[float], rows: List[dict]) -> List[Document]:
+        """Diverse top k of the candidate rows, overlapping chunks of the same page are merged into one passage"""
+        relevance = self.reranker(query, [row["text"] for row in rows]) if self.reranker and rows else None
+        if self.use_mmr:
+            # rank all candidates, collapsing overlaps frees slots that are filled by the next ones
+            order = mmr(embedding, np.array([row["vector"] for row in rows]), len(rows), self.lambda_mult, relevance)
+        elif relevance is not None:
+            order = list(np.argsort(-np.asarray(relevance), kind="stable"))
+        else:
+            order = range(len(rows))
+        # Documents are only created for the candidates collapse_overlapping takes
+        docs = (
+            Document(id=rows[i]["id"], page_content=rows[i]["text"], metadata=rows[i]["metadata"])
+            for i in order
+        )
+        return collapse_overlapping(docs, self.k)
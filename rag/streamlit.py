@@ -1,8 +1,17 @@
+import datetime
+import os
+import sys
+import uuid
+
 import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage
 
-from document_loader import DocumentLoader
-from rag import graph, config, retriever 
+# the rag modules share the rate limit schedulers and instrumentation of the workflows
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workflows"))
+from document_loader import DocumentLoader  # noqa: E402
+from instrumentation import instrumented  # noqa: E402
+from rag import get_graph, config  # noqa: E402
+from retriever import get_index_registry, get_ingestion_queue  # noqa: E402
 
 st.set_page_config(
     page_title="RAG Agent",
@@ -16,23 +25,46 @@ if "chat_history" not in st.session_state:
 if "uploaded_files" not in st.session_state:
     st.session_state.uploaded_files = []
 
+# every browser session gets its own conversation thread and document index
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+session_id = st.session_state.session_id
+
 for message in st.session_state.chat_history:
     print(f"Message: {message}")
     with st.chat_message("role"):
         st.markdown(message)
 
-if st.session_state.uploaded_files:
-    try:
-        docs = retriever.add_uploaded_docs(st.session_state.uploaded_files)
-    except Exception as e:
-        st.error(f"Error processing uploaded files: {e}")
-        docs = None
+def search_filters() -> dict:
+    # restrict retrieval to the selected files, file types and upload dates
+    with get_index_registry().open(session_id) as index:
+        source_options = index.values("source")
+        extension_options = index.values("extension")
+    st.sidebar.subheader("Search Filters")
+    filters = {}
+    sources = st.sidebar.multiselect("Files", source_options)
+    if sources:
+        filters["source"] = sources
+    extensions = st.sidebar.multiselect("File types", extension_options)
+    if extensions:
+        filters["extension"] = extensions
+    dates = st.sidebar.date_input("Uploaded between", value=())
+    if len(dates) == 2:
+        start, end = dates
+        filters["uploaded_after"] = datetime.datetime.combine(start, datetime.time.min).timestamp()
+        filters["uploaded_before"] = datetime.datetime.combine(end, datetime.time.max).timestamp()
+    return filters
+
+filters = search_filters()
 
 def process_message(message: str):
     try:
-        response = graph.invoke({
+        response = get_graph().invoke({
             "messages": HumanMessage(message),
-        }, config=config)
+        }, config=instrumented({
+            **config,
+            "configurable": {"thread_id": session_id, "namespace": session_id, "filters": filters},
+        }))
         return response["messages"][-1].content
     except Exception as e:
         st.error(f"Error processing message: {e}")
@@ -79,7 +111,20 @@ with col2:
                 if hasattr(file, 'name') and hasattr(file, 'getvalue'):
                     if file.name not in [f.name for f in st.session_state.uploaded_files if hasattr(f, 'name')]:
                         st.session_state.uploaded_files.append(file)
+                        # indexed by a background worker, the chat keeps working meanwhile
+                        get_ingestion_queue().submit(session_id, file.name, file.getbuffer())
                 else:
                     st.warning(f"Invalid file format: {file}")
             except Exception as e:
                 st.error(f"Error validating file {getattr(file, 'name', 'unknown')}: {e}")
+
+    @st.fragment(run_every=2)
+    def ingestion_status():
+        # polled every 2 seconds, reruns only this fragment
+        for job in get_ingestion_queue().jobs(session_id):
+            if job.error:
+                st.error(f"{job.filename}: {job.status} ({job.error})")
+            else:
+                st.write(f"{job.filename}: {job.status}")
+
+    ingestion_status()
@@ -0,0 +1,98 @@
+import concurrent.futures
+import time
+import unittest
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from batching import QueryBatcher
+from index import NamespaceIndex
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: int = 0
+    fail: bool = False
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("embeddings unavailable")
+        return super().embed_documents(texts)
+
+
+class DocumentCachingEmbedding(Embeddings):
+    """Like CacheBackedEmbeddings without query cache, documents are cached and queries go to the model"""
+
+    def __init__(self, underlying_embeddings):
+        self.underlying_embeddings = underlying_embeddings
+        self.cached = []
+
+    def embed_documents(self, texts):
+        self.cached.extend(texts)
+        return self.underlying_embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.underlying_embeddings.embed_query(text)
+
+
+class TestQueryBatcher(unittest.TestCase):
+    """Test micro-batching of concurrent queries"""
+
+    def setUp(self):
+        self.embedding = CountingEmbedding(size=16)
+        self.index = NamespaceIndex(self.embedding)
+        self.index.add_documents([
+            Document(page_content=f"chunk {i}", metadata={"source": f"{i % 3}.pdf"}) for i in range(30)
+        ])
+        self.embedding.calls = 0
+        self.batcher = QueryBatcher(window_ms=50, max_batch=16)
+
+    def tearDown(self):
+        self.batcher.close()
+
+    def search_concurrently(self, requests):
+        with concurrent.futures.ThreadPoolExecutor(len(requests)) as pool:
+            return list(pool.map(lambda r: self.batcher.search(self.index, *r), requests))
+
+    def test_batched_results_match_single_searches(self):
+        requests = [(f"chunk {i}", 1 + i % 4, {"source": "1.pdf"} if i % 2 else None) for i in range(12)]
+        results = self.search_concurrently(requests)
+        self.assertLess(self.embedding.calls, len(requests))
+        for (query, k, filters), (embedding, rows) in zip(requests, results):
+            self.assertEqual(embedding, self.embedding.embed_query(query))
+            expected = self.index.search(embedding, k, filters)
+            self.assertEqual([row["id"] for row in rows], [row["id"] for row in expected])
+
+    def test_queries_bypass_document_cache(self):
+        embedding = DocumentCachingEmbedding(self.embedding)
+        index = NamespaceIndex(embedding)
+        index.add_documents([Document(page_content=f"chunk {i}") for i in range(10)])
+        queries = [f"chunk {i}" for i in range(8)]
+        with concurrent.futures.ThreadPoolExecutor(len(queries)) as pool:
+            results = list(pool.map(lambda query: self.batcher.search(index, query, 3), queries))
+        self.assertEqual(embedding.cached, [f"chunk {i}" for i in range(10)])
+        # same embeddings and rows as the unbatched path of the retriever
+        for query, (vector, rows) in zip(queries, results):
+            self.assertEqual(vector, embedding.embed_query(query))
+            expected = index.search(embedding.embed_query(query), 3)
+            self.assertEqual([row["id"] for row in rows], [row["id"] for row in expected])
+
+    def test_batch_size_limit(self):
+        self.search_concurrently([(f"chunk {i}", 1, None) for i in range(40)])
+        self.assertGreaterEqual(self.embedding.calls, 3)
+
+    def test_lone_caller_is_not_delayed(self):
+        start = time.perf_counter()
+        for i in range(5):
+            self.batcher.search(self.index, f"chunk {i}", 1)
+        # the window is 50 ms
+        self.assertLess(time.perf_counter() - start, 0.2)
+
+    def test_errors_reach_every_caller(self):
+        self.embedding.fail = True
+        with self.assertRaises(RuntimeError):
+            self.batcher.search(self.index, "chunk 1", 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
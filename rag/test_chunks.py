@@ -0,0 +1,94 @@
+import random
+import unittest
+
+from chunks import ChunkColumns
+from metadata_index import with_default_metadata
+
+
+class TestChunkColumns(unittest.TestCase):
+    """Test columnar chunk storage and metadata filters"""
+
+    def setUp(self):
+        self.chunks = ChunkColumns(
+            ["a page one", "a page two", "b text ü", "c page one"],
+            [
+                with_default_metadata({"source": "a.pdf", "page": 1, "uploaded_at": 100.0}),
+                with_default_metadata({"source": "a.pdf", "page": 2, "uploaded_at": 100.0}),
+                with_default_metadata({"source": "b.txt", "uploaded_at": 200.0, "languages": ["eng"]}),
+                with_default_metadata({"source": "c.PDF", "page": 1, "uploaded_at": 300.0}),
+            ],
+        )
+
+    def rows(self, filters):
+        return self.chunks.matching(filters).tolist()
+
+    def test_materialize_rows(self):
+        self.assertEqual(self.chunks.text(2), "b text ü")
+        self.assertEqual(
+            self.chunks.metadata(2),
+            {"source": "b.txt", "uploaded_at": 200.0, "extension": ".txt", "languages": ["eng"]},
+        )
+        self.assertEqual(self.chunks.metadata(0), {"source": "a.pdf", "page": 1, "uploaded_at": 100.0, "extension": ".pdf"})
+        self.assertIsInstance(self.chunks.metadata(0)["page"], int)
+
+    def test_concat(self):
+        merged = ChunkColumns.concat([self.chunks, ChunkColumns(["d"], [{"source": "d.txt", "page": 4}])])
+        self.assertEqual(len(merged), 5)
+        self.assertEqual(merged.text(4), "d")
+        self.assertEqual(merged.metadata(4), {"source": "d.txt", "page": 4})
+        self.assertEqual(merged.metadata(1), self.chunks.metadata(1))
+
+    def test_no_filters(self):
+        self.assertIsNone(self.chunks.matching(None))
+        self.assertIsNone(self.chunks.matching({}))
+
+    def test_field_values(self):
+        self.assertEqual(self.rows({"source": "a.pdf"}), [0, 1])
+        self.assertEqual(self.rows({"source": ["a.pdf", "b.txt"]}), [0, 1, 2])
+        self.assertEqual(self.rows({"extension": ".pdf"}), [0, 1, 3])
+        self.assertEqual(self.chunks.values("extension"), [".pdf", ".txt"])
+
+    def test_intersection(self):
+        self.assertEqual(self.rows({"extension": ".pdf", "page": 1}), [0, 3])
+        self.assertEqual(self.rows({"source": "b.txt", "page": 1}), [])
+
+    def test_upload_time_range(self):
+        self.assertEqual(self.rows({"uploaded_after": 150.0}), [2, 3])
+        self.assertEqual(self.rows({"uploaded_after": 100.0, "uploaded_before": 200.0}), [0, 1, 2])
+        self.assertEqual(self.rows({"uploaded_before": 99.0}), [])
+
+    def test_missing_upload_time_never_matches(self):
+        chunks = ChunkColumns(["a", "b", "c"], [{"uploaded_at": 300.0}, {"source": "b.txt"}, {"uploaded_at": 100}])
+        self.assertEqual(chunks.matching({"uploaded_after": 0.0}).tolist(), [0, 2])
+        self.assertEqual(chunks.matching({"uploaded_before": 200.0}).tolist(), [2])
+
+    def test_index_matches_scan(self):
+        rng = random.Random(0)
+        metadatas = [
+            {"source": f"{rng.randrange(20)}.pdf", "page": rng.randrange(30), "uploaded_at": float(rng.randrange(50))}
+            for _ in range(2000)
+        ]
+        chunks = ChunkColumns(["chunk"] * len(metadatas), metadatas)
+        for _ in range(50):
+            sources = [f"{rng.randrange(20)}.pdf" for _ in range(3)]
+            pages = [rng.randrange(30) for _ in range(5)]
+            after = float(rng.randrange(50))
+            expected = [
+                i for i, metadata in enumerate(metadatas)
+                if metadata["source"] in sources and metadata["page"] in pages and metadata["uploaded_at"] >= after
+            ]
+            filters = {"source": sources, "page": pages, "uploaded_after": after}
+            self.assertEqual(chunks.matching(filters).tolist(), expected)
+
+    def test_rows_with_any_field(self):
+        chunks = ChunkColumns(["a", "b", "c"], [{"job_id": "1"}, {"job_id": "2"}, {"job_id": "1"}])
+        self.assertEqual(chunks.rows_with("job_id", ["1"]).tolist(), [0, 2])
+        self.assertEqual(chunks.take([1]).metadata(0), {"job_id": "2"})
+
+    def test_unsupported_filter(self):
+        with self.assertRaises(ValueError):
+            self.chunks.matching({"author": "me"})
+
+
+if __name__ == "__main__":
+    unittest.main()
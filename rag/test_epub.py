@@ -0,0 +1,68 @@
+import io
+import pathlib
+import sys
+import unittest
+import zipfile
+
+from epub import iter_epub_chapters
+
+# synthetic_epub of the benchmark fakes
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+from fakes import synthetic_epub  # noqa: E402
+
+
+class TestEpubChapters(unittest.TestCase):
+    """Test chapter documents streamed from the EPUB zip"""
+
+    def test_chapters_in_reading_order(self):
+        docs = list(iter_epub_chapters(io.BytesIO(synthetic_epub(3, paragraphs_per_chapter=4)), "book.epub"))
+        # the cover has no text
+        self.assertEqual([doc.metadata["chapter"] for doc in docs], [1, 2, 3])
+        self.assertEqual(
+            docs[0].metadata,
+            {"source": "book.epub", "chapter": 1, "section": 0, "title": "Chapter 1", "book_title": "Synthetic book"},
+        )
+        paragraphs = docs[1].page_content.split("\n\n")
+        self.assertEqual(paragraphs[0], "Chapter 2")
+        self.assertEqual(len(paragraphs), 5)
+        # head (title, style) is not part of the text
+        self.assertNotIn("margin", docs[1].page_content)
+
+    def _with_cover(self, cover: bytes) -> list:
+        book = synthetic_epub(0)
+        # replace the cover page with the given chapter
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(book)) as source, zipfile.ZipFile(buffer, "w") as target:
+            for item in source.infolist():
+                data = source.read(item)
+                if item.filename.endswith("cover.xhtml"):
+                    data = cover
+                target.writestr(item, data)
+        return list(iter_epub_chapters(io.BytesIO(buffer.getvalue()), "book.epub"))
+
+    def test_inline_markup_and_entities(self):
+        docs = self._with_cover(
+            b"<html><body><h2>A &amp; B</h2><p>one <em>two</em>\n three</p><ul><li>x</li><li>y</li></ul></body></html>"
+        )
+        self.assertEqual(docs[0].page_content, "A & B\n\none two three\n\nx\n\ny")
+        self.assertEqual(docs[0].metadata["title"], "A & B")
+
+    def test_sections_at_headings(self):
+        docs = self._with_cover(
+            b"<html><body><p>intro</p><h1>Part I</h1><h2>One</h2><p>a</p><h4>Aside</h4><p>b</p>"
+            b"<h2>Two</h2><p>c</p></body></html>"
+        )
+        self.assertEqual([doc.page_content for doc in docs], ["intro", "Part I\n\nOne\n\na\n\nAside\n\nb", "Two\n\nc"])
+        self.assertEqual([doc.metadata.get("title") for doc in docs], [None, "Part I", "Two"])
+        self.assertEqual([doc.metadata["section"] for doc in docs], [0, 1, 2])
+
+    def test_declared_and_invalid_encodings(self):
+        latin1 = '<?xml version="1.0" encoding="ISO-8859-1"?><html><body><p>caf\u00e9</p></body></html>'
+        self.assertEqual(self._with_cover(latin1.encode("latin-1"))[0].page_content, "caf\u00e9")
+        # undeclared non UTF-8 bytes are replaced, the chapter is still loaded
+        docs = self._with_cover(b"<html><body><p>caf\xe9</p></body></html>")
+        self.assertEqual(docs[0].page_content, "caf\ufffd")
+
+
+if __name__ == "__main__":
+    unittest.main()
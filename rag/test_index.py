@@ -0,0 +1,210 @@
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from index import IndexRegistry, NamespaceIndex
+
+
+def _docs(n: int, source: str) -> list[Document]:
+    return [Document(page_content=f"{source} chunk {i}", metadata={"source": source}) for i in range(n)]
+
+
+class TestNamespaceIndex(unittest.TestCase):
+    """Test segmented index with background merges"""
+
+    def test_search_over_segments(self):
+        index = NamespaceIndex(DeterministicFakeEmbedding(size=16), max_segments=100)
+        for i in range(5):
+            index.add_documents(_docs(3, f"{i}.pdf"))
+        self.assertEqual(len(index.segments), 5)
+        query = index.embedding.embed_query("3.pdf chunk 1")
+        # identical text gets identical fake embedding
+        self.assertEqual(index.search(query, k=1)[0]["text"], "3.pdf chunk 1")
+        self.assertEqual(len(index.search(query, k=20)), 15)
+        self.assertEqual({row["metadata"]["source"] for row in index.search(query, k=20, filters={"source": "2.pdf"})}, {"2.pdf"})
+
+    def test_remove(self):
+        index = NamespaceIndex(DeterministicFakeEmbedding(size=16), max_segments=100)
+        for i in range(3):
+            index.add_documents(_docs(2, "a.pdf") + _docs(2, f"{i}.pdf"))
+        self.assertEqual(index.remove("source", ["a.pdf"]), 6)
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.values("source"), ["0.pdf", "1.pdf", "2.pdf"])
+        self.assertEqual(index.remove("source", ["0.pdf", "1.pdf", "2.pdf"]), 6)
+        self.assertEqual(index.segments, ())
+
+    def test_merges_in_background(self):
+        index = NamespaceIndex(DeterministicFakeEmbedding(size=16), max_segments=4)
+        for i in range(20):
+            index.add_documents(_docs(2, f"{i}.pdf"))
+        deadline = time.monotonic() + 5
+        while len(index.segments) > 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertLessEqual(len(index.segments), 4)
+        self.assertEqual(len(index), 40)
+        self.assertEqual(len(index.search([1.0] * 16, k=100)), 40)
+
+    def test_readers_see_every_published_row(self):
+        index = NamespaceIndex(DeterministicFakeEmbedding(size=16), max_segments=2)
+        stop = threading.Event()
+        errors = []
+
+        def read():
+            while not stop.is_set():
+                published = len(index)
+                found = len(index.search([1.0] * 16, k=10_000))
+                if found < published:
+                    errors.append((published, found))
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for i in range(50):
+            index.add_documents(_docs(4, f"{i}.pdf"))
+        stop.set()
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(index.search([1.0] * 16, k=10_000)), 200)
+
+    def test_coarse_search_rescores_full_vectors_from_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index = NamespaceIndex(DeterministicFakeEmbedding(size=64), max_segments=100, coarse_dims=16, directory=pathlib.Path(directory))
+            for i in range(3):
+                index.add_documents(_docs(10, f"{i}.pdf"))
+            self.assertEqual(index.segments[0].coarse.shape, (10, 16))
+            self.assertEqual(len(list(pathlib.Path(directory).glob("*.npy"))), 3)
+            query = index.embedding.embed_query("1.pdf chunk 7")
+            rows = index.search(query, k=3)
+            self.assertEqual(rows[0]["text"], "1.pdf chunk 7")
+            self.assertEqual(len(rows[0]["vector"]), 64)
+            index.max_segments = 1
+            index.merge()
+            # replaced segments delete their vector files
+            self.assertEqual(len(list(pathlib.Path(directory).glob("*.npy"))), 1)
+            self.assertEqual(index.search(query, k=3)[0]["text"], "1.pdf chunk 7")
+            index.release()
+            self.assertEqual(list(pathlib.Path(directory).glob("*.npy")), [])
+
+
+class TestIndexRegistry(unittest.TestCase):
+    """Test namespaced indexes with eviction to disk"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.embedding = DeterministicFakeEmbedding(size=16)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def registry(self, memory_budget_mb: float = 100) -> IndexRegistry:
+        return IndexRegistry(self.embedding, self.directory.name, memory_budget_mb)
+
+    def test_namespaces_are_isolated(self):
+        registry = self.registry()
+        with registry.open("alice") as index:
+            index.add_documents(_docs(3, "alice.pdf"))
+        with registry.open("bob") as index:
+            self.assertEqual(len(index), 0)
+        with registry.open("alice") as index:
+            self.assertEqual(index.values("source"), ["alice.pdf"])
+
+    def test_lru_eviction_and_reload(self):
+        registry = self.registry()
+        with registry.open("alice") as index:
+            index.add_documents(_docs(2, "alice.pdf"))
+        # budget fits one of the indexes
+        registry.memory_budget = registry.memory_usage() * 1.5
+        with registry.open("bob") as index:
+            index.add_documents(_docs(2, "bob.pdf"))
+        self.assertEqual(registry.namespaces(), ["bob"])
+        with registry.open("alice") as index:
+            # loaded back from disk with its metadata index
+            self.assertEqual(len(index), 2)
+            self.assertEqual(len(index.search([1.0] * 16, k=5, filters={"source": "alice.pdf"})), 2)
+        self.assertEqual(registry.namespaces(), ["alice"])
+
+    def test_pinned_index_is_not_evicted(self):
+        registry = self.registry(memory_budget_mb=0)
+        with registry.open("alice") as index:
+            index.add_documents(_docs(2, "alice.pdf"))
+            self.assertEqual(registry.evict(), [])
+        self.assertEqual(registry.namespaces(), [])
+
+    def test_failed_dump_keeps_index_in_memory(self):
+        registry = self.registry()
+        with registry.open("alice") as index:
+            index.add_documents(_docs(2, "alice.pdf"))
+        registry.memory_budget = 0
+        with patch.object(NamespaceIndex, "dump", side_effect=OSError("disk full")):
+            # the query succeeded, the failed eviction is only logged
+            with self.assertLogs("index", "ERROR"):
+                with registry.open("alice") as index:
+                    self.assertEqual(len(index.search([1.0] * 16, k=5)), 2)
+            with self.assertRaises(OSError):
+                registry.evict()
+        self.assertEqual(registry.namespaces(), ["alice"])
+        self.assertEqual(registry.evict(), ["alice"])
+
+    def test_index_written_to_while_dumped_stays_in_memory(self):
+        registry = self.registry()
+        with registry.open("alice") as index:
+            index.add_documents(_docs(2, "alice.pdf"))
+        registry.memory_budget = 0
+        dump = NamespaceIndex.dump
+
+        def dump_while_writing(index, path):
+            dump(index, path)
+            # a writer of the namespace does not wait for the eviction, its chunk is not on disk
+            index.add_documents(_docs(1, "late.pdf"))
+
+        with patch.object(NamespaceIndex, "dump", dump_while_writing):
+            self.assertEqual(registry.evict(), [])
+        self.assertEqual(registry.namespaces(), ["alice"])
+
+    def test_persisted_index_is_loaded_after_restart(self):
+        registry = self.registry()
+        with registry.open("alice") as index:
+            index.add_documents(_docs(3, "alice.pdf"))
+        registry.persist("alice")
+        # still in memory, a new registry is the next start of the process
+        self.assertEqual(registry.namespaces(), ["alice"])
+        with self.registry().open("alice") as index:
+            self.assertEqual(index.values("source"), ["alice.pdf"])
+            self.assertEqual(len(index), 3)
+
+    def test_concurrent_reads_and_writes(self):
+        registry = self.registry()
+        errors = []
+
+        def write(namespace):
+            for i in range(20):
+                with registry.open(namespace) as index:
+                    index.add_documents(_docs(5, f"{namespace}-{i}.pdf"))
+
+        def read(namespace):
+            try:
+                for _ in range(200):
+                    with registry.open(namespace) as index:
+                        index.search([1.0] * 16, k=5, filters={"source": f"{namespace}-0.pdf"})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=f, args=(ns,)) for ns in ("a", "b") for f in (write, read)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        with registry.open("a") as index:
+            self.assertEqual(len(index), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import pathlib
+import tempfile
+import threading
+import unittest
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from index import IndexRegistry
+from ingestion import EMBEDDING, FAILED, INDEXED, PARSING, QUEUED, IngestionQueue
+from metadata_index import JOB_ID
+
+
+class TestIngestionQueue(unittest.TestCase):
+    """Test background processing of uploaded files"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.indexed = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def handler(self, job, set_status):
+        set_status(PARSING)
+        text = pathlib.Path(job.path).read_text()
+        if text == "broken":
+            raise ValueError("cannot parse")
+        set_status(EMBEDDING)
+        self.indexed.append((job.namespace, job.filename, text))
+
+    def test_jobs_are_processed_in_background(self):
+        release = threading.Event()
+
+        def slow_handler(job, set_status):
+            set_status(EMBEDDING)
+            release.wait(5)
+
+        ingestion = IngestionQueue(self.directory.name, slow_handler)
+        job_id = ingestion.submit("alice", "a.txt", b"hello")
+        # submit returns right away, status is polled while the worker runs
+        while ingestion.get(job_id).status == QUEUED:
+            pass
+        self.assertEqual(ingestion.get(job_id).status, EMBEDDING)
+        release.set()
+        ingestion.join()
+        self.assertEqual(ingestion.get(job_id).status, INDEXED)
+        ingestion.close()
+
+    def test_statuses_and_errors(self):
+        ingestion = IngestionQueue(self.directory.name, self.handler, workers=2)
+        ingestion.submit("alice", "a.txt", b"hello")
+        ingestion.submit("alice", "b.txt", b"broken")
+        ingestion.submit("bob", "c.txt", b"other")
+        ingestion.join()
+        jobs = {job.filename: job for job in ingestion.jobs("alice")}
+        self.assertEqual(jobs["a.txt"].status, INDEXED)
+        self.assertEqual(jobs["b.txt"].status, FAILED)
+        self.assertIn("cannot parse", jobs["b.txt"].error)
+        self.assertEqual([job.filename for job in ingestion.jobs("bob")], ["c.txt"])
+        self.assertEqual(sorted(self.indexed), [("alice", "a.txt", "hello"), ("bob", "c.txt", "other")])
+        ingestion.close()
+
+    def test_unfinished_jobs_resume_after_restart(self):
+        def crashing_handler(job, set_status):
+            set_status(PARSING)
+            raise SystemExit  # worker thread dies mid-job, like a stopped process
+
+        ingestion = IngestionQueue(self.directory.name, crashing_handler)
+        job_id = ingestion.submit("alice", "a.txt", b"hello")
+        ingestion._workers[0].join()
+        self.assertEqual(ingestion.get(job_id).status, PARSING)
+
+        restarted = IngestionQueue(self.directory.name, self.handler)
+        restarted.join()
+        self.assertEqual(restarted.get(job_id).status, INDEXED)
+        self.assertEqual(self.indexed, [("alice", "a.txt", "hello")])
+        restarted.close()
+
+
+class TestIngestionRestart(unittest.TestCase):
+    """Test that indexed uploads and re-queued jobs survive a restart, with the steps of retriever._ingest_job"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.uploads = pathlib.Path(self.directory.name) / "uploads"
+        self.registry = self.restarted_registry()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def restarted_registry(self) -> IndexRegistry:
+        # a new registry is a new start of the process, only what was written to disk is there
+        return IndexRegistry(DeterministicFakeEmbedding(size=16), pathlib.Path(self.directory.name) / "indexes", 100)
+
+    def handler(self, job, set_status):
+        set_status(EMBEDDING)
+        with self.registry.open(job.namespace) as index:
+            index.remove(JOB_ID, [job.id])
+            lines = pathlib.Path(job.path).read_text().splitlines()
+            index.add_documents([Document(page_content=line, metadata={JOB_ID: job.id}) for line in lines])
+        self.registry.persist(job.namespace)
+
+    def chunks(self) -> int:
+        with self.restarted_registry().open("alice") as index:
+            return len(index)
+
+    def test_indexed_upload_survives_restart(self):
+        ingestion = IngestionQueue(self.uploads, self.handler)
+        job_id = ingestion.submit("alice", "a.txt", b"one\ntwo\nthree")
+        ingestion.join()
+        self.assertEqual(ingestion.get(job_id).status, INDEXED)
+        ingestion.close()
+        # written to disk although the index was never evicted
+        self.assertEqual(self.chunks(), 3)
+
+    def test_requeued_job_replaces_its_chunks(self):
+        def stopped_after_indexing(job, set_status):
+            self.handler(job, set_status)
+            raise SystemExit  # stopped before the job was marked indexed
+
+        ingestion = IngestionQueue(self.uploads, stopped_after_indexing)
+        job_id = ingestion.submit("alice", "a.txt", b"one\ntwo\nthree")
+        ingestion._workers[0].join()
+
+        self.registry = self.restarted_registry()
+        restarted = IngestionQueue(self.uploads, self.handler)
+        restarted.join()
+        self.assertEqual(restarted.get(job_id).status, INDEXED)
+        restarted.close()
+        # the chunks of the first run were removed before the job was indexed again
+        self.assertEqual(self.chunks(), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import importlib.util
+import io
+import pathlib
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from langchain_community.document_loaders.parsers.pdf import PyPDFParser
+from langchain_core.documents.base import Blob
+
+import pdf_pages
+
+# synthetic_pdf of the benchmark fakes
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+from fakes import synthetic_pdf  # noqa: E402
+
+
+@unittest.skipUnless(importlib.util.find_spec("pypdf"), "needs pypdf")
+class TestParallelPdf(unittest.TestCase):
+    """Test page range parsing in the process pool against PyPDFParser"""
+
+    def test_same_pages_in_order(self):
+        # timings are measured by the pdf_parsing benchmark
+        data = synthetic_pdf(400, words_per_page=200)
+        sequential = list(PyPDFParser().lazy_parse(Blob.from_data(data, path="big.pdf")))
+        ranges = list(pdf_pages.iter_pdf_pages(io.BytesIO(data), "big.pdf"))
+        self.assertEqual(len(ranges), 8)
+        parallel = [doc for docs in ranges for doc in docs]
+        self.assertEqual([doc.metadata for doc in parallel], [doc.metadata for doc in sequential])
+        self.assertEqual([doc.page_content for doc in parallel], [doc.page_content for doc in sequential])
+
+    def test_stored_file_is_read_by_the_workers(self):
+        data = synthetic_pdf(150, words_per_page=20)
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "stored.pdf"
+            path.write_bytes(data)
+            with patch.object(pdf_pages.get_pdf_pool(), "submit", wraps=pdf_pages.get_pdf_pool().submit) as submit:
+                from_file = [doc for docs in pdf_pages.iter_pdf_pages(path, "big.pdf") for doc in docs]
+        # every range gets the path, not the bytes of the file
+        self.assertEqual({call.args[2] for call in submit.call_args_list}, {str(path)})
+        from_bytes = [doc for docs in pdf_pages.iter_pdf_pages(io.BytesIO(data), "big.pdf") for doc in docs]
+        self.assertEqual([doc.metadata for doc in from_file], [doc.metadata for doc in from_bytes])
+        self.assertEqual([doc.page_content for doc in from_file], [doc.page_content for doc in from_bytes])
+
+    def test_small_pdf_in_process(self):
+        ranges = list(pdf_pages.iter_pdf_pages(io.BytesIO(synthetic_pdf(3, words_per_page=20)), "small.pdf"))
+        self.assertEqual([[doc.metadata["page"] for doc in docs] for docs in ranges], [[0, 1, 2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+from langchain_core.documents import Document
+
+from rerank import collapse_overlapping, lexical_scorer, mmr
+
+
+def _chunk(start: int, text: str, source: str = "a.pdf", page: int = 1) -> Document:
+    return Document(page_content=text, metadata={"source": source, "page": page, "start_index": start})
+
+
+class TestMMR(unittest.TestCase):
+    """Test diversity of the selected candidates"""
+
+    def test_skips_near_duplicates(self):
+        matrix = np.array([[1.0, 0.0], [0.99, 0.01], [0.6, 0.8]])
+        self.assertEqual(mmr([1.0, 0.0], matrix, k=2, lambda_mult=0.3), [0, 2])
+        # relevance only keeps the duplicate
+        self.assertEqual(mmr([1.0, 0.0], matrix, k=2, lambda_mult=1.0), [0, 1])
+
+    def test_relevance_from_reranker(self):
+        matrix = np.array([[1.0, 0.0], [0.0, 1.0]])
+        self.assertEqual(mmr([1.0, 0.0], matrix, k=2, relevance=[0.1, 5.0]), [1, 0])
+
+    def test_empty(self):
+        self.assertEqual(mmr([1.0], np.zeros((0, 1)), k=3), [])
+
+
+class TestCollapseOverlapping(unittest.TestCase):
+    """Test merging of overlapping chunks"""
+
+    def test_merges_overlapping_chunks_of_same_page(self):
+        docs = [_chunk(5, "fghij"), _chunk(0, "abcdefg"), _chunk(0, "other", page=2)]
+        passages = collapse_overlapping(docs, k=5)
+        self.assertEqual([p.page_content for p in passages], ["abcdefghij", "other"])
+        self.assertEqual(passages[0].metadata["start_index"], 0)
+
+    def test_epub_sections_are_not_merged(self):
+        docs = [
+            Document(page_content="abc", metadata={"source": "b.epub", "chapter": 1, "section": 0, "start_index": 0}),
+            Document(page_content="xyz", metadata={"source": "b.epub", "chapter": 1, "section": 1, "start_index": 0}),
+        ]
+        self.assertEqual(len(collapse_overlapping(docs, k=5)), 2)
+
+    def test_fills_k_after_merging(self):
+        docs = [_chunk(0, "abcd"), _chunk(3, "defg"), _chunk(0, "x", source="b.pdf"), _chunk(0, "y", source="c.pdf")]
+        self.assertEqual([p.page_content for p in collapse_overlapping(docs, k=2)], ["abcdefg", "x"])
+
+    def test_chunks_without_start_index(self):
+        docs = [Document(page_content="a"), Document(page_content="a")]
+        self.assertEqual(len(collapse_overlapping(docs, k=5)), 2)
+
+
+class TestLexicalScorer(unittest.TestCase):
+
+    def test_scores(self):
+        self.assertEqual(lexical_scorer("red car", ["a red car", "a red bus", "boat"]), [1.0, 0.5, 0.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,256 @@
+import functools
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from instrumentation import LatencyHistogram
+
+CHECKPOINT_PATH = "./cache/checkpoints.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_checkpoint_id TEXT,
+    type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT, checkpoint_ns TEXT, channel TEXT, version TEXT, type TEXT, blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,
+    channel TEXT, type TEXT, blob BLOB, task_path TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+def thread_config(thread_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer keeping every thread in a local SQLite file, so a run that crashed or timed out
+    can be resumed from its last completed node. Channel values are stored once per version, a checkpoint
+    only writes the channels its step changed. Writes are not fsynced (WAL with synchronous=NORMAL),
+    they survive the process crashing but not the machine losing power.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH, **kwargs: Any):
+        super().__init__(**kwargs)
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # time and size of checkpoint and pending write commits
+        self.write_latency = LatencyHistogram()
+        self.bytes_written = 0
+
+    def _commit(self, *statements: tuple[str, Sequence[tuple]]) -> None:
+        """Runs (sql, rows) statements in one transaction"""
+        start = time.perf_counter()
+        with self._lock, self._db:
+            for sql, rows in statements:
+                self._db.executemany(sql, rows)
+        self.write_latency.record((time.perf_counter() - start) * 1000)
+        self.bytes_written += sum(
+            len(value) for _, rows in statements for row in rows for value in row if isinstance(value, bytes)
+        )
+
+    def _channel_values(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values = {}
+        with self._lock:
+            for channel, version in versions.items():
+                row = self._db.execute(
+                    "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? "
+                    "AND version = ?", (thread_id, checkpoint_ns, channel, str(version))
+                ).fetchone()
+                if row is not None and row[0] != "empty":
+                    values[channel] = self.serde.loads_typed(row)
+        return values
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint))
+        with self._lock:
+            writes = self._db.execute(
+                "SELECT task_id, channel, type, blob FROM writes WHERE thread_id = ? AND checkpoint_ns = ? "
+                "AND checkpoint_id = ? ORDER BY task_path, task_id, idx", (thread_id, checkpoint_ns, checkpoint_id)
+            ).fetchall()
+        config = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}
+        return CheckpointTuple(
+            config={"configurable": {**config, "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._channel_values(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {"configurable": {**config, "checkpoint_id": parent_checkpoint_id}} if parent_checkpoint_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._db.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id)
+                ).fetchone()
+            else:
+                # checkpoint ids are time ordered
+                row = self._db.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)
+                ).fetchone()
+        return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        conditions, params = [], []
+        if config is not None:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                f"metadata_type, metadata FROM checkpoints {where} ORDER BY checkpoint_id DESC", params
+            ).fetchall()
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            checkpoint = self._tuple(thread_id, checkpoint_ns, tuple(row))
+            if filter and any(checkpoint.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield checkpoint
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        # only the channels updated by this step, the others keep pointing at their stored version
+        blobs = [
+            (thread_id, checkpoint_ns, channel, str(version),
+             *(self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")))
+            for channel, version in new_versions.items()
+        ]
+        self._commit(
+            ("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs),
+            ("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(
+                thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                *self.serde.dumps_typed(checkpoint),
+                *self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+            )]),
+        )
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        # error and interrupt writes replace earlier ones of the task, results of a task are written once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        self._commit((f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"],
+             task_id, WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self._db:
+            for table in ("checkpoints", "blobs", "writes"):
+                self._db.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    # commits take well under a millisecond, the async graphs call them directly instead of on a thread
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for checkpoint in self.list(config, filter=filter, before=before, limit=limit):
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+@functools.cache
+def get_checkpointer() -> SqliteCheckpointer:
+    return SqliteCheckpointer(CHECKPOINT_PATH)
@@ -1,19 +1,38 @@
 from utils import get_resume_data, get_url_content, create_cover_letter
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langgraph.prebuilt.chat_agent_executor import AgentState
-from langgraph.prebuilt import create_react_agent
 import argparse
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
 from langgraph.graph import StateGraph, START, END
 from typing import Optional, TypedDict
+from reflection import ReflectionLoop, ReflectionStats
+from prompt_cache import cached_prefix_prompt, supports_cache_control
+from lazy import lazy_runnable
+from instrumentation import instrumented, log_summary
+from rate_limit import BATCH, lane, openai_client_options
+from routing import Cascade, log_route_summary, non_empty
+
+# clients and chains are created on first use, importing this module does no work
+@lazy_runnable
+def llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model="gpt-4o-mini", 
+        temperature=0.0,
+        max_tokens=3000,
+        **openai_client_options(),
+    )
+
+# chains run on llm and escalate to strong_llm only when its answer does not validate
+@lazy_runnable
+def strong_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model="gpt-4o",
+        temperature=0.0,
+        max_tokens=3000,
+        **openai_client_options(),
+    )
 
-llm = ChatOpenAI(
-    model="gpt-4o-mini", 
-    temperature=0.0,
-    max_tokens=3000
-)
 class JobDescription(BaseModel):
     """
     State for the job description extraction agent
@@ -30,7 +49,12 @@ job_description_prompt = ChatPromptTemplate.from_messages([
     ("system", jd_system_prompt),
     ("human", "Full HTML string: {job_url_content}")
 ])
-job_description_chain = (job_description_prompt | llm.with_structured_output(JobDescription))
+
+@lazy_runnable
+def job_description_chain():
+    return job_description_prompt | Cascade(
+        "job_description", [llm.get(), strong_llm.get()], JobDescription, non_empty("extracted_job_description")
+    )
 
 
 critique_system_prompt = (
@@ -66,15 +90,24 @@ critique_system_prompt = (
     "candidate fit should be approved without changes."
 )
 
-critique_prompt = ChatPromptTemplate.from_messages([
-    ("system", critique_system_prompt),
-    ("user", "Job Description: {job_description}\n\nResume:\n{resume_str}\n\nCover Letter\n:{cover_letter}\n"),
-    ("placeholder", "{messages}")
-])
 class CritiqueResponse(BaseModel):
     critique: Optional[str] = Field(description="Critique to the cover letter")
     cover_letter: str = Field(description="Improved cover letter that addresses critiques")
-critique_chain = (critique_prompt | llm.with_structured_output(CritiqueResponse))
+
+@lazy_runnable
+def critique_chain():
+    # job description and resume are identical on every critique/revise round, so they form
+    # a stable prompt prefix ahead of the cover letter and critique that change each round
+    critique_prompt = cached_prefix_prompt(
+        critique_system_prompt,
+        "Job Description: {job_description}\n\nResume:\n{resume_str}\n\n",
+        "Cover Letter\n:{cover_letter}\n",
+        cache_control=supports_cache_control(llm.get()),
+    )
+    # no critique is a valid answer, the improved cover letter is not optional
+    return critique_prompt | Cascade(
+        "cover_letter_critique", [llm.get(), strong_llm.get()], CritiqueResponse, non_empty("cover_letter")
+    )
 
 class RevisedCoverLetter(BaseModel):
     cover_letter: str = Field(description="Revised cover letter that addressed critique points")
@@ -83,12 +116,18 @@ revise_system_prompt = (
     "given critique from an expert. You need to revise your cover letter "
     "to address the critique points."
 )
-revise_cv_prompt = ChatPromptTemplate.from_messages([
-    ("system", revise_system_prompt),
-    ("user", "Job Description: {job_description}\nResume:\n{resume_str}\nCover Letter\n:{cover_letter}\nCritique:{critique}"),
-    ("placeholder", "{messages}")
-])
-revise_chain = (revise_cv_prompt | llm.with_structured_output(RevisedCoverLetter))
+
+@lazy_runnable
+def revise_chain():
+    revise_cv_prompt = cached_prefix_prompt(
+        revise_system_prompt,
+        "Job Description: {job_description}\nResume:\n{resume_str}\n",
+        "Cover Letter\n:{cover_letter}\nCritique:{critique}",
+        cache_control=supports_cache_control(llm.get()),
+    )
+    return revise_cv_prompt | Cascade(
+        "cover_letter_revision", [llm.get(), strong_llm.get()], RevisedCoverLetter, non_empty("cover_letter")
+    )
 
 class JobCoverLetterState(TypedDict):
     resume_str: str
@@ -96,6 +135,13 @@ class JobCoverLetterState(TypedDict):
     job_description: str 
     cover_letter: str 
     critique: Optional[str]
+    revision_round: int
+    previous_draft: Optional[str]
+    reflection_stats: ReflectionStats
+
+# critique -> revise loop is bounded to at most 3 revisions and stops early
+# once successive cover letter drafts stop changing
+cover_letter_reflection = ReflectionLoop(draft_key="cover_letter", max_rounds=3)
 
 def _job_description_node(state: JobCoverLetterState):
     result: JobDescription = job_description_chain.invoke({
@@ -138,25 +184,18 @@ def _revise_node(state: JobCoverLetterState):
     }
 
 def _should_revise_cover_letter(state: JobCoverLetterState):
-    if state["critique"] is not None:
+    if cover_letter_reflection.should_revise(state):
         return "revise"
     else:
         return "end"
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--url", type=str, required=True)
-    args = parser.parse_args()
-
-    resume_str: str = get_resume_data()
-    job_url_content = get_url_content(args.url)
-
-    graph = (
+def build_graph():
+    return (
         StateGraph(JobCoverLetterState)
         .add_node("job_description_node", _job_description_node)
         .add_node("cover_letter_node", _cover_letter_node)
-        .add_node("cover_letter_critique_node", _cover_letter_critique_node)
-        .add_node("revise_node", _revise_node)
+        .add_node("cover_letter_critique_node", cover_letter_reflection.critique_node(_cover_letter_critique_node))
+        .add_node("revise_node", cover_letter_reflection.revise_node(_revise_node))
         .add_edge(START, "job_description_node")
         .add_edge("job_description_node", "cover_letter_node")
         .add_edge("cover_letter_node", "cover_letter_critique_node")
@@ -164,14 +203,27 @@ def main():
             "revise": "revise_node",
             "end": END
         })
+        .add_edge("revise_node", "cover_letter_critique_node")
         .compile()
     )
 
-    result = graph.invoke({
-        "resume_str": resume_str,
-        "job_url_content": job_url_content
-    })
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, required=True)
+    args = parser.parse_args()
+
+    resume_str: str = get_resume_data()
+    job_url_content = get_url_content(args.url)
+
+    # cover letters are batch work, interactive requests sharing the rate limits go first
+    with lane(BATCH):
+        result = build_graph().invoke({
+            "resume_str": resume_str,
+            "job_url_content": job_url_content
+        }, config=instrumented())
     print(result["cover_letter"])
+    log_summary()
+    log_route_summary()
 
 
 if __name__ == "__main__":
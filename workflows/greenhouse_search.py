@@ -1,15 +1,24 @@
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import create_react_agent
-from pydantic_core.core_schema import str_schema
+import argparse
+import functools
 import requests 
+from dataclasses import dataclass
 from typing import Dict, List, TypedDict
 from datetime import datetime, timezone
 from dateutil import parser
 from utils import get_resume_data, get_url_content, create_cover_letter
+from rate_limit import BATCH, chat_anthropic, lane
+from job_ranking import get_embeddings, html_to_text, job_text, rank_by_similarity
+
+# postings ranked closest to the resume get their page fetched and cover letters written
+TOP_N = 10
+# job description, cover letter and at least one critique (see cv.py)
+COVER_LETTER_LLM_CALLS = 3
+
+# client is created on first use, importing this module does no work
+@functools.cache
+def get_llm():
+    return chat_anthropic(model="claude-3-7-sonnet-latest")
 
-llm = ChatAnthropic(model="claude-3-7-sonnet-latest")
 companies: list[str] = [
     "adobe",
     "affirm",
@@ -51,6 +60,22 @@ class Job(TypedDict):
     description: str
 
 
+@dataclass
+class ScanStats:
+    listed: int = 0
+    matched: int = 0
+    fetched: int = 0
+    cover_letters: int = 0
+
+    def report(self, cover_letters: bool) -> str:
+        """Summary of the scan, LLM calls are only saved when cover letters are written"""
+        skipped = self.matched - self.fetched
+        saved = f"Saved {skipped} page fetches"
+        if cover_letters:
+            saved += f" and {skipped * COVER_LETTER_LLM_CALLS} cover letter LLM calls"
+        return f"{self.listed} jobs listed, {self.matched} matched, {self.fetched} ranked highest fetched. {saved}"
+
+
 def is_within_last_week(date_string):
     """
     Check if a given date string is within the last 7 days.
@@ -108,8 +133,13 @@ def is_match(job: Dict, roles: List[str], locations: List[str]) -> bool:
     return True
 
 
-def get_active_jobs(company_name: str, roles: List[str], locations: List[str]) -> List[Job]:
-    url = f"https://boards-api.greenhouse.io/v1/boards/{company_name}/jobs"
+def get_active_jobs(company_name: str, roles: List[str], locations: List[str], stats: ScanStats) -> List[Job]:
+    """
+    Matching jobs of the company board. Their description is the job post of the board listing,
+    the page of a job is only fetched once it is ranked (see fetch_descriptions).
+    """
+    # content=true adds the job posts to the listing, one request per company
+    url = f"https://boards-api.greenhouse.io/v1/boards/{company_name}/jobs?content=true"
     output: List[Job] = []
     
     try:
@@ -118,17 +148,17 @@ def get_active_jobs(company_name: str, roles: List[str], locations: List[str]) -
         data = response.json()
         jobs = data.get("jobs", [])
         print(f"Found {len(jobs)} jobs for {company_name}")
+        stats.listed += len(jobs)
         for job in jobs:
             try:
                 if not is_match(job, roles, locations):
                     continue
-                description = get_url_content(job["absolute_url"])
                 output.append(Job(
                     company=company_name,
                     title=job["title"], 
                     location=job["location"]["name"], 
                     url=job["absolute_url"], 
-                    description=description)
+                    description=html_to_text(job.get("content", "")))
                 )
             except (KeyError, TypeError) as e:
                 print(f"Error processing job data for {company_name}: {e}")
@@ -139,11 +169,47 @@ def get_active_jobs(company_name: str, roles: List[str], locations: List[str]) -
     except ValueError as e:
         print(f"Error parsing JSON response for {company_name}: {e}")
 
+    stats.matched += len(output)
     return output
 
 
+def rank_jobs(resume_str: str, jobs: List[Job], top_n: int = TOP_N) -> List[Job]:
+    """Top n jobs by embedding similarity of their title and post to the resume, best first"""
+    ranked = rank_by_similarity(
+        get_embeddings(), resume_str, [job_text(job["title"], job["description"]) for job in jobs], jobs, top_n
+    )
+    for score, job in ranked:
+        print(f"{score:.3f} {job['company']}: {job['title']}")
+    return [job for _, job in ranked]
+
+
+def fetch_descriptions(jobs: List[Job], stats: ScanStats) -> None:
+    for job in jobs:
+        job["description"] = get_url_content(job["url"])
+        stats.fetched += 1
+
+
+def write_cover_letters(resume_str: str, jobs: List[Job], stats: ScanStats) -> None:
+    # imported here, the scan alone does not build the cover letter chains
+    import cv
+
+    for job in jobs:
+        result = cv.build_graph().invoke({
+            "resume_str": resume_str,
+            "job_url_content": job["description"],
+        })
+        stats.cover_letters += 1
+        print(f"Cover letter for {job['company']}: {job['title']}\n\n{result['cover_letter']}\n\n")
+
+
 def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--top", type=int, default=TOP_N, help="number of ranked jobs to fetch")
+    arg_parser.add_argument("--cover-letters", action="store_true", help="write cover letters of the ranked jobs")
+    args = arg_parser.parse_args()
+
     resume_str: str = get_resume_data()
+    stats = ScanStats()
     # 1. find all jobs in greenhouse 
     jobs: List[Job] = []
     roles = [
@@ -162,17 +228,27 @@ def main():
         jobs.extend(get_active_jobs(
             company,
             roles,
-            locations
+            locations,
+            stats
         ))
 
     print(f"\n\n\nNumber of jobs found: {len(jobs)}!")
 
+    # embeddings and cover letters are batch work, interactive requests sharing the rate limits go first
+    with lane(BATCH):
+        # 2. only the jobs closest to the resume are fetched and get LLM work
+        jobs = rank_jobs(resume_str, jobs, args.top)
+        fetch_descriptions(jobs, stats)
+        if args.cover_letters:
+            write_cover_letters(resume_str, jobs, stats)
+
     for job in jobs:
         print(
             f"Company: {job['company']}\n"
             f"Title: {job['title']}\n"
             f"URL: {job['url']}\n\n"
         )
+    print(stats.report(args.cover_letters))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,195 @@
+import functools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import IO, Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig
+
+from rate_limit import scheduler_stats
+
+LOGGER = logging.getLogger(__name__)
+
+# USD per 1M input / output tokens, models missing here are reported with zero cost
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "claude-3-5-sonnet-latest": (3.00, 15.00),
+    "claude-3-7-sonnet-latest": (3.00, 15.00),
+    "claude-3-5-haiku-latest": (0.80, 4.00),
+}
+
+
+def cost(model: Optional[str], input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model or "", (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class LatencyHistogram:
+    """
+    Fixed size log-bucketed histogram, every bucket is 5% wider than the previous one.
+    Recording is O(1) with constant memory, percentiles are accurate to the bucket width.
+    """
+    GROWTH = 1.05
+    MIN_MS = 0.01
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total_ms = 0.0
+
+    def record(self, latency_ms: float) -> None:
+        bucket = max(0, int(math.log(max(latency_ms, self.MIN_MS) / self.MIN_MS, self.GROWTH)))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total_ms += latency_ms
+
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = math.ceil(p / 100 * self.count)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # upper bound of the bucket
+                return self.MIN_MS * self.GROWTH ** (bucket + 1)
+        return self.MIN_MS * self.GROWTH ** (max(self.buckets) + 1)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+        }
+
+
+class InstrumentationHandler(BaseCallbackHandler):
+    """
+    Callback handler recording wall time of every LangGraph node and LLM call, with prompt and completion
+    tokens, cost and prompt cache hits of the LLM calls. Retries happen below the callbacks in the
+    rate limited transport (see rate_limit.py), the summary reports the retries of the whole process.
+    Every finished run is written as a JSON line to `sink` (if given) and added to in-process latency histograms.
+    """
+    raise_error = False
+    # record synchronously also in async runs, handler is cheap and thread safe
+    run_inline = True
+
+    def __init__(self, sink: Optional[IO[str]] = None):
+        self.sink = sink
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.totals = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cost": 0.0, "errors": 0}
+        self._runs: Dict[UUID, dict] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, record: dict) -> None:
+        record["start"] = time.perf_counter()
+        self._runs[run_id] = record
+
+    def _finish(self, run_id: UUID, **fields: Any) -> None:
+        record = self._runs.pop(run_id, None)
+        if record is None:
+            return
+        record["latency_ms"] = (time.perf_counter() - record.pop("start")) * 1000
+        record.update(fields)
+        key = f"{record['type']}:{record['name']}"
+        with self._lock:
+            self.histograms.setdefault(key, LatencyHistogram()).record(record["latency_ms"])
+            for total in ("input_tokens", "output_tokens", "cached_tokens", "cost"):
+                self.totals[total] += record.get(total, 0)
+            self.totals["errors"] += int("error" in record)
+            if self.sink is not None:
+                self.sink.write(json.dumps(record) + "\n")
+
+    # graph nodes
+    def on_chain_start(
+        self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+        tags: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # nested runnables inherit langgraph_node metadata, only the node run itself has the node name
+        if node is not None and kwargs.get("name") == node:
+            self._start(run_id, {"type": "node", "name": node, "step": metadata.get("langgraph_step")})
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=repr(error))
+
+    # llm calls
+    def _start_llm(self, run_id: UUID, metadata: Optional[Dict[str, Any]], kwargs: dict) -> None:
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or kwargs.get("invocation_params", {}).get("model")
+        self._start(run_id, {"type": "llm", "name": model or "unknown", "node": metadata.get("langgraph_node")})
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> None:
+        self._start_llm(run_id, metadata, kwargs)
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> None:
+        self._start_llm(run_id, metadata, kwargs)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        input_tokens = output_tokens = cached_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+                cached_tokens += usage.get("input_token_details", {}).get("cache_read", 0)
+        record = self._runs.get(run_id)
+        model = record["name"] if record else None
+        self._finish(
+            run_id,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cached_tokens=cached_tokens,
+            cache_hit=cached_tokens > 0,
+            cost=cost(model, input_tokens, output_tokens),
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=repr(error))
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "totals": {**self.totals, "retries": scheduler_stats()["retries"]},
+                "latency": {key: hist.summary() for key, hist in sorted(self.histograms.items())},
+            }
+
+
+@functools.cache
+def get_instrumentation() -> InstrumentationHandler:
+    """
+    Process wide handler. Records are appended as JSON lines to the file in INSTRUMENTATION_PATH
+    environment variable, without it only the in-process summary is kept.
+    """
+    path = os.environ.get("INSTRUMENTATION_PATH")
+    sink = open(path, "a", buffering=1) if path else None
+    return InstrumentationHandler(sink)
+
+
+def instrumented(config: Optional[RunnableConfig] = None) -> RunnableConfig:
+    """Returns copy of the runnable config with the instrumentation handler added to its callbacks"""
+    config = dict(config or {})
+    config["callbacks"] = [*(config.get("callbacks") or []), get_instrumentation()]
+    return config
+
+
+def log_summary() -> None:
+    LOGGER.info(f"instrumentation summary: {json.dumps(get_instrumentation().summary())}")
@@ -0,0 +1,70 @@
+import functools
+import html
+import re
+from typing import List, Sequence, Tuple, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+from rate_limit import openai_client_options
+
+EMBEDDING_CACHE_DIR = "./cache/embeddings/"
+# texts per embeddings request
+EMBEDDING_BATCH_SIZE = 256
+# the title and start of the posting say what the job is, the rest is mostly benefits and legal text
+MAX_JOB_CHARS = 2000
+
+T = TypeVar("T")
+
+
+# client is created on first use, importing this module does no work
+@functools.cache
+def get_embeddings() -> Embeddings:
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+    from langchain_openai import OpenAIEmbeddings
+
+    underlying_embeddings = OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        **openai_client_options(),
+    )
+    # postings and the resume are embedded once, later scans only embed new postings
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying_embeddings,
+        LocalFileStore(EMBEDDING_CACHE_DIR),
+        namespace=underlying_embeddings.model,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        query_embedding_cache=True,
+    )
+
+
+def html_to_text(content: str) -> str:
+    """Plain text of the escaped HTML of a greenhouse job post"""
+    text = re.sub(r"<[^>]+>", " ", html.unescape(content or ""))
+    return " ".join(html.unescape(text).split())
+
+
+def job_text(title: str, description: str) -> str:
+    return f"{title}\n{description}"[:MAX_JOB_CHARS]
+
+
+def rank_by_similarity(
+    embeddings: Embeddings, query: str, texts: Sequence[str], items: Sequence[T], top_n: int
+) -> List[Tuple[float, T]]:
+    """
+    Top n items by cosine similarity of their text to the query, best first.
+    The query is embedded once and the texts in batches, scores are one matrix-vector product.
+    """
+    # imported on first ranking, importing this module stays cheap
+    import numpy as np
+
+    if not items or top_n <= 0:
+        return []
+    query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    vectors = np.asarray(embeddings.embed_documents(list(texts)), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+    scores = vectors @ query_vector / np.where(norms == 0, 1, norms)
+    top_n = min(top_n, len(items))
+    # partial sort, only the top n are ordered
+    top = np.argpartition(-scores, top_n - 1)[:top_n]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(float(scores[i]), items[i]) for i in top]
@@ -0,0 +1,40 @@
+import functools
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+
+class LazyRunnable(Runnable):
+    """
+    Runnable that is built by factory on first use and cached afterwards.
+    Lets modules expose llms, chains and agents as module level names without creating
+    clients or loading tools at import time. Other attributes are forwarded to the built runnable.
+    """
+
+    def __init__(self, factory: Callable[[], Runnable]):
+        self.get = functools.cache(factory)
+        self.name = factory.__name__
+
+    def __getattr__(self, name: str) -> Any:
+        # private and dunder lookups (e.g. by mock.patch or asyncio checks) must not build the runnable
+        if name == "get" or name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.get().invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self.get().ainvoke(input, config, **kwargs)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        yield from self.get().stream(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async for chunk in self.get().astream(input, config, **kwargs):
+            yield chunk
+
+
+def lazy_runnable(factory: Callable[[], Runnable]) -> LazyRunnable:
+    """Decorator turning a factory function into a lazily built module level runnable"""
+    return LazyRunnable(factory)
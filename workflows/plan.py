@@ -1,26 +1,51 @@
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from pydantic import BaseModel, Field
-from langchain_community.agent_toolkits.load_tools import load_tools
-from typing import TypedDict, Annotated, Literal
-import operator
+from typing import TypedDict, Annotated, Optional
 from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
+import argparse
 import asyncio
+import functools
+import uuid
+from tool_cache import cached_tools, hit_rates
+from tool_timeouts import with_timeouts
+from checkpointer import get_checkpointer, thread_config
+from lazy import lazy_runnable
+from instrumentation import instrumented, log_summary
+from rate_limit import openai_client_options
+from routing import Cascade, log_route_summary, non_empty
 
-llm = ChatOpenAI(model="gpt-4o-mini")
+# clients, tools and agents are created on first use, importing this module does no work
+@lazy_runnable
+def llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4o-mini", **openai_client_options())
+
+# the planner escalates to it when the plan from llm does not validate or has no steps
+@lazy_runnable
+def strong_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4o", **openai_client_options())
 
 class Plan(BaseModel):
     """A plan to solve the task"""
     steps: list[str] = Field(description="List of steps necessary to solve the task, should be in sorted order")
+    dependencies: Optional[list[list[int]]] = Field(
+        default=None,
+        description=(
+            "Optional. For each step, list of earlier step numbers (starting from 1) whose results it needs. "
+            "Use an empty list for steps that can run independently, e.g. separate searches."
+        )
+    )
 
 system_prompt = (
     "For the given task, come up with a step by step plan.\n"
     "This plan should involve individual tasks, that if executed correctly will "
     "yield the correct answer. Do not add any superfluous steps.\n"
     "The result of the final step should be the final answer. Make sure that each "
-    "step has all the information needed - do not skip steps."
+    "step has all the information needed - do not skip steps.\n"
+    "For each step also list which earlier steps it depends on, so independent steps can run in parallel."
 )
 planner_prompt = ChatPromptTemplate.from_messages([
     ("system", system_prompt),
@@ -28,7 +53,9 @@ planner_prompt = ChatPromptTemplate.from_messages([
     ("placeholder", "{messages}")
 ])
 
-planner = (planner_prompt | llm.with_structured_output(Plan))
+@lazy_runnable
+def planner():
+    return planner_prompt | Cascade("planner", [llm.get(), strong_llm.get()], Plan, non_empty("steps"))
 
 executor_system_prompt = (
     "You are given a specific step in full plan to solve a task.\n"
@@ -45,37 +72,125 @@ class ExecutorState(AgentState):
     plan: Plan
     step: str
 
-tools = load_tools(
-    tool_names=["ddg-search", "arxiv", "wikipedia"],
-    llm=llm
-)
-executor_agent = create_react_agent(
-    model=llm,
-    tools=tools,
-    prompt=executor_prompt,
-    state_schema=ExecutorState
-)
+@functools.cache
+def get_tools():
+    from langchain_community.agent_toolkits.load_tools import load_tools
+    # search results are cached on disk and shared between steps and concurrent identical calls,
+    # a slow search times out and the step continues with the results of the other tool calls
+    return with_timeouts(cached_tools(load_tools(
+        tool_names=["ddg-search", "arxiv", "wikipedia"],
+        llm=llm.get()
+    )))
+
+@lazy_runnable
+def executor_agent():
+    from langgraph.prebuilt import create_react_agent
+    return create_react_agent(
+        model=llm.get(),
+        tools=get_tools(),
+        prompt=executor_prompt,
+        state_schema=ExecutorState
+    )
+
+# maximum number of independent steps executed at the same time
+MAX_CONCURRENCY = 4
+# results longer than this are truncated (or summarized) before they are added to the plan transcript
+MAX_RESULT_TOKENS = 1000
+# token budget for past results shown to the executor, older results are left out once it is exceeded
+PLAN_TOKEN_BUDGET = 4000
+# summarize long results with the llm instead of truncating them
+SUMMARIZE_PAST_RESULTS = False
+
+def _merge_past_steps(left: dict[int, str], right: dict[int, str]) -> dict[int, str]:
+    """Merges results of concurrently executed steps ordered by step index, independent of completion order"""
+    merged = {**left, **right}
+    return {i: merged[i] for i in sorted(merged)}
 
 class PlanState(TypedDict):
     task: str 
     plan: Plan 
-    past_steps: Annotated[list[str], operator.add]
+    # step index -> result of the step execution
+    past_steps: Annotated[dict[int, str], _merge_past_steps]
+    # step index -> rendered step with its (compressed) result, rendered once when the step completes
+    transcript: Annotated[dict[int, str], _merge_past_steps]
     final_response: str 
 
+class StepState(TypedDict):
+    """Input of a single step execution dispatched with Send"""
+    task: str
+    plan: Plan
+    transcript: dict[int, str]
+    step_index: int
+
 def get_current_step(state: PlanState) -> int:
-    """Returns the current step in the plan"""
-    return len(state.get("past_steps", []))
+    """Returns the number of completed steps in the plan"""
+    return len(state.get("past_steps", {}))
+
+def get_step_dependencies(plan: Plan) -> list[set[int]]:
+    """
+    Returns 0-based indices of the steps each step depends on.
+    Without valid dependencies from the planner every step depends on the previous one,
+    i.e. the plan is executed sequentially. Only dependencies on earlier steps are kept, so the result is always a DAG.
+    """
+    if plan.dependencies is None or len(plan.dependencies) != len(plan.steps):
+        return [{i - 1} if i > 0 else set() for i in range(len(plan.steps))]
+    return [
+        {d - 1 for d in deps if 1 <= d <= i}
+        for i, deps in enumerate(plan.dependencies)
+    ]
+
+def get_ready_steps(state: PlanState) -> list[int]:
+    """Returns indices of not yet executed steps whose dependencies are all completed"""
+    past_steps = state.get("past_steps", {})
+    return [
+        i for i, deps in enumerate(get_step_dependencies(state["plan"]))
+        if i not in past_steps and deps.issubset(past_steps)
+    ]
 
-def get_full_plan(state: PlanState):
-    """returns formatted plan with step numbers and past results"""
-    full_plan = []
-    for i, step in enumerate(state["plan"].steps):
-        full_step = f"#{i+1}. Planned step: {step}\n"
-        if i < get_current_step(state):
-            full_step += f"Result: {state['past_steps'][i]}\n"
-        full_plan.append(full_step)
+def estimate_tokens(text: str) -> int:
+    """Rough token count, ~4 characters per token for English text"""
+    return len(text) // 4
 
-    return "\n".join(full_plan)
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4] + "... [truncated]"
+
+def render_step(i: int, step: str, result: Optional[str] = None) -> str:
+    full_step = f"#{i+1}. Planned step: {step}\n"
+    if result is not None:
+        full_step += f"Result: {result}\n"
+    return full_step
+
+def get_full_plan(state: PlanState, token_budget: Optional[int] = None, step: Optional[int] = None):
+    """
+    returns formatted plan with step numbers and past results.
+    Completed steps come pre-rendered from the transcript. With token_budget, only the results
+    that fit into the budget are shown, so prompt size stays bounded for long plans: first the results
+    the given step depends on, then the most recent ones.
+    """
+    transcript = state.get("transcript", {})
+    shown = transcript.keys()
+    if token_budget is not None:
+        dependencies = get_step_dependencies(state["plan"])[step] if step is not None else set()
+        # a step always sees the results it depends on, however old they are
+        shown = {i for i in dependencies if i in transcript}
+        used = sum(estimate_tokens(transcript[i]) for i in shown)
+        for i in sorted(transcript.keys() - shown, reverse=True):
+            used += estimate_tokens(transcript[i])
+            if used > token_budget:
+                break
+            shown.add(i)
+
+    return "\n".join(
+        transcript[i] if i in shown else render_step(i, step)
+        for i, step in enumerate(state["plan"].steps)
+    )
+
+summarize_prompt = PromptTemplate.from_template(
+    "Summarize the following result of a plan step in at most {max_tokens} tokens. "
+    "Keep all facts, numbers and references needed by the later steps.\nRESULT:\n{result}\n"
+)
 
 final_prompt = PromptTemplate.from_template(
     "You're helpful assistant that has executed on a plan."
@@ -93,21 +208,33 @@ async def _build_initial_plan(state: PlanState):
         "plan": result
     }
 
-async def _run_step(state: PlanState):
+async def _run_step(state: StepState):
     plan = state["plan"]
-    current_step: int = get_current_step(state)
+    step_index: int = state["step_index"]
     result = await executor_agent.ainvoke({
         "task": state["task"],
-        "plan": get_full_plan(state),
-        "step": plan.steps[current_step]
+        "plan": get_full_plan(state, token_budget=PLAN_TOKEN_BUDGET, step=step_index),
+        "step": plan.steps[step_index]
     })
     output = result["messages"][-1].content
-    print(f"Output of execution: {output}")
+    print(f"Output of execution #{step_index+1}: {output}")
     return {
-        # add output from react execution agent to the past steps list
-        "past_steps": [output]
+        # add output from react execution agent to the past steps
+        "past_steps": {step_index: output},
+        "transcript": {step_index: render_step(step_index, plan.steps[step_index], await _compress_result(output))}
     }
 
+async def _compress_result(output: str) -> str:
+    if estimate_tokens(output) <= MAX_RESULT_TOKENS:
+        return output
+    if SUMMARIZE_PAST_RESULTS:
+        summary = await (summarize_prompt | llm).ainvoke({
+            "max_tokens": MAX_RESULT_TOKENS,
+            "result": output
+        })
+        return truncate_to_tokens(summary.content, MAX_RESULT_TOKENS)
+    return truncate_to_tokens(output, MAX_RESULT_TOKENS)
+
 async def _get_final_respons(state: PlanState): 
     result = await (final_prompt | llm).ainvoke({
         "task": state["task"],
@@ -118,36 +245,71 @@ async def _get_final_respons(state: PlanState):
         "final_response": result.content
     }
 
-def _should_continue(state: PlanState) -> Literal["run", "final_response"]:
-    if get_current_step(state) < len(state["plan"].steps):
-        return "run"
-    else:
-        return "final_response"
-    
-async def main():
-    graph = (
+def _schedule_steps(state: PlanState):
+    # join point for concurrently executed steps, dispatching happens in _dispatch_steps
+    return {}
+
+def _dispatch_steps(state: PlanState, max_concurrency: int = MAX_CONCURRENCY):
+    if get_current_step(state) >= len(state["plan"].steps):
+        return "get_final_respons"
+    return [
+        Send("run_step", {
+            "task": state["task"],
+            "plan": state["plan"],
+            "transcript": state.get("transcript", {}),
+            "step_index": i,
+        })
+        for i in get_ready_steps(state)[:max_concurrency]
+    ]
+
+@functools.cache
+def build_graph(max_concurrency: int = MAX_CONCURRENCY, checkpointer=None):
+    """
+    Plan and execute graph. Steps which dependencies are completed run concurrently,
+    at most max_concurrency of them at a time. With a checkpointer, a run stopped by a crash or
+    timeout is resumed from its last completed steps by invoking its thread again with no input.
+    """
+    return (
         StateGraph(PlanState)
         .add_node("build_initial_plan", _build_initial_plan)
+        .add_node("schedule_steps", _schedule_steps)
         .add_node("run_step", _run_step)
         .add_node("get_final_respons", _get_final_respons)
         .add_edge(START, "build_initial_plan")
-        .add_edge("build_initial_plan", "run_step")
+        .add_edge("build_initial_plan", "schedule_steps")
         .add_conditional_edges(
-            source="run_step", 
-            path=_should_continue, 
-            path_map={
-                "run": "run_step",
-                "final_response": "get_final_respons",
-            }
+            source="schedule_steps",
+            path=lambda state: _dispatch_steps(state, max_concurrency),
+            path_map=["run_step", "get_final_respons"]
         )
+        .add_edge("run_step", "schedule_steps")
         .add_edge("get_final_respons", END)
-        .compile()
+        .compile(checkpointer=checkpointer)
+        # every step takes two graph steps (run_step and schedule_steps)
+        .with_config(recursion_limit=100)
     )
 
-    result = await graph.ainvoke({
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", metavar="THREAD_ID", help="continue the stopped run of the thread")
+    args = parser.parse_args()
+    checkpointer = get_checkpointer()
+    graph = build_graph(checkpointer=checkpointer)
+    thread_id = args.resume or str(uuid.uuid4())
+    config = instrumented(thread_config(thread_id))
+    if args.resume and not (await graph.aget_state(config)).values:
+        parser.error(f"no checkpoint of thread {thread_id}")
+    print(f"Thread {thread_id}, if the run stops continue it with --resume {thread_id}")
+
+    # resumed runs get no input, completed steps come from the checkpoint and are not executed again
+    result = await graph.ainvoke(None if args.resume else {
         "task": "Write a strategic one-pager of building an AI startup"
-    })
+    }, config=config)
     print(result)
+    print(f"Checkpoint writes: {checkpointer.write_latency.summary()}, {checkpointer.bytes_written} bytes")
+    print(f"Tool cache hit rates: {hit_rates(get_tools())}")
+    log_summary()
+    log_route_summary()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
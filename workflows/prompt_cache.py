@@ -0,0 +1,34 @@
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def supports_cache_control(llm: BaseChatModel) -> bool:
+    """Anthropic models need explicit cache_control markers, OpenAI caches long prefixes automatically"""
+    return getattr(llm, "_llm_type", None) == "anthropic-chat"
+
+
+def cached_prefix_prompt(
+    system_prompt: str,
+    context_template: str,
+    variable_template: str,
+    cache_control: bool = False,
+) -> ChatPromptTemplate:
+    """
+    Builds prompt where large static context (e.g. job description and resume) comes right after
+    the system prompt and before any field that changes between loop iterations.
+    This keeps the prompt prefix byte-identical across calls, so provider prompt caching can reuse it.
+    When cache_control is set, the system prompt and static context are marked as cache breakpoints.
+    """
+    system_block = {"type": "text", "text": system_prompt}
+    context_block = {"type": "text", "text": context_template}
+    if cache_control:
+        system_block["cache_control"] = CACHE_CONTROL
+        context_block["cache_control"] = CACHE_CONTROL
+
+    return ChatPromptTemplate.from_messages([
+        ("system", [system_block]),
+        ("user", [context_block, {"type": "text", "text": variable_template}]),
+        ("placeholder", "{messages}")
+    ])
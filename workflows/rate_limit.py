@@ -0,0 +1,438 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import email.utils
+import functools
+import heapq
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+from typing import Iterator, Optional, Tuple
+
+try:
+    # the openai and anthropic SDKs moved to the httpx2 fork, their clients only accept its classes
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+LOGGER = logging.getLogger(__name__)
+
+# lower lanes are admitted first, interactive RAG queries go ahead of queued batch work
+INTERACTIVE = 0
+BATCH = 1
+_lane: contextvars.ContextVar[int] = contextvars.ContextVar("rate_limit_lane", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def lane(priority: int) -> Iterator[None]:
+    """Requests sent inside the block, also from runnables it invokes, are scheduled in this lane"""
+    token = _lane.set(priority)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+@dataclasses.dataclass(frozen=True)
+class Limits:
+    requests_per_minute: float
+    tokens_per_minute: float
+    max_concurrency: int = 16
+
+
+# limits of our account tier per model, requests to other models get DEFAULT_LIMITS
+LIMITS = {
+    "gpt-4o-mini": Limits(5_000, 2_000_000, 32),
+    "gpt-4o": Limits(5_000, 800_000, 16),
+    "text-embedding-3-small": Limits(5_000, 5_000_000, 16),
+    "claude-3-5-haiku-latest": Limits(50, 50_000, 8),
+    "claude-3-5-sonnet-latest": Limits(50, 40_000, 8),
+    "claude-3-7-sonnet-latest": Limits(50, 20_000, 8),
+}
+DEFAULT_LIMITS = Limits(500, 200_000, 8)
+# share of the concurrency batch requests may use, the rest is kept free for interactive ones
+BATCH_SHARE = 0.75
+# a latency above this multiple of the best recent latency is treated as the provider queueing requests
+LATENCY_TOLERANCE = 2.0
+MAX_RETRIES = 4
+MAX_BACKOFF_SECONDS = 30.0
+# 529 is Anthropic's overloaded error
+THROTTLED_STATUS = {429, 529}
+RETRIED_STATUS = {408, 409, 500, 502, 503, 504} | THROTTLED_STATUS
+# async waiters poll instead of blocking a thread while they are queued
+ASYNC_POLL_SECONDS = 0.01
+
+
+class TokenBucket:
+    """Refills rate_per_minute tokens per minute up to one minute's worth"""
+
+    def __init__(self, rate_per_minute: float, now: Optional[float] = None):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken, requests larger than the capacity wait for a full bucket"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float) -> None:
+        # may go below zero for requests larger than the capacity, later requests wait for the debt
+        self._refill(now)
+        self.tokens -= amount
+
+
+class Scheduler:
+    """
+    Admission control for one provider and model, shared by every client in the process.
+    Requests wait in a priority queue, ordered by lane and then arrival, until the request and token
+    buckets allow them and fewer than the concurrency limit are in flight. The limit adapts AIMD-style:
+    it grows by one per window of successful requests, halves on a rate limit error and shrinks when
+    latency climbs, at most once per window. Rate limit errors also pause the queue for Retry-After.
+    """
+
+    def __init__(self, name: str, limits: Limits):
+        self.name = name
+        self.limits = limits
+        self.requests = TokenBucket(limits.requests_per_minute)
+        self.tokens = TokenBucket(limits.tokens_per_minute)
+        self.concurrency = float(max(1, limits.max_concurrency // 2))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = collections.Counter()
+        self._latency: Optional[float] = None
+        self._best_latency: Optional[float] = None
+        # requests started before the last decrease do not decrease again, like TCP once per round trip
+        self._decreased_at = 0.0
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _slots(self, lane: int) -> int:
+        limit = max(1, int(self.concurrency))
+        return limit if lane == INTERACTIVE else max(1, int(limit * BATCH_SHARE))
+
+    def _admit(self, ticket: Tuple[int, int], tokens: int) -> float:
+        """Admits the ticket and returns 0 or returns how long to wait, inf until another request finishes"""
+        if self._queue[0] != ticket:
+            return math.inf
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= self._slots(ticket[0]):
+            return math.inf
+        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+        self.in_flight += 1
+        self.stats["requests"] += 1
+        heapq.heappop(self._queue)
+        # the next ticket may be admitted too
+        self._cond.notify_all()
+        return 0.0
+
+    def _enqueue(self, lane: int) -> Tuple[int, int]:
+        ticket = (lane, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        self._cond.notify_all()
+        return ticket
+
+    def _dequeue(self, ticket: Tuple[int, int]) -> None:
+        # the waiter gave up (cancelled or interrupted) before it was admitted
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def acquire(self, tokens: int, lane: int = INTERACTIVE) -> None:
+        with self._cond:
+            ticket = self._enqueue(lane)
+            try:
+                while (wait := self._admit(ticket, tokens)) > 0:
+                    self._cond.wait(None if wait == math.inf else wait)
+            except BaseException:
+                self._dequeue(ticket)
+                raise
+
+    async def aacquire(self, tokens: int, lane: int = INTERACTIVE) -> None:
+        with self._cond:
+            ticket = self._enqueue(lane)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._admit(ticket, tokens)
+                if wait == 0:
+                    return
+                await asyncio.sleep(min(wait, ASYNC_POLL_SECONDS))
+        except BaseException:
+            with self._cond:
+                self._dequeue(ticket)
+            raise
+
+    def record(self, started: float, status: Optional[int], retry_after: Optional[float] = None) -> None:
+        """Adapts the limits to the response of a request admitted at started, status is None on errors"""
+        now = time.monotonic()
+        latency = now - started
+        with self._cond:
+            if status in THROTTLED_STATUS:
+                self.stats["throttled"] += 1
+                self.paused_until = max(self.paused_until, now + (retry_after or 1.0))
+                self._decrease(started, 0.5)
+                LOGGER.info("%s rate limited, pausing %.1fs, concurrency %d",
+                            self.name, retry_after or 1.0, int(self.concurrency))
+            elif status is not None and status < 400:
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                # the best latency slowly forgets, a single fast response must not pin it forever
+                self._best_latency = latency if self._best_latency is None else min(
+                    latency, self._best_latency + 0.01 * (latency - self._best_latency))
+                if self._latency > LATENCY_TOLERANCE * self._best_latency:
+                    self._decrease(started, 0.8)
+                else:
+                    self.concurrency = min(self.limits.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._cond.notify_all()
+
+    def _decrease(self, started: float, factor: float) -> None:
+        if started > self._decreased_at:
+            self.concurrency = max(1.0, self.concurrency * factor)
+            self._decreased_at = time.monotonic()
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(host: str, model: str) -> Scheduler:
+    with _schedulers_lock:
+        key = (host, model)
+        if key not in _schedulers:
+            _schedulers[key] = Scheduler(f"{host}/{model}", LIMITS.get(model, DEFAULT_LIMITS))
+        return _schedulers[key]
+
+
+def scheduler_stats() -> collections.Counter:
+    """Requests, rate limit errors and retries of all schedulers of the process"""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return sum((scheduler.stats for scheduler in schedulers), collections.Counter())
+
+
+def _estimate_tokens(body) -> int:
+    """Prompt tokens from the request size (about 4 bytes per token) plus the completion tokens it may use"""
+    if not isinstance(body, dict):
+        return 0
+    inputs = body.get("input")
+    if isinstance(inputs, list) and inputs and isinstance(inputs[0], list):
+        # OpenAIEmbeddings sends token ids
+        prompt = sum(len(tokens) for tokens in inputs)
+    else:
+        prompt = len(json.dumps(body.get("messages") or body.get("input") or "")) // 4
+    return prompt + int(body.get("max_tokens") or body.get("max_completion_tokens") or 0)
+
+
+def _schedule(request: httpx.Request) -> Tuple[Scheduler, int]:
+    try:
+        body = json.loads(request.content) if request.content else {}
+    except (httpx.RequestNotRead, ValueError):
+        body = {}
+    model = body.get("model") if isinstance(body, dict) else None
+    return get_scheduler(request.url.host, model or request.url.path), _estimate_tokens(body)
+
+
+def _retry_after(response: httpx.Response, attempt: int) -> float:
+    """Server requested delay, exponential backoff with jitter when it gives none"""
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return min(MAX_BACKOFF_SECONDS, float(headers["retry-after-ms"]) / 1000)
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                seconds = float(value)
+            except ValueError:
+                seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            return min(MAX_BACKOFF_SECONDS, max(0.0, seconds))
+    except (TypeError, ValueError):
+        pass
+    return min(MAX_BACKOFF_SECONDS, 0.5 * 2 ** attempt) * (0.75 + random.random() / 2)
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body that frees the concurrency slot when it is closed, streamed responses hold it until then"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if self._release:
+                self._release, release = None, self._release
+                release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release:
+                self._release, release = None, self._release
+                release()
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    Sends every request through the scheduler of its host and model and retries rate limit, overload and
+    connection errors here, once for the whole process, so clients must be created with max_retries=0.
+    """
+
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None, max_retries: int = MAX_RETRIES):
+        self.transport = transport or httpx.HTTPTransport()
+        self.max_retries = max_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        scheduler, tokens = _schedule(request)
+        priority = _lane.get()
+        for attempt in range(self.max_retries + 1):
+            scheduler.acquire(tokens, priority)
+            started = time.monotonic()
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                scheduler.record(started, None)
+                scheduler.release()
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(MAX_BACKOFF_SECONDS, 0.5 * 2 ** attempt))
+                continue
+            except BaseException:
+                scheduler.release()
+                raise
+            retry = response.status_code in RETRIED_STATUS and attempt < self.max_retries
+            delay = _retry_after(response, attempt) if response.status_code in RETRIED_STATUS else None
+            scheduler.record(started, response.status_code, delay)
+            if not retry:
+                response.stream = _ReleasingStream(response.stream, scheduler.release)
+                return response
+            response.close()
+            scheduler.release()
+            scheduler.stats["retries"] += 1
+            # throttled requests wait in the queue for the pause, other errors back off here
+            if response.status_code not in THROTTLED_STATUS:
+                time.sleep(delay)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """RateLimitedTransport for async clients, queued requests do not block the event loop"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None, max_retries: int = MAX_RETRIES):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.max_retries = max_retries
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        scheduler, tokens = _schedule(request)
+        priority = _lane.get()
+        for attempt in range(self.max_retries + 1):
+            await scheduler.aacquire(tokens, priority)
+            started = time.monotonic()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                scheduler.record(started, None)
+                scheduler.release()
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(min(MAX_BACKOFF_SECONDS, 0.5 * 2 ** attempt))
+                continue
+            except BaseException:
+                scheduler.release()
+                raise
+            retry = response.status_code in RETRIED_STATUS and attempt < self.max_retries
+            delay = _retry_after(response, attempt) if response.status_code in RETRIED_STATUS else None
+            scheduler.record(started, response.status_code, delay)
+            if not retry:
+                response.stream = _AsyncReleasingStream(response.stream, scheduler.release)
+                return response
+            await response.aclose()
+            scheduler.release()
+            scheduler.stats["retries"] += 1
+            if response.status_code not in THROTTLED_STATUS:
+                await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# one connection pool per process for all providers, clients are created on first use
+@functools.cache
+def get_http_client() -> httpx.Client:
+    return httpx.Client(transport=RateLimitedTransport(), timeout=None)
+
+
+@functools.cache
+def get_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=AsyncRateLimitedTransport(), timeout=None)
+
+
+def openai_client_options() -> dict:
+    """ChatOpenAI / OpenAIEmbeddings arguments that send requests through the shared schedulers"""
+    return {"http_client": get_http_client(), "http_async_client": get_async_http_client(), "max_retries": 0}
+
+
+@functools.cache
+def _scheduled_chat_anthropic():
+    import anthropic
+    from langchain_anthropic import ChatAnthropic
+
+    class ScheduledChatAnthropic(ChatAnthropic):
+        # ChatAnthropic takes no http client, its SDK clients are built with the shared ones instead
+        @functools.cached_property
+        def _client(self) -> anthropic.Client:
+            return anthropic.Client(**{**self._client_params, "max_retries": 0, "http_client": get_http_client()})
+
+        @functools.cached_property
+        def _async_client(self) -> anthropic.AsyncClient:
+            return anthropic.AsyncClient(
+                **{**self._client_params, "max_retries": 0, "http_client": get_async_http_client()})
+
+    return ScheduledChatAnthropic
+
+
+def chat_anthropic(**kwargs):
+    """ChatAnthropic whose requests go through the shared schedulers"""
+    return _scheduled_chat_anthropic()(**kwargs)
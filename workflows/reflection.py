@@ -0,0 +1,125 @@
+import difflib
+import logging
+import math
+import operator
+import time
+from dataclasses import asdict, dataclass
+from typing import Annotated, Callable, List, Optional
+
+from langchain_core.callbacks import get_usage_metadata_callback
+from langchain_core.embeddings import Embeddings
+
+LOGGER = logging.getLogger(__name__)
+
+
+def edit_similarity(previous: str, current: str) -> float:
+    """Returns similarity ratio in [0, 1] between two drafts based on edit operations"""
+    return difflib.SequenceMatcher(None, previous, current, autojunk=False).ratio()
+
+
+def embedding_similarity(embeddings: Embeddings) -> Callable[[str, str], float]:
+    """Returns similarity function that compares two drafts with cosine similarity of their embeddings"""
+    def _similarity(previous: str, current: str) -> float:
+        a, b = embeddings.embed_documents([previous, current])
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(x * x for x in b))
+        if norm == 0:
+            return 0.0
+        return sum(x * y for x, y in zip(a, b)) / norm
+    return _similarity
+
+
+@dataclass
+class RoundStats:
+    """Token and latency accounting for a single node call in the reflection loop"""
+    round: int
+    node: str
+    latency: float
+    input_tokens: int
+    output_tokens: int
+    cached_tokens: int = 0
+
+
+# graph state key type of the round stats (as dicts, so checkpoints store them as plain data),
+# every critique and revise call appends its own
+ReflectionStats = Annotated[List[dict], operator.add]
+
+
+@dataclass
+class ReflectionLoop:
+    """
+    Bounded critique -> revise loop.
+
+    Stops when there is no critique, when max_rounds revisions have been made or
+    when successive drafts are at least similarity_threshold similar.
+    Graph state is expected to have `critique`, `revision_round` and `previous_draft` keys
+    alongside the draft itself, and a `reflection_stats` list (see ReflectionStats) collecting
+    the accounting of the run, so concurrent runs of the same loop are accounted separately.
+    """
+    draft_key: str
+    max_rounds: int = 3
+    similarity_threshold: float = 0.95
+    similarity: Callable[[str, str], float] = edit_similarity
+
+    def _accounted(self, name: str, node: Callable, state: dict) -> dict:
+        round_ = state.get("revision_round") or 0
+        with get_usage_metadata_callback() as cb:
+            start = time.perf_counter()
+            result = node(state)
+            latency = time.perf_counter() - start
+        input_tokens = sum(usage.get("input_tokens", 0) for usage in cb.usage_metadata.values())
+        output_tokens = sum(usage.get("output_tokens", 0) for usage in cb.usage_metadata.values())
+        cached_tokens = sum(
+            usage.get("input_token_details", {}).get("cache_read", 0) for usage in cb.usage_metadata.values()
+        )
+        LOGGER.info(
+            f"reflection round {round_} {name}: {latency:.2f}s, "
+            f"{input_tokens} input tokens ({cached_tokens} cached), {output_tokens} output tokens"
+        )
+        stats = RoundStats(round_, name, latency, input_tokens, output_tokens, cached_tokens)
+        return {**result, "reflection_stats": [asdict(stats)]}
+
+    def critique_node(self, node: Callable) -> Callable:
+        """Wraps critique node with per-round token and latency accounting"""
+        def _node(state: dict) -> dict:
+            return self._accounted(node.__name__, node, state)
+        return _node
+
+    def revise_node(self, node: Callable) -> Callable:
+        """Wraps revise node to keep track of the revision round and the draft before revision"""
+        def _node(state: dict) -> dict:
+            result = self._accounted(node.__name__, node, state)
+            return {
+                **result,
+                "revision_round": (state.get("revision_round") or 0) + 1,
+                "previous_draft": state[self.draft_key],
+            }
+        return _node
+
+    def should_revise(self, state: dict) -> bool:
+        if state.get("critique") is None:
+            return False
+        round_ = state.get("revision_round") or 0
+        if round_ >= self.max_rounds:
+            LOGGER.info(f"reflection stopped after reaching max rounds: {self.max_rounds}")
+            return False
+        previous: Optional[str] = state.get("previous_draft")
+        current: Optional[str] = state.get(self.draft_key)
+        if previous is not None and current is not None:
+            score = self.similarity(previous, current)
+            if score >= self.similarity_threshold:
+                LOGGER.info(f"reflection converged at round {round_} with similarity {score:.3f}")
+                return False
+        return True
+
+
+def round_stats(state: dict) -> List[RoundStats]:
+    """Accounting of the critique and revise calls of the run the graph state belongs to"""
+    return [RoundStats(**stats) for stats in state.get("reflection_stats") or []]
+
+
+def total_tokens(state: dict) -> int:
+    return sum(s.input_tokens + s.output_tokens for s in round_stats(state))
+
+
+def total_latency(state: dict) -> float:
+    return sum(s.latency for s in round_stats(state))
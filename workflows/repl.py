@@ -1,12 +1,20 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_experimental.tools import PythonREPLTool
-from langgraph.prebuilt import create_react_agent
 from langgraph.prebuilt.chat_agent_executor import AgentState
 import argparse
+import functools
+from sandbox import PythonSandboxTool, SandboxPool
+from rate_limit import openai_client_options
 
-llm = ChatOpenAI(model="gpt-4o-mini")
-tools = [PythonREPLTool()]
+# client and tools are created on first use, importing this module does no work
+@functools.cache
+def get_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4o-mini", **openai_client_options())
+
+@functools.cache
+def get_tools():
+    # agent code runs in a pool of pre-warmed subprocesses with time and memory limits instead of in-process
+    return [PythonSandboxTool(pool=SandboxPool())]
 
 class CodeAgentState(AgentState):
     question: str 
@@ -30,9 +38,10 @@ def main() -> None:
         ("placeholder", "{messages}")
     ])
 
+    from langgraph.prebuilt import create_react_agent
     agent = create_react_agent(
-        model=llm,
-        tools=tools,
+        model=get_llm(),
+        tools=get_tools(),
         prompt=prompt,
         state_schema=CodeAgentState,
         debug=True,
@@ -1,13 +1,30 @@
-from langchain_anthropic import ChatAnthropic 
+import argparse
+import functools
+import uuid
 from typing import TypedDict, Annotated, Optional
 from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import create_react_agent
-from langchain.agents import load_tools
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
-
-llm = ChatAnthropic(model="claude-3-5-sonnet-latest", temperature=0)
+from reflection import ReflectionLoop, ReflectionStats
+from tool_cache import cached_tools, hit_rates
+from tool_timeouts import with_timeouts
+from checkpointer import get_checkpointer, thread_config
+from prompt_cache import cached_prefix_prompt, supports_cache_control
+from lazy import lazy_runnable
+from instrumentation import instrumented, log_summary
+from rate_limit import chat_anthropic
+from routing import Cascade, log_route_summary, non_empty
+
+# clients, tools, agents and the graph are created on first use, importing this module does no work
+@lazy_runnable
+def llm():
+    return chat_anthropic(model="claude-3-5-sonnet-latest", temperature=0)
+
+# critique passes run on the fast model and escalate to llm when its answer is unusable
+@lazy_runnable
+def fast_llm():
+    return chat_anthropic(model="claude-3-5-haiku-latest", temperature=0)
 
 # High level plan
 # 1. research step for the student
@@ -28,19 +45,28 @@ research_prompt = ChatPromptTemplate.from_messages([
     ("user", "Question: {question}\nOptions: {options}\n"),
     ("placeholder", "{messages}")
 ])
-tools = load_tools(["arxiv", "wikipedia", "ddg-search"])
+
+@functools.cache
+def get_tools():
+    from langchain.agents import load_tools
+    # student and revise agents share the tool cache, so repeated searches across rounds are served from it,
+    # a slow search times out and the step continues with the results of the other tool calls
+    return with_timeouts(cached_tools(load_tools(["arxiv", "wikipedia", "ddg-search"])))
 
 class ResearchState(AgentState):
     """State for the research agent."""
     question: str
     options: list[str]
 
-research_agent = create_react_agent(
-    model=llm,
-    prompt=research_prompt,
-    tools=tools,
-    state_schema=ResearchState,
-)
+@lazy_runnable
+def research_agent():
+    from langgraph.prebuilt import create_react_agent
+    return create_react_agent(
+        model=llm.get(),
+        prompt=research_prompt,
+        tools=get_tools(),
+        state_schema=ResearchState,
+    )
 
 # 2. professor critique the response
 critique_system_prompt = (
@@ -51,17 +77,23 @@ critique_system_prompt = (
     "Return the original response and no critique if the student's response is correct."
 )
 
-critique_prompt = ChatPromptTemplate.from_messages([
-    ("system", critique_system_prompt),
-    ("user", "Question: {question}\nOptions: {options}\nStudent Response: {response}\n"),
-    ("placeholder", "{messages}")
-])
-
 class CritiqueResponse(BaseModel):
     critique: Optional[str] = Field(description="The critique of the student's response", default=None)
     answer: Optional[str] = Field(description="Student's answer to the question", default=None)
 
-critique_chain = (critique_prompt | llm.with_structured_output(CritiqueResponse))
+@lazy_runnable
+def critique_chain():
+    # question and options stay the same across critique rounds, keep them in the cached prompt prefix
+    critique_prompt = cached_prefix_prompt(
+        critique_system_prompt,
+        "Question: {question}\nOptions: {options}\n",
+        "Student Response: {response}\n",
+        cache_control=supports_cache_control(llm.get()),
+    )
+    # an answer without critique and without the student's answer is unusable
+    return critique_prompt | Cascade(
+        "research_critique", [fast_llm.get(), llm.get()], CritiqueResponse, non_empty("critique", "answer")
+    )
 
 # 3. student revise the response based on the critique
 class ReviseResponse(ResearchState):
@@ -78,18 +110,27 @@ revise_research_prompt = ChatPromptTemplate.from_messages([
     ("user", "Question: {question}\nOptions: {options}\nCritique: {critique}\nStudent Response: {response}\n"),
     ("placeholder", "{messages}")
 ])
-revise_research_agent = create_react_agent(
-    model=llm,
-    prompt=revise_research_prompt,
-    tools=tools,
-    state_schema=ReviseResponse,
-)
+
+@lazy_runnable
+def revise_research_agent():
+    from langgraph.prebuilt import create_react_agent
+    return create_react_agent(
+        model=llm.get(),
+        prompt=revise_research_prompt,
+        tools=get_tools(),
+        state_schema=ReviseResponse,
+    )
 
 class ResearchGraphState(TypedDict):
     question: str 
     options: str
     critique: Optional[str]
     response: Optional[str]
+    revision_round: int
+    previous_draft: Optional[str]
+    reflection_stats: ReflectionStats
+
+research_reflection = ReflectionLoop(draft_key="response", max_rounds=3)
 
 def _research_node(state: ResearchGraphState) -> ResearchGraphState:
     result = research_agent.invoke(state)
@@ -117,27 +158,50 @@ def _revise_node(state: ResearchGraphState) -> ResearchGraphState:
     }
 
 def _should_end(state: ResearchGraphState):
-    if state["critique"] is not None:
+    if research_reflection.should_revise(state):
         return "revise"
     return "end"
 
-graph = (
-    StateGraph(ResearchGraphState)
-    .add_node("research_node", _research_node)
-    .add_node("critique_node", _critique_node)
-    .add_node("revise_node", _revise_node)
-    .add_edge(START, "research_node")
-    .add_edge("research_node", "critique_node")
-    .add_conditional_edges("critique_node", _should_end, {
-        "revise": "revise_node",
-        "end": END
-    })
-    .add_edge("revise_node", "critique_node")
-    .compile()
-)
-
-for _, event in graph.stream({
-    "question": "The main factor preventing subsistence economies from advancing economically is the lack of",
-    "options": '1: a currency.\n2: a well-connected transportation infrastructure.\n3: government activity.\n4: a banking service.'
-}, stream_mode=["updates"]):
-    print(event)
\ No newline at end of file
+@functools.cache
+def get_graph(checkpointer=None):
+    # with a checkpointer a stopped run continues from its last completed node
+    return (
+        StateGraph(ResearchGraphState)
+        .add_node("research_node", _research_node)
+        .add_node("critique_node", research_reflection.critique_node(_critique_node))
+        .add_node("revise_node", research_reflection.revise_node(_revise_node))
+        .add_edge(START, "research_node")
+        .add_edge("research_node", "critique_node")
+        .add_conditional_edges("critique_node", _should_end, {
+            "revise": "revise_node",
+            "end": END
+        })
+        .add_edge("revise_node", "critique_node")
+        .compile(checkpointer=checkpointer)
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", metavar="THREAD_ID", help="continue the stopped run of the thread")
+    args = parser.parse_args()
+    checkpointer = get_checkpointer()
+    graph = get_graph(checkpointer)
+    thread_id = args.resume or str(uuid.uuid4())
+    config = instrumented(thread_config(thread_id))
+    if args.resume and not graph.get_state(config).values:
+        parser.error(f"no checkpoint of thread {thread_id}")
+    print(f"Thread {thread_id}, if the run stops continue it with --resume {thread_id}")
+
+    # resumed runs get no input, completed nodes come from the checkpoint and are not executed again
+    for _, event in graph.stream(None if args.resume else {
+        "question": "The main factor preventing subsistence economies from advancing economically is the lack of",
+        "options": '1: a currency.\n2: a well-connected transportation infrastructure.\n3: government activity.\n4: a banking service.'
+    }, config=config, stream_mode=["updates"]):
+        print(event)
+    print(f"Checkpoint writes: {checkpointer.write_latency.summary()}, {checkpointer.bytes_written} bytes")
+    print(f"Tool cache hit rates: {hit_rates(get_tools())}")
+    log_summary()
+    log_route_summary()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from instrumentation import LatencyHistogram, cost
+
+LOGGER = logging.getLogger(__name__)
+
+
+def model_name(llm: BaseChatModel) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+@dataclass
+class RouteStats:
+    """Calls, escalations, latency, tokens and cost of one model in one cascade"""
+    calls: int = 0
+    # outputs rejected by validation or `accept` and passed on to the next model
+    escalated: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "escalated": self.escalated,
+            "errors": self.errors,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost": self.cost,
+            **self.latency.summary(),
+        }
+
+
+_stats: Dict[str, RouteStats] = {}
+_stats_lock = threading.Lock()
+
+
+def _usage(output: Any) -> dict:
+    message = output.get("raw") if isinstance(output, dict) else output
+    return (getattr(message, "usage_metadata", None) if isinstance(message, AIMessage) else None) or {}
+
+
+class Cascade(Runnable):
+    """
+    Runs a prompt's messages on the cheapest model first and passes them on to the next, stronger model
+    only when the answer is not usable: the structured output failed schema validation or `accept`
+    rejected it. The last model's answer is returned as it is, except that a structured output it
+    failed to parse raises like the plain `with_structured_output` chain does. Errors of a call
+    (rate limits, overload, timeouts) are raised without escalating, the shared scheduler retries them.
+    Every (cascade, model) route records calls, escalations, latency and cost in the route statistics.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        # cheapest first
+        models: Sequence[BaseChatModel],
+        schema: Optional[Any] = None,
+        accept: Optional[Callable[[Any], bool]] = None,
+    ):
+        self.name = name
+        self.schema = schema
+        self.accept = accept
+        self.routes = [
+            (model_name(llm), llm.with_structured_output(schema, include_raw=True) if schema else llm)
+            for llm in models
+        ]
+
+    def _result(self, output: Any) -> tuple[Any, bool]:
+        """Answer in the shape of the single model chain and whether it can be used"""
+        if self.schema is not None:
+            answer = output["parsed"]
+            if output.get("parsing_error") is not None or answer is None:
+                return answer, False
+        else:
+            answer = output
+            if not str(answer.content).strip():
+                return answer, False
+        return answer, self.accept is None or self.accept(answer)
+
+    def _last_answer(self, output: Any, answer: Any) -> Any:
+        if self.schema is not None and answer is None:
+            raise output.get("parsing_error") or OutputParserException(
+                f"{self.name}: no structured output in the answer", llm_output=str(output["raw"].content)
+            )
+        return answer
+
+    def _record(self, model: str, started: float, output: Any = None, escalated: bool = False,
+                error: bool = False) -> None:
+        usage = _usage(output)
+        input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        with _stats_lock:
+            stats = _stats.setdefault(f"{self.name}:{model}", RouteStats())
+            stats.calls += 1
+            stats.escalated += int(escalated)
+            stats.errors += int(error)
+            stats.input_tokens += input_tokens
+            stats.output_tokens += output_tokens
+            stats.cost += cost(model, input_tokens, output_tokens)
+            stats.latency.record((time.perf_counter() - started) * 1000)
+
+    def _escalate(self, model: str, reason: str) -> None:
+        LOGGER.info(f"{self.name}: escalating from {model}, {reason}")
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        for position, (model, runnable) in enumerate(self.routes):
+            last = position == len(self.routes) - 1
+            started = time.perf_counter()
+            try:
+                output = runnable.invoke(input, config, **kwargs)
+            except Exception:
+                # parse failures come back in the output, errors of the call itself (rate limits, overload,
+                # timeouts) are not the answer's fault and a stronger model would not fix them
+                self._record(model, started, error=True)
+                raise
+            answer, usable = self._result(output)
+            self._record(model, started, output, escalated=not (usable or last))
+            if last:
+                return self._last_answer(output, answer)
+            if usable:
+                return answer
+            self._escalate(model, "answer rejected")
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        for position, (model, runnable) in enumerate(self.routes):
+            last = position == len(self.routes) - 1
+            started = time.perf_counter()
+            try:
+                output = await runnable.ainvoke(input, config, **kwargs)
+            except Exception:
+                # parse failures come back in the output, errors of the call itself (rate limits, overload,
+                # timeouts) are not the answer's fault and a stronger model would not fix them
+                self._record(model, started, error=True)
+                raise
+            answer, usable = self._result(output)
+            self._record(model, started, output, escalated=not (usable or last))
+            if last:
+                return self._last_answer(output, answer)
+            if usable:
+                return answer
+            self._escalate(model, "answer rejected")
+
+
+def non_empty(*fields: str) -> Callable[[Any], bool]:
+    """Accepts structured answers where at least one of the fields is not empty or blank"""
+    def _accept(answer: Any) -> bool:
+        values = [getattr(answer, name, None) for name in fields]
+        return any(value.strip() if isinstance(value, str) else value for value in values)
+    return _accept
+
+
+def route_summary() -> Dict[str, dict]:
+    with _stats_lock:
+        return {route: stats.summary() for route, stats in sorted(_stats.items())}
+
+
+def log_route_summary() -> None:
+    if _stats:
+        LOGGER.info(f"routing summary: {json.dumps(route_summary())}")
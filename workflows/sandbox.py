@@ -0,0 +1,225 @@
+import json
+import os
+import queue
+import re
+import selectors
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Iterator, Optional, Sequence
+
+from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from pydantic import ConfigDict
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+# modules imported once per worker and reused by every call
+DEFAULT_PRELOAD = ("math", "json", "numpy", "pandas")
+# time a new worker gets to import the preloaded modules
+STARTUP_TIMEOUT = 60.0
+# the only variables workers get from the parent environment, API keys and the like stay out
+WORKER_ENV_KEYS = ("PATH", "LANG", "LC_ALL", "LC_CTYPE", "TZ", "SYSTEMROOT")
+
+
+class SandboxError(Exception):
+    pass
+
+
+class SandboxTimeout(SandboxError):
+    pass
+
+
+class SandboxMemoryLimit(SandboxError):
+    pass
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of the process, None where /proc is not available"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SandboxWorker:
+    """Pre-warmed python subprocess that executes code sent to it one call at a time"""
+
+    def __init__(self, preload: Sequence[str] = DEFAULT_PRELOAD, max_rss: Optional[int] = None):
+        # each worker runs in its own empty directory instead of the repo
+        self.directory = tempfile.mkdtemp(prefix="sandbox-")
+        env = {key: os.environ[key] for key in WORKER_ENV_KEYS if key in os.environ}
+        env.update(HOME=self.directory, TMPDIR=self.directory)
+        if max_rss is not None:
+            env["SANDBOX_MAX_MEMORY"] = str(max_rss)
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", WORKER_SCRIPT, *preload],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+            cwd=self.directory,
+            env=env,
+        )
+        self.calls = 0
+        self._ready = False
+        # output is read from the pipe directly, buffered reader would hide pending lines from select
+        self._buffer = b""
+
+    def _read_message(self, deadline: float, max_rss: Optional[int]) -> dict:
+        selector = selectors.DefaultSelector()
+        selector.register(self.process.stdout, selectors.EVENT_READ)
+        try:
+            while b"\n" not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.kill()
+                    raise SandboxTimeout("execution timed out")
+                # fallback where the worker could not limit its address space, sampled on every read too,
+                # code that keeps printing never lets select time out
+                if max_rss is not None:
+                    rss = _rss_bytes(self.process.pid)
+                    if rss is not None and rss > max_rss:
+                        self.kill()
+                        raise SandboxMemoryLimit(f"memory limit of {max_rss // 2**20} MB exceeded")
+                if selector.select(timeout=min(remaining, 0.05)):
+                    data = os.read(self.process.stdout.fileno(), 65536)
+                    if not data:
+                        raise SandboxError("worker exited unexpectedly")
+                    self._buffer += data
+        finally:
+            selector.close()
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def wait_ready(self) -> None:
+        if not self._ready:
+            message = self._read_message(time.monotonic() + STARTUP_TIMEOUT, None)
+            if message["type"] != "ready":
+                raise SandboxError(f"unexpected message from worker: {message}")
+            self._ready = True
+
+    def execute(self, code: str, timeout: float, max_rss: Optional[int] = None) -> Iterator[str]:
+        """Runs code in the worker and yields its output as it is printed"""
+        self.wait_ready()
+        self.calls += 1
+        deadline = time.monotonic() + timeout
+        self.process.stdin.write((json.dumps({"code": code}) + "\n").encode("utf-8"))
+        while True:
+            message = self._read_message(deadline, max_rss)
+            if message["type"] == "output":
+                yield message["data"]
+            elif message["type"] == "done":
+                if message["error"]:
+                    yield message["error"]
+                return
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SandboxPool:
+    """
+    Pool of pre-warmed worker processes for executing untrusted python code.
+    Each call gets a wall-clock timeout and memory limit, a worker that breaks either of them is killed
+    and replaced. The memory limit is enforced in the worker with RLIMIT_AS (inherited by processes
+    the code starts), the parent polls the worker RSS as a fallback. Preloaded modules stay imported in the workers, so calls don't pay for the imports.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        timeout: float = 30.0,
+        max_rss_mb: Optional[int] = 1024,
+        preload: Sequence[str] = DEFAULT_PRELOAD,
+        max_calls_per_worker: int = 100,
+    ):
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 2**20 if max_rss_mb is not None else None
+        self.preload = tuple(preload)
+        self.max_calls_per_worker = max_calls_per_worker
+        self._idle: queue.Queue[SandboxWorker] = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [SandboxWorker(self.preload, self.max_rss) for _ in range(size)]
+        for worker in self._workers:
+            self._idle.put(worker)
+
+    def _replace(self, worker: SandboxWorker) -> SandboxWorker:
+        worker.kill()
+        new_worker = SandboxWorker(self.preload, self.max_rss)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = new_worker
+        return new_worker
+
+    def execute_stream(self, code: str, timeout: Optional[float] = None) -> Iterator[str]:
+        """Runs code on an idle worker and yields output incrementally"""
+        if self._closed:
+            raise SandboxError("sandbox pool is closed")
+        timeout = timeout if timeout is not None else self.timeout
+        worker = self._idle.get()
+        completed = False
+        try:
+            yield from worker.execute(code, timeout, self.max_rss)
+            completed = True
+        except SandboxError as e:
+            yield f"{type(e).__name__}: {e}\n"
+        finally:
+            # timed out, out of memory or abandoned mid-stream workers are in an unknown state
+            if not completed or not worker.alive() or worker.calls >= self.max_calls_per_worker:
+                worker = self._replace(worker)
+            self._idle.put(worker)
+
+    def execute(self, code: str, timeout: Optional[float] = None) -> str:
+        return "".join(self.execute_stream(code, timeout))
+
+    def close(self) -> None:
+        self._closed = True
+        with self._lock:
+            for worker in self._workers:
+                worker.kill()
+
+    def __enter__(self) -> "SandboxPool":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def sanitize_input(query: str) -> str:
+    """Removes whitespace, backtick & python from the code the llm produced (same as PythonREPLTool)"""
+    query = re.sub(r"^(\s|`)*(?i:python)?\s*", "", query)
+    return re.sub(r"(\s|`)*$", "", query)
+
+
+class PythonSandboxTool(BaseTool):
+    """Drop-in replacement of PythonREPLTool that runs code in the sandbox pool instead of in-process"""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    name: str = "Python_REPL"
+    description: str = (
+        "A Python shell. Use this to execute python commands. "
+        "Input should be a valid python command. "
+        "If you want to see the output of a value, you should print it out with `print(...)`. "
+        "Variables are not kept between calls, every command has to be self contained."
+    )
+    pool: SandboxPool
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        chunks = []
+        for chunk in self.pool.execute_stream(sanitize_input(query)):
+            chunks.append(chunk)
+            if run_manager:
+                run_manager.on_text(chunk)
+        return "".join(chunks)
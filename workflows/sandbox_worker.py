@@ -0,0 +1,80 @@
+"""
+Worker process of the python sandbox pool, see sandbox.py.
+
+Reads one JSON request {"code": ...} per line from stdin and answers with JSON lines on the
+original stdout: {"type": "output", "data": ...} while the code runs and {"type": "done", "error": ...}
+when it finishes. Modules given on the command line are imported once at start up and stay
+imported for every following call, each call runs in a fresh namespace.
+With SANDBOX_MAX_MEMORY set, the address space is limited to that many bytes on top of what the
+preloaded modules use, allocations past it raise MemoryError in the worker and its child processes.
+"""
+import importlib
+import io
+import json
+import os
+import sys
+import traceback
+
+
+def _limit_memory(max_bytes):
+    try:
+        import resource
+
+        with open("/proc/self/statm") as f:
+            size = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        resource.setrlimit(resource.RLIMIT_AS, (size + max_bytes, size + max_bytes))
+    except (ImportError, OSError, ValueError):
+        # no resource module or /proc, the parent still polls the RSS
+        pass
+
+
+class _StreamWriter(io.TextIOBase):
+    """Forwards everything the executed code prints to the parent as output messages"""
+
+    def __init__(self, send):
+        self.send = send
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if data:
+            self.send({"type": "output", "data": data})
+        return len(data)
+
+
+def main():
+    # protocol messages get their own copy of stdout, anything written to fd 1 directly
+    # (e.g. by C extensions or child processes) is sent to stderr instead
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+
+    def send(message):
+        protocol.write(json.dumps(message) + "\n")
+        protocol.flush()
+
+    for module in sys.argv[1:]:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+    if os.environ.get("SANDBOX_MAX_MEMORY"):
+        _limit_memory(int(os.environ["SANDBOX_MAX_MEMORY"]))
+
+    writer = _StreamWriter(send)
+    sys.stdout = writer
+    sys.stderr = writer
+    send({"type": "ready"})
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        error = None
+        try:
+            exec(compile(request["code"], "<sandbox>", "exec"), {"__name__": "__main__"})
+        except BaseException:
+            error = traceback.format_exc()
+        send({"type": "done", "error": error})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+import pathlib
+import tempfile
+import unittest
+from typing import TypedDict
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langgraph.graph import StateGraph, START, END
+
+from checkpointer import SqliteCheckpointer, thread_config
+from plan import Plan, build_graph
+from test_plan import FakeExecutorAgent, FakePlanner
+
+
+class FailingExecutorAgent(FakeExecutorAgent):
+    """Executor agent that fails the first time it runs the given step"""
+
+    def __init__(self, failing_step: str):
+        super().__init__(latency=0.01)
+        self.failing_step = failing_step
+
+    async def ainvoke(self, inputs):
+        if inputs["step"] == self.failing_step:
+            self.failing_step = None
+            raise TimeoutError("step timed out")
+        return await super().ainvoke(inputs)
+
+
+class CounterState(TypedDict):
+    count: int
+
+
+class TestSqliteCheckpointer(unittest.TestCase):
+    """Test resuming graphs from a SQLite checkpoint"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(pathlib.Path(directory.name) / "checkpoints.sqlite")
+        self.checkpointer = SqliteCheckpointer(self.path)
+        self.addCleanup(self.checkpointer.close)
+
+    def test_plan_resumes_after_failed_step(self):
+        plan = Plan(steps=[f"step {i}" for i in range(10)])
+        executor = FailingExecutorAgent("step 6")
+        config = thread_config("plan-1")
+        with patch("plan.planner", FakePlanner(plan)), \
+                patch("plan.executor_agent", executor), \
+                patch("plan.llm", FakeListChatModel(responses=["final answer"])):
+            graph = build_graph(checkpointer=self.checkpointer)
+            with self.assertRaises(TimeoutError):
+                asyncio.run(graph.ainvoke({"task": "research task"}, config=config))
+            self.assertEqual(len(executor.calls), 6)
+            # a new process reads the same file
+            resumed = SqliteCheckpointer(self.path)
+            self.addCleanup(resumed.close)
+            result = asyncio.run(build_graph(checkpointer=resumed).ainvoke(None, config=config))
+        self.assertEqual(result["final_response"], "final answer")
+        self.assertEqual(len(result["past_steps"]), 10)
+        # steps 0-5 were not executed again
+        self.assertEqual([call["step"] for call in executor.calls], [f"step {i}" for i in range(10)])
+        summary = self.checkpointer.write_latency.summary()
+        print(f"\ncheckpoint writes of a 10 step plan: {summary['count']} commits, "
+              f"p50 {summary['p50_ms']:.2f} ms, p99 {summary['p99_ms']:.2f} ms, {self.checkpointer.bytes_written} bytes")
+        self.assertLess(summary["p50_ms"], 5)
+
+    def test_history_and_delete(self):
+        graph = (
+            StateGraph(CounterState)
+            .add_node("increment", lambda state: {"count": state["count"] + 1})
+            .add_edge(START, "increment")
+            .add_edge("increment", END)
+            .compile(checkpointer=self.checkpointer)
+        )
+        config = thread_config("counter")
+        self.assertEqual(graph.invoke({"count": 1}, config)["count"], 2)
+        self.assertEqual(graph.invoke({"count": 5}, config)["count"], 6)
+        history = list(self.checkpointer.list(config))
+        self.assertEqual(history[0].checkpoint["channel_values"]["count"], 6)
+        self.assertEqual(history[0].parent_config["configurable"]["checkpoint_id"],
+                         history[1].config["configurable"]["checkpoint_id"])
+        self.assertEqual(len(list(self.checkpointer.list(config, limit=2))), 2)
+        self.checkpointer.delete_thread("counter")
+        self.assertIsNone(self.checkpointer.get_tuple(config))
+
+
+if __name__ == "__main__":
+    unittest.main()
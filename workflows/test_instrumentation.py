@@ -0,0 +1,125 @@
+import asyncio
+import io
+import json
+import time
+import unittest
+from typing import TypedDict
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.graph import StateGraph, START, END
+from instrumentation import InstrumentationHandler, LatencyHistogram, cost
+from rate_limit import get_scheduler
+
+
+class State(TypedDict):
+    question: str
+    answer: str
+
+
+def _fake_llm(n: int) -> GenericFakeChatModel:
+    return GenericFakeChatModel(messages=iter([
+        AIMessage("answer", usage_metadata={
+            "input_tokens": 100,
+            "output_tokens": 10,
+            "total_tokens": 110,
+            "input_token_details": {"cache_read": 60},
+        })
+        for _ in range(n)
+    ]))
+
+
+def _graph(llm: GenericFakeChatModel):
+    def retrieve(state: State):
+        time.sleep(0.01)
+        return {}
+
+    def generate(state: State):
+        return {"answer": llm.invoke(state["question"]).content}
+
+    return (
+        StateGraph(State)
+        .add_sequence([retrieve, generate])
+        .add_edge(START, "retrieve")
+        .add_edge("generate", END)
+        .compile()
+    )
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    """Test histogram percentiles"""
+
+    def test_percentiles(self):
+        hist = LatencyHistogram()
+        for latency in range(1, 101):
+            hist.record(float(latency))
+        summary = hist.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertAlmostEqual(summary["mean_ms"], 50.5)
+        # percentiles are accurate to the 5% bucket width
+        self.assertAlmostEqual(summary["p50_ms"], 50, delta=50 * 0.06)
+        self.assertAlmostEqual(summary["p95_ms"], 95, delta=95 * 0.06)
+        self.assertAlmostEqual(summary["p99_ms"], 99, delta=99 * 0.06)
+
+    def test_empty(self):
+        self.assertEqual(LatencyHistogram().percentile(99), 0.0)
+
+
+class TestInstrumentationHandler(unittest.TestCase):
+    """Test node and llm call instrumentation on a graph with fake llm"""
+
+    def test_records(self):
+        sink = io.StringIO()
+        handler = InstrumentationHandler(sink)
+        _graph(_fake_llm(1)).invoke({"question": "q"}, config={"callbacks": [handler]})
+
+        records = [json.loads(line) for line in sink.getvalue().splitlines()]
+        nodes = [r for r in records if r["type"] == "node"]
+        llm_calls = [r for r in records if r["type"] == "llm"]
+        self.assertEqual([r["name"] for r in nodes], ["retrieve", "generate"])
+        self.assertGreaterEqual(nodes[0]["latency_ms"], 10)
+        self.assertEqual(len(llm_calls), 1)
+        self.assertEqual(llm_calls[0]["node"], "generate")
+        self.assertEqual(llm_calls[0]["input_tokens"], 100)
+        self.assertEqual(llm_calls[0]["output_tokens"], 10)
+        self.assertTrue(llm_calls[0]["cache_hit"])
+
+    def test_summary_async(self):
+        handler = InstrumentationHandler()
+        graph = _graph(_fake_llm(5))
+
+        async def _run():
+            for _ in range(5):
+                await graph.ainvoke({"question": "q"}, config={"callbacks": [handler]})
+
+        asyncio.run(_run())
+        summary = handler.summary()
+        self.assertEqual(summary["totals"]["input_tokens"], 500)
+        self.assertEqual(summary["totals"]["cached_tokens"], 300)
+        self.assertEqual(summary["latency"]["node:retrieve"]["count"], 5)
+        self.assertGreater(summary["latency"]["node:retrieve"]["p50_ms"], 9)
+
+    def test_errors(self):
+        handler = InstrumentationHandler()
+
+        def failing(state: State):
+            raise ValueError("boom")
+
+        graph = StateGraph(State).add_node("failing", failing).add_edge(START, "failing").compile()
+        with self.assertRaises(ValueError):
+            graph.invoke({"question": "q"}, config={"callbacks": [handler]})
+        self.assertEqual(handler.summary()["totals"]["errors"], 1)
+
+    def test_retries_of_rate_limited_transport(self):
+        handler = InstrumentationHandler()
+        retries = handler.summary()["totals"]["retries"]
+        get_scheduler("api.test", "test-model").stats["retries"] += 2
+        self.assertEqual(handler.summary()["totals"]["retries"], retries + 2)
+
+    def test_cost(self):
+        self.assertAlmostEqual(cost("gpt-4o-mini", 1_000_000, 1_000_000), 0.75)
+        self.assertEqual(cost("unknown-model", 1000, 1000), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import pathlib
+import sys
+import unittest
+
+from job_ranking import html_to_text, job_text, rank_by_similarity, MAX_JOB_CHARS
+
+# fake embeddings of the benchmarks
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+from fakes import HashEmbeddings, fake_text  # noqa: E402
+
+
+class CountingEmbeddings(HashEmbeddings):
+    """Hash embeddings counting the embedded texts"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.queries = 0
+        self.documents = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+class TestJobRanking(unittest.TestCase):
+    """Test ranking job posts by similarity to the resume"""
+
+    def setUp(self):
+        self.embeddings = CountingEmbeddings()
+        self.resume = "machine learning engineer pytorch distributed training inference"
+        self.texts = [fake_text(50, "job", i) for i in range(200)]
+        self.texts[137] = "machine learning engineer training pytorch models"
+        self.texts[42] = "research engineer distributed inference " + fake_text(20, "job", 42)
+
+    def test_closest_jobs_first(self):
+        ranked = rank_by_similarity(self.embeddings, self.resume, self.texts, list(range(200)), 5)
+        self.assertEqual([i for _, i in ranked][:2], [137, 42])
+        self.assertEqual(len(ranked), 5)
+        scores = [score for score, _ in ranked]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        # resume once, every job post once
+        self.assertEqual((self.embeddings.queries, self.embeddings.documents), (1, 200))
+
+    def test_top_n_larger_than_jobs(self):
+        self.assertEqual(len(rank_by_similarity(self.embeddings, self.resume, self.texts[:3], [0, 1, 2], 10)), 3)
+        self.assertEqual(rank_by_similarity(self.embeddings, self.resume, [], [], 10), [])
+        self.assertEqual(self.embeddings.queries, 1)
+
+    def test_job_text(self):
+        content = "&lt;p&gt;Train &amp;amp; serve &lt;b&gt;models&lt;/b&gt;&lt;/p&gt;"
+        self.assertEqual(html_to_text(content), "Train & serve models")
+        self.assertEqual(len(job_text("ML Engineer", "x" * 10_000)), MAX_JOB_CHARS)
+
+
+if __name__ == "__main__":
+    unittest.main()
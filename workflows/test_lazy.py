@@ -0,0 +1,44 @@
+import asyncio
+import unittest
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import PromptTemplate
+from lazy import lazy_runnable
+
+
+class TestLazyRunnable(unittest.TestCase):
+    """Test lazily built runnables"""
+
+    def setUp(self):
+        self.builds = 0
+
+        @lazy_runnable
+        def llm():
+            self.builds += 1
+            return FakeListChatModel(responses=["hello"])
+
+        self.llm = llm
+
+    def test_not_built_until_used(self):
+        self.assertEqual(self.builds, 0)
+        self.assertEqual(self.llm.invoke("hi").content, "hello")
+        self.assertEqual(self.llm.invoke("hi").content, "hello")
+        self.assertEqual(self.builds, 1)
+
+    def test_composes_with_prompts(self):
+        chain = PromptTemplate.from_template("say {word}") | self.llm
+        self.assertEqual(self.builds, 0)
+        self.assertEqual(asyncio.run(chain.ainvoke({"word": "hello"})).content, "hello")
+
+    def test_forwards_attributes(self):
+        self.assertEqual(self.llm.responses, ["hello"])
+        self.assertIs(self.llm.get(), self.llm.get())
+
+    def test_patchable_without_building(self):
+        # mock.patch inspects the original object, e.g. asyncio.iscoroutinefunction looks up _is_coroutine
+        self.assertFalse(asyncio.iscoroutinefunction(self.llm))
+        self.assertEqual(self.builds, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
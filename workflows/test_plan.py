@@ -0,0 +1,154 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from plan import (
+    Plan,
+    build_graph,
+    get_full_plan,
+    get_ready_steps,
+    get_step_dependencies,
+    render_step,
+    truncate_to_tokens,
+    estimate_tokens,
+    _merge_past_steps,
+)
+
+# simulated latency of a single tool-using executor step
+STEP_LATENCY = 0.2
+
+
+class FakePlanner:
+    def __init__(self, plan: Plan):
+        self.plan = plan
+
+    async def ainvoke(self, inputs):
+        return self.plan
+
+
+class FakeExecutorAgent:
+    """Executor agent that waits as a tool call would and answers with the step it was given"""
+
+    def __init__(self, latency: float = STEP_LATENCY):
+        self.latency = latency
+        self.calls = []
+
+    async def ainvoke(self, inputs):
+        self.calls.append(inputs)
+        await asyncio.sleep(self.latency)
+        return {"messages": [AIMessage(f"result of {inputs['step']} " + "details " * 100)]}
+
+
+def _run(plan: Plan, max_concurrency: int = 4, latency: float = STEP_LATENCY):
+    executor = FakeExecutorAgent(latency)
+    with patch("plan.planner", FakePlanner(plan)), \
+            patch("plan.executor_agent", executor), \
+            patch("plan.llm", FakeListChatModel(responses=["final answer"])):
+        start = time.perf_counter()
+        result = asyncio.run(build_graph(max_concurrency).ainvoke({"task": "research task"}))
+        elapsed = time.perf_counter() - start
+    return result, executor, elapsed
+
+
+SEARCHES = ["search arxiv", "search wikipedia", "search web", "search news"]
+
+
+class TestStepDependencies(unittest.TestCase):
+    """Test dependency DAG handling"""
+
+    def test_sequential_without_dependencies(self):
+        plan = Plan(steps=["a", "b", "c"])
+        self.assertEqual(get_step_dependencies(plan), [set(), {0}, {1}])
+
+    def test_invalid_dependencies_are_dropped(self):
+        # forward and self references would make the plan impossible to finish
+        plan = Plan(steps=["a", "b", "c"], dependencies=[[2], [1, 2], [1, 7]])
+        self.assertEqual(get_step_dependencies(plan), [set(), {0}, {0}])
+
+    def test_ready_steps(self):
+        plan = Plan(steps=["a", "b", "c"], dependencies=[[], [], [1, 2]])
+        self.assertEqual(get_ready_steps({"plan": plan, "past_steps": {}}), [0, 1])
+        self.assertEqual(get_ready_steps({"plan": plan, "past_steps": {1: "b"}}), [0])
+        self.assertEqual(get_ready_steps({"plan": plan, "past_steps": {0: "a", 1: "b"}}), [2])
+
+    def test_merge_past_steps_is_ordered(self):
+        self.assertEqual(list(_merge_past_steps({2: "c"}, {1: "b", 0: "a"})), [0, 1, 2])
+
+
+class TestParallelExecution(unittest.TestCase):
+    """Compare wall-clock time of parallel and sequential plan execution"""
+
+    def test_sequential_plan(self):
+        result, executor, elapsed = _run(Plan(steps=SEARCHES + ["summarize"]))
+        self.assertEqual(len(executor.calls), 5)
+        self.assertGreaterEqual(elapsed, 5 * STEP_LATENCY)
+        self.assertEqual(result["final_response"], "final answer")
+
+    def test_parallel_plan(self):
+        plan = Plan(steps=SEARCHES + ["summarize"], dependencies=[[], [], [], [], [1, 2, 3, 4]])
+        _, _, sequential = _run(Plan(steps=plan.steps))
+        result, executor, parallel = _run(plan)
+
+        # 4 independent searches run in one round, then the summary
+        self.assertLess(parallel, 3 * STEP_LATENCY)
+        self.assertLess(parallel, sequential / 2)
+        self.assertEqual(list(result["past_steps"]), [0, 1, 2, 3, 4])
+        self.assertTrue(result["past_steps"][2].startswith("result of search web"))
+        # final step sees results of all searches
+        self.assertIn("result of search news", executor.calls[-1]["plan"])
+
+    def test_concurrency_limit(self):
+        plan = Plan(steps=SEARCHES, dependencies=[[], [], [], []])
+        result, _, elapsed = _run(plan, max_concurrency=2)
+        self.assertGreaterEqual(elapsed, 2 * STEP_LATENCY)
+        self.assertLess(elapsed, 3 * STEP_LATENCY)
+        self.assertEqual(len(result["past_steps"]), 4)
+
+
+class TestPlanRendering(unittest.TestCase):
+    """Test incremental plan transcript rendering"""
+
+    def test_full_plan_rendering(self):
+        plan = Plan(steps=["a", "b"])
+        full_plan = get_full_plan({"plan": plan, "transcript": {1: render_step(1, "b", "done")}})
+        self.assertEqual(full_plan, "#1. Planned step: a\n\n#2. Planned step: b\nResult: done\n")
+
+    def test_truncate_to_tokens(self):
+        self.assertEqual(truncate_to_tokens("short", 10), "short")
+        self.assertEqual(truncate_to_tokens("x" * 100, 10), "x" * 40 + "... [truncated]")
+
+    def test_token_budget_keeps_most_recent_results(self):
+        steps = [f"step {i}" for i in range(50)]
+        transcript = {i: render_step(i, step, "r" * 400) for i, step in enumerate(steps)}
+        full_plan = get_full_plan({"plan": Plan(steps=steps), "transcript": transcript}, token_budget=500)
+        self.assertLessEqual(full_plan.count("Result:"), 5)
+        self.assertIn(transcript[49], full_plan)
+        self.assertNotIn(transcript[0], full_plan)
+
+    def test_token_budget_keeps_dependency_results(self):
+        steps = [f"step {i}" for i in range(50)]
+        transcript = {i: render_step(i, step, "r" * 400) for i, step in enumerate(steps) if i != 49}
+        # the last step depends on the first one, far outside the recency window
+        plan = Plan(steps=steps, dependencies=[[]] + [[i] for i in range(1, 49)] + [[1]])
+        full_plan = get_full_plan({"plan": plan, "transcript": transcript}, token_budget=500, step=49)
+        self.assertLessEqual(full_plan.count("Result:"), 5)
+        self.assertIn(transcript[0], full_plan)
+        self.assertIn(transcript[48], full_plan)
+        self.assertNotIn(transcript[1], full_plan)
+
+    def test_bounded_prompt_size(self):
+        # per-step prompt stays bounded for long plans with long results
+        steps = [f"search {i}" for i in range(40)]
+        with patch("plan.MAX_RESULT_TOKENS", 50), patch("plan.PLAN_TOKEN_BUDGET", 300):
+            _, executor, _ = _run(Plan(steps=steps), latency=0)
+        sizes = [estimate_tokens(call["plan"]) for call in executor.calls]
+        self.assertEqual(len(sizes), 40)
+        plan_lines = estimate_tokens("\n".join(render_step(i, s) for i, s in enumerate(steps)))
+        self.assertLessEqual(max(sizes), plan_lines + 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
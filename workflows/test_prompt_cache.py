@@ -0,0 +1,124 @@
+import unittest
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import get_usage_metadata_callback
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompts import ChatPromptTemplate
+from prompt_cache import cached_prefix_prompt, supports_cache_control
+
+
+class FakeCachingChatModel(BaseChatModel):
+    """
+    Local fake provider that mimics Anthropic prompt caching.
+    Every content block marked with cache_control is a cache breakpoint; the longest previously
+    seen breakpoint prefix is read from cache and the rest of the prompt is billed as uncached.
+    Tokens are counted as whitespace separated words.
+    """
+    prefix_cache: set = set()
+    cached_tokens: int = 0
+    uncached_tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-caching-chat"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prefix: List[str] = []
+        breakpoints = []
+        for message in messages:
+            blocks = message.content if isinstance(message.content, list) else [{"text": message.content}]
+            for block in blocks:
+                prefix.extend(block["text"].split())
+                if "cache_control" in block:
+                    breakpoints.append((len(prefix), hash(tuple(prefix))))
+
+        cached = max((n for n, key in breakpoints if key in self.prefix_cache), default=0)
+        self.prefix_cache.update(key for _, key in breakpoints)
+        self.cached_tokens += cached
+        self.uncached_tokens += len(prefix) - cached
+
+        message = AIMessage("ok", usage_metadata={
+            "input_tokens": len(prefix),
+            "output_tokens": 1,
+            "total_tokens": len(prefix) + 1,
+            "input_token_details": {"cache_read": cached},
+        }, response_metadata={"model_name": "fake-caching-chat"})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+JOB_DESCRIPTION = "machine learning engineer " * 500
+RESUME = "built ranking models at scale " * 400
+
+
+def _run_rounds(prompt: ChatPromptTemplate, llm: FakeCachingChatModel, rounds: int = 3) -> None:
+    chain = prompt | llm
+    for i in range(rounds):
+        chain.invoke({
+            "job_description": JOB_DESCRIPTION,
+            "resume_str": RESUME,
+            "cover_letter": f"draft number {i}",
+        })
+
+
+class TestCachedPrefixPrompt(unittest.TestCase):
+    """Test prompt layout keeps static context in a cacheable prefix"""
+
+    def test_layout_without_cache_control(self):
+        prompt = cached_prefix_prompt("system", "JD: {job_description}", "CL: {cover_letter}")
+        messages = prompt.invoke({"job_description": "jd", "cover_letter": "cl"}).to_messages()
+        self.assertEqual(len(messages), 2)
+        self.assertEqual([b["text"] for b in messages[1].content], ["JD: jd", "CL: cl"])
+        self.assertNotIn("cache_control", messages[1].content[0])
+
+    def test_layout_with_cache_control(self):
+        prompt = cached_prefix_prompt("system", "JD: {job_description}", "CL: {cover_letter}", cache_control=True)
+        messages = prompt.invoke({"job_description": "jd", "cover_letter": "cl"}).to_messages()
+        self.assertIn("cache_control", messages[0].content[0])
+        self.assertIn("cache_control", messages[1].content[0])
+        self.assertNotIn("cache_control", messages[1].content[1])
+
+    def test_supports_cache_control(self):
+        self.assertFalse(supports_cache_control(FakeCachingChatModel()))
+
+
+class TestPromptCacheSavings(unittest.TestCase):
+    """Measure cached vs uncached prefix tokens against a local fake provider"""
+
+    def test_mixed_layout_is_never_cached(self):
+        llm = FakeCachingChatModel(prefix_cache=set())
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "critique system prompt"),
+            ("user", "Job Description: {job_description}\nResume:\n{resume_str}\nCover Letter\n:{cover_letter}\n"),
+        ])
+        _run_rounds(prompt, llm)
+        self.assertEqual(llm.cached_tokens, 0)
+
+    def test_cached_prefix_layout(self):
+        llm = FakeCachingChatModel(prefix_cache=set())
+        prompt = cached_prefix_prompt(
+            "critique system prompt",
+            "Job Description: {job_description}\nResume:\n{resume_str}\n",
+            "Cover Letter\n:{cover_letter}\n",
+            cache_control=True,
+        )
+        with get_usage_metadata_callback() as cb:
+            _run_rounds(prompt, llm, rounds=3)
+
+        static_tokens = 3 + 2 + len(JOB_DESCRIPTION.split()) + 1 + len(RESUME.split())
+        # first round writes the cache, the following two rounds read the whole static prefix
+        self.assertEqual(llm.cached_tokens, 2 * static_tokens)
+        self.assertGreater(llm.cached_tokens, 2 * llm.uncached_tokens / 3)
+        usage = next(iter(cb.usage_metadata.values()))
+        self.assertEqual(usage["input_token_details"]["cache_read"], llm.cached_tokens)
+
+
+if __name__ == "__main__":
+    unittest.main()
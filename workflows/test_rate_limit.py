@@ -0,0 +1,169 @@
+import asyncio
+import concurrent.futures
+import http.server
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import rate_limit
+from rate_limit import BATCH, INTERACTIVE, Limits, Scheduler, TokenBucket, httpx
+
+
+class FakeProvider(http.server.ThreadingHTTPServer):
+    """Chat completions endpoint that answers 429 with retry-after-ms above max_concurrent requests"""
+
+    def __init__(self, max_concurrent: int, latency: float = 0.02):
+        super().__init__(("127.0.0.1", 0), FakeProviderHandler)
+        self.max_concurrent = max_concurrent
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/chat/completions"
+
+
+class FakeProviderHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: dict, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            throttled = server.active >= server.max_concurrent
+            if throttled:
+                server.throttled += 1
+            else:
+                server.active += 1
+                server.peak = max(server.peak, server.active)
+        if throttled:
+            return self._reply(429, {"error": "rate limited"}, [("retry-after-ms", "50")])
+        time.sleep(server.latency)
+        with server.lock:
+            server.active -= 1
+        self._reply(200, {"choices": []})
+
+
+class TestRateLimitedTransport(unittest.TestCase):
+    """Test scheduling against a local server that injects rate limit errors"""
+
+    def setUp(self):
+        self.server = FakeProvider(max_concurrent=4)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        # a fresh scheduler per test
+        limits = mock.patch.dict(rate_limit.LIMITS, {"fake-model": Limits(100_000, 10_000_000, 32)})
+        limits.start()
+        self.addCleanup(limits.stop)
+        self.addCleanup(rate_limit._schedulers.clear)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, client: httpx.Client) -> int:
+        return client.post(self.server.url, json={"model": "fake-model", "messages": []}).status_code
+
+    def test_requests_succeed_and_concurrency_adapts(self):
+        with httpx.Client(transport=rate_limit.RateLimitedTransport()) as client:
+            with concurrent.futures.ThreadPoolExecutor(32) as pool:
+                statuses = list(pool.map(lambda _: self.post(client), range(200)))
+        scheduler = rate_limit.get_scheduler("127.0.0.1", "fake-model")
+        self.assertEqual(statuses, [200] * 200)
+        self.assertGreater(self.server.throttled, 0)
+        self.assertEqual(scheduler.stats["retries"], self.server.throttled)
+        # started at 16, 429s above 4 concurrent requests bring the limit down
+        self.assertLessEqual(scheduler.concurrency, 8)
+        self.assertEqual(scheduler.in_flight, 0)
+
+    def test_async_client(self):
+        async def run():
+            async with httpx.AsyncClient(transport=rate_limit.AsyncRateLimitedTransport()) as client:
+                responses = await asyncio.gather(*(
+                    client.post(self.server.url, json={"model": "fake-model", "messages": []}) for _ in range(50)
+                ))
+            return [response.status_code for response in responses]
+
+        self.assertEqual(asyncio.run(run()), [200] * 50)
+        self.assertEqual(rate_limit.get_scheduler("127.0.0.1", "fake-model").in_flight, 0)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.max_concurrent = 0
+        with httpx.Client(transport=rate_limit.RateLimitedTransport(max_retries=2)) as client:
+            self.assertEqual(self.post(client), 429)
+        self.assertEqual(self.server.throttled, 3)
+
+
+class TestScheduler(unittest.TestCase):
+    """Test admission order and limits"""
+
+    def test_interactive_preempts_queued_batch(self):
+        scheduler = Scheduler("test", Limits(100_000, 10_000_000, max_concurrency=2))
+        scheduler.acquire(1, INTERACTIVE)
+        admitted = []
+
+        def request(name, priority):
+            scheduler.acquire(1, priority)
+            admitted.append(name)
+            scheduler.release()
+
+        threads = [threading.Thread(target=request, args=(f"batch {i}", BATCH)) for i in range(3)]
+        threads.append(threading.Thread(target=request, args=("interactive", INTERACTIVE)))
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        scheduler.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, ["interactive", "batch 0", "batch 1", "batch 2"])
+
+    def test_batch_leaves_slots_for_interactive(self):
+        scheduler = Scheduler("test", Limits(100_000, 10_000_000, max_concurrency=8))
+        for _ in range(3):
+            scheduler.acquire(1, BATCH)
+        waiting = threading.Thread(target=scheduler.acquire, args=(1, BATCH))
+        waiting.start()
+        waiting.join(0.05)
+        self.assertTrue(waiting.is_alive())
+        # interactive requests get the slot batch ones may not use
+        scheduler.acquire(1, INTERACTIVE)
+        self.assertEqual(scheduler.in_flight, 4)
+        scheduler.release()
+        scheduler.release()
+        waiting.join()
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(60, now=0.0)
+        self.assertEqual(bucket.wait_time(60, 0.0), 0.0)
+        bucket.take(60, 0.0)
+        self.assertAlmostEqual(bucket.wait_time(1, 0.0), 1.0)
+        self.assertAlmostEqual(bucket.wait_time(1, 0.5), 0.5)
+        # larger than the capacity, waits for a full bucket
+        self.assertAlmostEqual(bucket.wait_time(600, 0.0), 60.0)
+
+    def test_tokens_per_minute_limit(self):
+        scheduler = Scheduler("test", Limits(100_000, tokens_per_minute=6_000))
+        start = time.monotonic()
+        scheduler.acquire(6_000)
+        scheduler.release()
+        # 100 tokens per second refill
+        scheduler.acquire(20)
+        self.assertGreater(time.monotonic() - start, 0.15)
+
+
+if __name__ == "__main__":
+    unittest.main()
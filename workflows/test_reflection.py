@@ -0,0 +1,136 @@
+import unittest
+import concurrent.futures
+from typing import Optional, TypedDict
+
+from langgraph.graph import StateGraph, START, END
+from reflection import (
+    ReflectionLoop, ReflectionStats, edit_similarity, embedding_similarity, round_stats, total_latency, total_tokens
+)
+
+
+class DraftState(TypedDict):
+    draft: str
+    critique: Optional[str]
+    revision_round: int
+    previous_draft: Optional[str]
+    reflection_stats: ReflectionStats
+
+
+class FakeEmbeddings:
+    """Embeds text as character counts of a, b and c"""
+
+    def embed_documents(self, texts):
+        return [[float(t.count(c)) for c in "abc"] for t in texts]
+
+
+def _build_graph(loop: ReflectionLoop, critique_node, revise_node):
+    def _route(state: DraftState):
+        return "revise" if loop.should_revise(state) else "end"
+
+    return (
+        StateGraph(DraftState)
+        .add_node("critique_node", loop.critique_node(critique_node))
+        .add_node("revise_node", loop.revise_node(revise_node))
+        .add_edge(START, "critique_node")
+        .add_conditional_edges("critique_node", _route, {
+            "revise": "revise_node",
+            "end": END
+        })
+        .add_edge("revise_node", "critique_node")
+        .compile()
+    )
+
+
+class TestSimilarity(unittest.TestCase):
+    """Test draft similarity functions"""
+
+    def test_edit_similarity_identical(self):
+        self.assertEqual(edit_similarity("cover letter", "cover letter"), 1.0)
+
+    def test_edit_similarity_different(self):
+        self.assertLess(edit_similarity("aaaa", "bbbb"), 0.5)
+
+    def test_embedding_similarity(self):
+        similarity = embedding_similarity(FakeEmbeddings())
+        self.assertAlmostEqual(similarity("ab", "ba"), 1.0)
+        self.assertAlmostEqual(similarity("a", "b"), 0.0)
+
+
+class TestReflectionLoop(unittest.TestCase):
+    """Test bounded critique/revise loop"""
+
+    def test_should_revise_without_critique(self):
+        loop = ReflectionLoop(draft_key="draft")
+        self.assertFalse(loop.should_revise({"draft": "x", "critique": None}))
+
+    def test_should_revise_with_critique(self):
+        loop = ReflectionLoop(draft_key="draft")
+        self.assertTrue(loop.should_revise({"draft": "x", "critique": ""}))
+
+    def test_stops_at_max_rounds(self):
+        loop = ReflectionLoop(draft_key="draft", max_rounds=3)
+        counter = {"n": 0}
+
+        def critique(state):
+            return {"critique": "always something to fix"}
+
+        def revise(state):
+            # every revision is a completely new draft so it never converges
+            counter["n"] += 1
+            return {"draft": str(counter["n"]) * 50}
+
+        result = _build_graph(loop, critique, revise).invoke({"draft": "initial", "critique": None})
+        self.assertEqual(result["revision_round"], 3)
+        self.assertEqual(counter["n"], 3)
+        # 4 critique calls and 3 revise calls are accounted
+        self.assertEqual(len(round_stats(result)), 7)
+        self.assertEqual([s.node for s in round_stats(result)].count("revise"), 3)
+
+    def test_stops_on_convergence(self):
+        loop = ReflectionLoop(draft_key="draft", max_rounds=10, similarity_threshold=0.9)
+
+        def critique(state):
+            return {"critique": "minor nit"}
+
+        def revise(state):
+            # revision only appends a single character, drafts converge on the first round
+            return {"draft": state["draft"] + "."}
+
+        result = _build_graph(loop, critique, revise).invoke({"draft": "a" * 100, "critique": None})
+        self.assertEqual(result["revision_round"], 1)
+        self.assertEqual(result["previous_draft"], "a" * 100)
+
+    def test_accounting(self):
+        loop = ReflectionLoop(draft_key="draft")
+
+        def critique(state):
+            return {"critique": None}
+
+        def revise(state):
+            return {"draft": state["draft"]}
+
+        result = _build_graph(loop, critique, revise).invoke({"draft": "a", "critique": None})
+        self.assertEqual(len(round_stats(result)), 1)
+        self.assertEqual(round_stats(result)[0].round, 0)
+        self.assertEqual(total_tokens(result), 0)
+        self.assertGreaterEqual(total_latency(result), 0.0)
+
+    def test_concurrent_runs_are_accounted_separately(self):
+        loop = ReflectionLoop(draft_key="draft", max_rounds=10, similarity=lambda previous, current: 0.0)
+
+        def critique(state):
+            # each run revises as many times as its draft is long
+            return {"critique": "longer" if state.get("revision_round", 0) < len(state["draft"]) else None}
+
+        def revise(state):
+            return {"draft": state["draft"]}
+
+        graph = _build_graph(loop, critique, revise)
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda n: graph.invoke({"draft": "x" * n, "critique": None}), range(1, 5)))
+        # n revisions and n + 1 critiques per run
+        self.assertEqual([len(round_stats(result)) for result in results], [3, 5, 7, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import unittest
+from typing import Optional
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, ValidationError
+
+import routing
+from routing import Cascade, non_empty
+
+
+class Critique(BaseModel):
+    critique: Optional[str] = None
+    cover_letter: str
+
+
+class FakeModel(FakeListChatModel):
+    """Answers the listed responses in turn, structured output parses them as JSON"""
+    model_name: str = "fake"
+    raise_error: bool = False
+
+    def _call(self, *args, **kwargs):
+        if self.raise_error:
+            raise RuntimeError("provider unavailable")
+        return super()._call(*args, **kwargs)
+
+    def invoke(self, *args, **kwargs):
+        message = super().invoke(*args, **kwargs)
+        message.usage_metadata = {"input_tokens": 100, "output_tokens": 10, "total_tokens": 110}
+        return message
+
+    def with_structured_output(self, schema, *, include_raw=False, **kwargs):
+        def parse(message: AIMessage):
+            try:
+                return {"raw": message, "parsed": schema.model_validate_json(message.content), "parsing_error": None}
+            except ValidationError as e:
+                return {"raw": message, "parsed": None, "parsing_error": e}
+        return self | RunnableLambda(parse)
+
+
+class TestCascade(unittest.TestCase):
+    """Test escalation from the fast to the strong model"""
+
+    def setUp(self):
+        routing._stats.clear()
+        self.strong = FakeModel(model_name="gpt-4o", responses=['{"cover_letter": "strong letter"}'])
+
+    def route(self, name):
+        return routing.route_summary()[name]
+
+    def test_valid_answer_stays_on_fast_model(self):
+        fast = FakeModel(model_name="gpt-4o-mini", responses=['{"critique": null, "cover_letter": "letter"}'])
+        chain = Cascade("critique", [fast, self.strong], Critique, non_empty("cover_letter"))
+        self.assertEqual(chain.invoke("prompt"), Critique(cover_letter="letter"))
+        self.assertEqual(self.route("critique:gpt-4o-mini")["calls"], 1)
+        self.assertEqual(self.route("critique:gpt-4o-mini")["escalated"], 0)
+        self.assertAlmostEqual(self.route("critique:gpt-4o-mini")["cost"], (100 * 0.15 + 10 * 0.60) / 1e6)
+        self.assertNotIn("critique:gpt-4o", routing.route_summary())
+
+    def test_escalates_on_schema_validation_failure(self):
+        fast = FakeModel(model_name="gpt-4o-mini", responses=['{"critique": "too long"}'])
+        chain = Cascade("critique", [fast, self.strong], Critique)
+        self.assertEqual(chain.invoke("prompt").cover_letter, "strong letter")
+        self.assertEqual(self.route("critique:gpt-4o-mini")["escalated"], 1)
+        self.assertEqual(self.route("critique:gpt-4o")["calls"], 1)
+
+    def test_escalates_on_rejected_answer(self):
+        fast = FakeModel(model_name="gpt-4o-mini", responses=['{"cover_letter": "  "}'])
+        chain = Cascade("critique", [fast, self.strong], Critique, non_empty("cover_letter"))
+        self.assertEqual(asyncio.run(chain.ainvoke("prompt")).cover_letter, "strong letter")
+        self.assertEqual(self.route("critique:gpt-4o-mini")["escalated"], 1)
+
+    def test_call_errors_are_raised_without_escalating(self):
+        fast = FakeModel(model_name="gpt-4o-mini", responses=["unused"], raise_error=True)
+        chain = Cascade("critique", [fast, self.strong], Critique)
+        with self.assertRaises(RuntimeError):
+            chain.invoke("prompt")
+        with self.assertRaises(RuntimeError):
+            asyncio.run(chain.ainvoke("prompt"))
+        self.assertEqual(self.route("critique:gpt-4o-mini")["errors"], 2)
+        self.assertEqual(self.route("critique:gpt-4o-mini")["escalated"], 0)
+        self.assertNotIn("critique:gpt-4o", routing.route_summary())
+
+    def test_parse_error_of_last_model_raises(self):
+        fast = FakeModel(model_name="gpt-4o-mini", responses=['{"critique": "too long"}'])
+        strong = FakeModel(model_name="gpt-4o", responses=["not json"])
+        chain = Cascade("critique", [fast, strong], Critique)
+        with self.assertRaises(ValidationError):
+            chain.invoke("prompt")
+        with self.assertRaises(ValidationError):
+            asyncio.run(chain.ainvoke("prompt"))
+
+    def test_missing_structured_output_of_last_model_raises(self):
+        class NoToolCallModel(FakeModel):
+            def with_structured_output(self, schema, *, include_raw=False, **kwargs):
+                # the model answered in text instead of calling the schema tool
+                return self | RunnableLambda(lambda message: {"raw": message, "parsed": None, "parsing_error": None})
+
+        chain = Cascade("critique", [NoToolCallModel(model_name="gpt-4o", responses=["plain text"])], Critique)
+        with self.assertRaises(OutputParserException):
+            chain.invoke("prompt")
+
+    def test_plain_text_escalates_on_empty_answer(self):
+        fast = FakeModel(model_name="gpt-4o-mini", responses=[""])
+        answer = Cascade("search", [fast, FakeModel(model_name="gpt-4o", responses=["jobs"])]).invoke("prompt")
+        self.assertEqual(answer.content, "jobs")
+
+    def test_last_model_answer_is_returned_even_if_rejected(self):
+        fast = FakeModel(model_name="gpt-4o-mini", responses=['{"cover_letter": ""}'])
+        strong = FakeModel(model_name="gpt-4o", responses=['{"cover_letter": ""}'])
+        chain = Cascade("critique", [fast, strong], Critique, non_empty("cover_letter"))
+        self.assertEqual(chain.invoke("prompt").cover_letter, "")
+        self.assertEqual(self.route("critique:gpt-4o")["escalated"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from sandbox import PythonSandboxTool, SandboxPool, sanitize_input
+
+
+class TestSandboxPool(unittest.TestCase):
+    """Test sandboxed code execution in worker processes"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = SandboxPool(size=1, timeout=2, max_rss_mb=256, preload=("json",))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_output(self):
+        self.assertEqual(self.pool.execute("print(1 + 1)"), "2\n")
+
+    def test_error_traceback(self):
+        output = self.pool.execute("1 / 0")
+        self.assertIn("ZeroDivisionError", output)
+        # worker survives errors in the executed code
+        self.assertEqual(self.pool.execute("print('ok')"), "ok\n")
+
+    def test_fresh_namespace_per_call(self):
+        self.pool.execute("x = 42")
+        self.assertIn("NameError", self.pool.execute("print(x)"))
+
+    def test_preloaded_modules_are_reused(self):
+        self.assertEqual(self.pool.execute("import sys; print('json' in sys.modules)"), "True\n")
+
+    def test_streamed_output(self):
+        chunks = []
+        arrivals = []
+        for chunk in self.pool.execute_stream("import time\nfor i in range(3):\n    print(i)\n    time.sleep(0.1)"):
+            chunks.append(chunk)
+            arrivals.append(time.monotonic())
+        self.assertEqual("".join(chunks), "0\n1\n2\n")
+        # first line arrives before the code finished running
+        self.assertGreater(arrivals[-1] - arrivals[0], 0.15)
+
+    def test_timeout(self):
+        start = time.monotonic()
+        output = self.pool.execute("while True: pass", timeout=0.5)
+        self.assertIn("SandboxTimeout", output)
+        self.assertLess(time.monotonic() - start, 2)
+        # worker is replaced, next call works
+        self.assertEqual(self.pool.execute("print('recovered')"), "recovered\n")
+
+    def test_memory_limit(self):
+        output = self.pool.execute("x = bytearray(512 * 2**20)\nimport time\ntime.sleep(1)")
+        self.assertTrue("SandboxMemoryLimit" in output or "MemoryError" in output)
+        self.assertEqual(self.pool.execute("print('recovered')"), "recovered\n")
+
+    def test_memory_limit_while_printing(self):
+        # allocation is paced, so a worker that is not stopped holds at most ~600 MB before the timeout
+        code = (
+            "import time\nchunks = []\nwhile True:\n"
+            "    chunks.append(bytearray(2**20))\n    print(len(chunks))\n    time.sleep(0.005)"
+        )
+        output = self.pool.execute(code, timeout=3)
+        self.assertTrue("SandboxMemoryLimit" in output or "MemoryError" in output)
+        # stopped close to the 256 MB limit, not only once the output pauses
+        allocated_mb = max(int(line) for line in output.splitlines() if line.isdigit())
+        self.assertLess(allocated_mb, 320)
+        self.assertEqual(self.pool.execute("print('recovered')"), "recovered\n")
+
+    def test_memory_limit_of_child_processes(self):
+        code = "import subprocess, sys\nprint(subprocess.run([sys.executable, '-c', 'bytearray(512 * 2**20)']).returncode)"
+        self.assertEqual(self.pool.execute(code), "1\n")
+
+    def test_worker_environment(self):
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}):
+            with SandboxPool(size=1, preload=()) as pool:
+                output = pool.execute("import os\nprint('OPENAI_API_KEY' in os.environ, os.listdir('.'))")
+        self.assertEqual(output, "False []\n")
+
+
+class TestPythonSandboxTool(unittest.TestCase):
+    """Test the tool used by the code agent"""
+
+    def test_sanitize_input(self):
+        self.assertEqual(sanitize_input("```python\nprint(1)\n```"), "print(1)")
+
+    def test_tool(self):
+        with SandboxPool(size=1, preload=()) as pool:
+            tool = PythonSandboxTool(pool=pool)
+            self.assertEqual(tool.invoke("```python\nprint('hi')\n```"), "hi\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
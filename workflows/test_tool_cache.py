@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from langchain_core.stores import InMemoryByteStore
+from langchain_core.tools import BaseTool
+from tool_cache import (
+    CachedTool,
+    ToolResultStore,
+    cache_key,
+    cached_tools,
+    hit_rates,
+    normalize_query,
+)
+
+
+class FakeSearchTool(BaseTool):
+    """Local search tool that counts how often it was actually called"""
+    name: str = "fake-search"
+    description: str = "search for a query"
+    latency: float = 0.0
+    calls: int = 0
+
+    def _run(self, query: str) -> str:
+        self.calls += 1
+        time.sleep(self.latency)
+        return f"results for {query}"
+
+    async def _arun(self, query: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return f"results for {query}"
+
+
+class FailingTool(FakeSearchTool):
+    name: str = "failing-search"
+
+    def _run(self, query: str) -> str:
+        self.calls += 1
+        raise ValueError("search is down")
+
+
+def _cached(tool: BaseTool, ttl: float = 60) -> CachedTool:
+    return cached_tools([tool], ToolResultStore(InMemoryByteStore(), ttl=ttl))[0]
+
+
+class TestCacheKey(unittest.TestCase):
+    """Test query normalization"""
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  Large Language   Models? "), "large language models?")
+        self.assertEqual(normalize_query({"query": "ＬＬＭ!"}), {"query": "llm!"})
+
+    def test_near_identical_queries_share_key(self):
+        self.assertEqual(cache_key("arxiv", "Attention is all you need"), cache_key("arxiv", " attention is  ALL you need"))
+        self.assertNotEqual(cache_key("arxiv", "transformers"), cache_key("wikipedia", "transformers"))
+
+    def test_punctuation_keeps_queries_apart(self):
+        for queries in [("C++", "C#", "C"), ("1605.08386", "1605 08386"), ("what is x?", "what is x")]:
+            self.assertEqual(len({cache_key("search", query) for query in queries}), len(queries), queries)
+
+
+class TestCachedTool(unittest.TestCase):
+    """Test cached tool against local fake tools"""
+
+    def test_wraps_tool_metadata(self):
+        tool = _cached(FakeSearchTool())
+        self.assertEqual(tool.name, "fake-search")
+        self.assertEqual(tool.description, "search for a query")
+
+    def test_cache_hit(self):
+        fake = FakeSearchTool()
+        tool = _cached(fake)
+        self.assertEqual(tool.invoke("LangGraph"), "results for LangGraph")
+        self.assertEqual(tool.invoke({"query": " langgraph "}), "results for LangGraph")
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual(hit_rates([tool]), {"fake-search": 0.5})
+
+    def test_persistent_store_is_shared(self):
+        store = ToolResultStore(InMemoryByteStore())
+        fake = FakeSearchTool()
+        cached_tools([fake], store)[0].invoke("query")
+        # new wrapper (e.g. another agent or process) reads what the first one stored
+        cached_tools([fake], store)[0].invoke("query")
+        self.assertEqual(fake.calls, 1)
+
+    def test_ttl_expiry(self):
+        fake = FakeSearchTool()
+        tool = _cached(fake, ttl=10)
+        tool.invoke("query")
+        with patch("tool_cache.time.time", return_value=time.time() + 11):
+            tool.invoke("query")
+        self.assertEqual(fake.calls, 2)
+
+    def test_errors_are_not_cached(self):
+        fake = FailingTool()
+        tool = _cached(fake)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                tool.invoke("query")
+        self.assertEqual(fake.calls, 2)
+
+    def test_store_failure_does_not_block_callers(self):
+        store = ToolResultStore(InMemoryByteStore())
+        fake = FakeSearchTool(latency=0.2)
+        tool = cached_tools([fake], store)[0]
+        with patch.object(store, "set", side_effect=OSError("disk full")):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(tool.invoke, ["query"] * 4))
+        self.assertEqual(results, ["results for query"] * 4)
+        # the failed write left no call in flight, the next identical call runs the tool again
+        self.assertEqual(tool.invoke("query"), "results for query")
+        self.assertEqual(fake.calls, 2)
+
+    def test_call_during_store_write_is_coalesced(self):
+        store = ToolResultStore(InMemoryByteStore())
+        fake = FakeSearchTool()
+        tool = cached_tools([fake], store)[0]
+        set_result = store.set
+        late = []
+        # an identical call arrives while the first result is being written
+        thread = threading.Thread(target=lambda: late.append(tool.invoke("query")))
+
+        def _slow_set(key, result):
+            thread.start()
+            time.sleep(0.1)
+            set_result(key, result)
+
+        with patch.object(store, "set", side_effect=_slow_set):
+            self.assertEqual(tool.invoke("query"), "results for query")
+        thread.join(timeout=5)
+        self.assertEqual(late, ["results for query"])
+        self.assertEqual(fake.calls, 1)
+
+    def test_store_reads_run_concurrently(self):
+        store = ToolResultStore(InMemoryByteStore())
+        tool = cached_tools([FakeSearchTool()], store)[0]
+        get_result = store.get
+
+        def _slow_get(key):
+            time.sleep(0.3)
+            return get_result(key)
+
+        start = time.perf_counter()
+        with patch.object(store, "get", side_effect=_slow_get):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(tool.invoke, ["first", "second", "third", "fourth"]))
+        # one read at a time would take 4 * 0.3s
+        self.assertLess(time.perf_counter() - start, 0.9)
+
+    def test_thread_coalescing(self):
+        fake = FakeSearchTool(latency=0.2)
+        tool = _cached(fake)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(tool.invoke, ["same query"] * 8))
+        self.assertEqual(results, ["results for same query"] * 8)
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual(tool.stats.misses, 1)
+        self.assertEqual(tool.stats.hits + tool.stats.coalesced, 7)
+
+    def test_async_coalescing(self):
+        fake = FakeSearchTool(latency=0.2)
+        tool = _cached(fake)
+
+        async def _run():
+            return await asyncio.gather(*[tool.ainvoke("same query") for _ in range(5)])
+
+        start = time.perf_counter()
+        results = asyncio.run(_run())
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(results, ["results for same query"] * 5)
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual(tool.stats.coalesced, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import pathlib
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+from langchain_core.messages import ToolMessage
+from langchain_core.stores import InMemoryByteStore
+from langgraph.prebuilt import create_react_agent
+
+from tool_cache import ToolResultStore, cached_tools, hit_rates
+import tool_timeouts
+from tool_timeouts import get_tool_pool, with_timeouts
+
+# fake chat model and search tool of the benchmarks
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+from fakes import FakeChatModel, fake_search_tool  # noqa: E402
+
+DELAY = 0.2
+
+
+class TestToolTimeouts(unittest.TestCase):
+    """Test concurrent tool calls of an agent turn with a slow tool"""
+
+    def setUp(self):
+        self.tools = [fake_search_tool(DELAY, "wikipedia"), fake_search_tool(DELAY, "arxiv"),
+                      fake_search_tool(10 * DELAY, "duckduckgo_search")]
+        self.model = FakeChatModel(tool_calls_per_turn=3)
+
+    def agent(self, tools):
+        return create_react_agent(model=self.model, tools=tools)
+
+    def tool_messages(self, result) -> dict:
+        return {m.name: m for m in result["messages"] if isinstance(m, ToolMessage)}
+
+    def test_step_waits_for_slowest_tool_without_timeouts(self):
+        start = time.perf_counter()
+        self.agent(self.tools).invoke({"messages": [("user", "question")]})
+        # concurrent, but the step takes as long as the slow search
+        self.assertGreaterEqual(time.perf_counter() - start, 10 * DELAY)
+
+    def test_slow_tool_times_out_with_partial_results(self):
+        tools = with_timeouts(self.tools, {"duckduckgo_search": 2 * DELAY})
+        for run in (lambda agent, inputs: agent.invoke(inputs), lambda agent, inputs: asyncio.run(agent.ainvoke(inputs))):
+            start = time.perf_counter()
+            result = run(self.agent(tools), {"messages": [("user", "question")]})
+            seconds = time.perf_counter() - start
+            # concurrent: one search delay, not the sum of all three
+            self.assertLess(seconds, 5 * DELAY)
+            messages = self.tool_messages(result)
+            self.assertEqual(messages["wikipedia"].status, "success")
+            self.assertEqual(messages["arxiv"].status, "success")
+            self.assertEqual(messages["duckduckgo_search"].status, "error")
+            self.assertIn("did not answer within", messages["duckduckgo_search"].content)
+            # the agent still answers
+            self.assertFalse(result["messages"][-1].tool_calls)
+        self.assertEqual(tools[2].timeouts, 2)
+
+    def test_timed_out_call_is_still_cached(self):
+        store = ToolResultStore(InMemoryByteStore())
+        tools = with_timeouts(cached_tools([fake_search_tool(3 * DELAY, "arxiv")], store), {"arxiv": DELAY})
+        self.assertIn("did not answer within", tools[0].invoke({"query": "q"}))
+        # the call finishes in the background and fills the cache
+        time.sleep(3 * DELAY)
+        start = time.perf_counter()
+        tools[0].invoke({"query": "q"})
+        self.assertLess(time.perf_counter() - start, DELAY)
+        self.assertEqual(hit_rates(tools), {"arxiv": 0.5})
+
+    def test_hung_calls_do_not_starve_other_tools(self):
+        get_tool_pool.cache_clear()
+        self.addCleanup(get_tool_pool.cache_clear)
+        with patch.object(tool_timeouts, "TOOL_WORKERS", 2):
+            hanging, fast = with_timeouts([fake_search_tool(10 * DELAY, "duckduckgo_search"),
+                                           fake_search_tool(0, "wikipedia")],
+                                          {"duckduckgo_search": DELAY / 4, "wikipedia": DELAY})
+            # more hung calls than threads
+            for i in range(4):
+                self.assertIn("did not answer within", hanging.invoke({"query": f"q{i}"}))
+            self.assertNotIn("did not answer within", fast.invoke({"query": "q"}))
+        self.assertEqual((hanging.timeouts, fast.timeouts), (4, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
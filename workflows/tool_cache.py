@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.stores import ByteStore
+from langchain_core.tools import BaseTool
+from pydantic import ConfigDict, PrivateAttr
+
+LOGGER = logging.getLogger(__name__)
+
+TOOL_CACHE_DIR = "./cache/tools/"
+# search results go stale, keep them for a day by default
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def default_tool_store() -> ByteStore:
+    """Persistent file store shared by all cached tools"""
+    from langchain.storage import LocalFileStore
+    return LocalFileStore(TOOL_CACHE_DIR)
+
+
+def normalize_query(value: Any) -> Any:
+    """
+    Normalizes tool input so queries differing only in case, unicode form or whitespace share a cache entry.
+    Punctuation is kept, "C++" and "C#" or "1605.08386" and "1605 08386" are different searches.
+    """
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFKC", value).casefold().split())
+    if isinstance(value, dict):
+        return {k: normalize_query(v) for k, v in value.items()}
+    return value
+
+
+def cache_key(tool_name: str, tool_input: Any) -> str:
+    payload = json.dumps([tool_name, normalize_query(tool_input)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ToolResultStore:
+    """TTL-bounded tool result store on top of a langchain ByteStore"""
+
+    def __init__(self, store: Optional[ByteStore] = None, ttl: float = DEFAULT_TTL):
+        self.store = store if store is not None else default_tool_store()
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.store.mget([key])[0]
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if time.time() - entry["created_at"] > self.ttl:
+            self.store.mdelete([key])
+            return None
+        return entry["result"]
+
+    def set(self, key: str, result: Any) -> None:
+        entry = {"created_at": time.time(), "result": result}
+        self.store.mset([(key, json.dumps(entry).encode("utf-8"))])
+
+
+@dataclass
+class ToolCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # calls that waited for an identical in-flight call instead of fetching
+    coalesced: int = 0
+
+    @property
+    def calls(self) -> int:
+        return self.hits + self.misses + self.coalesced
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.hits + self.coalesced) / self.calls if self.calls else 0.0
+
+
+class CachedTool(BaseTool):
+    """
+    Wraps langchain tool with persistent result cache.
+    Concurrent calls with the same normalized input share a single call of the wrapped tool.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    tool: BaseTool
+    store: ToolResultStore
+    stats: ToolCacheStats
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _in_flight: Dict[str, Future] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, tool: BaseTool, store: ToolResultStore, **kwargs: Any):
+        super().__init__(
+            tool=tool,
+            store=store,
+            stats=ToolCacheStats(),
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            **kwargs,
+        )
+
+    def _lookup(self, tool_input: Any) -> tuple[str, Future, bool]:
+        """Returns cache key, future with the result and whether the caller has to run the tool"""
+        # "query" and {"query": "query"} are the same call of a single input tool
+        if isinstance(tool_input, dict) and len(tool_input) == 1:
+            key = cache_key(self.name, next(iter(tool_input.values())))
+        else:
+            key = cache_key(self.name, tool_input)
+        with self._lock:
+            if key in self._in_flight:
+                self.stats.coalesced += 1
+                return key, self._in_flight[key], False
+        # the store is read outside the lock, a slow disk read doesn't hold up lookups of other keys
+        result = self.store.get(key)
+        with self._lock:
+            future: Future = Future()
+            if result is not None:
+                self.stats.hits += 1
+                future.set_result(result)
+                return key, future, False
+            # an identical call may have started while the store was read
+            if key in self._in_flight:
+                self.stats.coalesced += 1
+                return key, self._in_flight[key], False
+            self.stats.misses += 1
+            self._in_flight[key] = future
+            return key, future, True
+
+    def _complete(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        # the result is stored while the call is still in flight, so a caller arriving in between
+        # either waits for the future or finds the result in the store
+        if error is None:
+            try:
+                self.store.set(key, result)
+            except Exception as e:
+                LOGGER.warning(f"could not cache {self.name} result: {e}")
+        # waiting callers get the result even if storing it failed
+        try:
+            with self._lock:
+                del self._in_flight[key]
+        finally:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    @staticmethod
+    def _tool_input(args: tuple, kwargs: dict) -> Any:
+        return args[0] if args else kwargs
+
+    def _run(self, *args: Any, run_manager: Optional[CallbackManagerForToolRun] = None, **kwargs: Any) -> Any:
+        tool_input = self._tool_input(args, kwargs)
+        key, future, leader = self._lookup(tool_input)
+        if not leader:
+            return future.result()
+        try:
+            callbacks = run_manager.get_child() if run_manager else None
+            result = self.tool.invoke(tool_input, config={"callbacks": callbacks})
+        except BaseException as e:
+            self._complete(key, future, error=e)
+            raise
+        self._complete(key, future, result)
+        return result
+
+    async def _arun(
+        self, *args: Any, run_manager: Optional[AsyncCallbackManagerForToolRun] = None, **kwargs: Any
+    ) -> Any:
+        tool_input = self._tool_input(args, kwargs)
+        key, future, leader = self._lookup(tool_input)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            callbacks = run_manager.get_child() if run_manager else None
+            result = await self.tool.ainvoke(tool_input, config={"callbacks": callbacks})
+        except BaseException as e:
+            self._complete(key, future, error=e)
+            raise
+        self._complete(key, future, result)
+        return result
+
+
+def cached_tools(tools: List[BaseTool], store: Optional[ToolResultStore] = None) -> List[CachedTool]:
+    """Wraps tools with result cache, all of them sharing the same store"""
+    store = store if store is not None else ToolResultStore()
+    return [CachedTool(tool, store) for tool in tools]
+
+
+def _cached(tool: BaseTool) -> Optional[CachedTool]:
+    # looks through wrappers around the cached tool, e.g. with a timeout
+    while not isinstance(tool, CachedTool) and isinstance(getattr(tool, "tool", None), BaseTool):
+        tool = tool.tool
+    return tool if isinstance(tool, CachedTool) else None
+
+
+def hit_rates(tools: List[BaseTool]) -> Dict[str, float]:
+    """Returns cache hit rate for every cached tool"""
+    cached = [_cached(tool) for tool in tools]
+    return {tool.name: tool.stats.hit_rate for tool in cached if tool is not None}
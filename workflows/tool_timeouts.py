@@ -0,0 +1,140 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.tools import BaseTool, ToolException
+from pydantic import ConfigDict
+
+LOGGER = logging.getLogger(__name__)
+
+# seconds a search may take before the agent step continues without it
+TOOL_TIMEOUTS = {
+    "duckduckgo_search": 10.0,
+    "wikipedia": 10.0,
+    "arxiv": 15.0,
+}
+DEFAULT_TOOL_TIMEOUT = 20.0
+# threads running sync tool calls, calls that timed out keep theirs until they return
+TOOL_WORKERS = 16
+_replace_lock = threading.Lock()
+
+
+class ToolPool(concurrent.futures.ThreadPoolExecutor):
+    """Thread pool of sync tool calls counting the timed out calls still holding a thread"""
+
+    def __init__(self, workers: int):
+        super().__init__(workers, thread_name_prefix="tool")
+        self.workers = workers
+        self.stuck = 0
+        self._stuck_lock = threading.Lock()
+
+    def abandon(self, future: concurrent.futures.Future) -> int:
+        """Counts the timed out call until it returns, gives the number of stuck calls"""
+        with self._stuck_lock:
+            self.stuck += 1
+            stuck = self.stuck
+        # called right away when the call returned in the meantime
+        future.add_done_callback(self._released)
+        return stuck
+
+    def _released(self, future: concurrent.futures.Future) -> None:
+        with self._stuck_lock:
+            self.stuck -= 1
+
+
+@functools.cache
+def get_tool_pool() -> ToolPool:
+    return ToolPool(TOOL_WORKERS)
+
+
+def abandon_call(pool: ToolPool, future: concurrent.futures.Future) -> None:
+    """
+    Gives up on a timed out call. A call still queued is cancelled, a running one keeps its thread.
+    Once half the threads are held by hung calls, new calls go to a fresh pool instead of queueing behind them.
+    """
+    if future.cancel():
+        return
+    stuck = pool.abandon(future)
+    if stuck * 2 < pool.workers:
+        return
+    with _replace_lock:
+        if get_tool_pool() is not pool:
+            return
+        LOGGER.warning(f"{stuck} of {pool.workers} tool threads hung, starting a new tool pool")
+        get_tool_pool.cache_clear()
+    # calls already queued still run, the hung threads exit when their calls return
+    pool.shutdown(wait=False)
+
+
+class TimeoutTool(BaseTool):
+    """
+    Wraps langchain tool with a deadline. A call that does not finish in time gives an error tool message
+    instead, so the agent step goes on with the results of the other tool calls of the turn.
+    The wrapped call is left running, a cached tool still stores its result for the next identical call.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    tool: BaseTool
+    timeout: float
+    timeouts: int = 0
+
+    def __init__(self, tool: BaseTool, timeout: float, **kwargs: Any):
+        super().__init__(
+            tool=tool,
+            timeout=timeout,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            # the timeout message below becomes the content of an error tool message
+            handle_tool_error=True,
+            **kwargs,
+        )
+
+    def _timed_out(self) -> ToolException:
+        self.timeouts += 1
+        LOGGER.warning(f"{self.name} did not answer within {self.timeout:g}s")
+        return ToolException(
+            f"{self.name} did not answer within {self.timeout:g}s. "
+            "Continue with the results of the other tools or try again with a different query."
+        )
+
+    @staticmethod
+    def _tool_input(args: tuple, kwargs: dict) -> Any:
+        return args[0] if args else kwargs
+
+    def _run(self, *args: Any, run_manager: Optional[CallbackManagerForToolRun] = None, **kwargs: Any) -> Any:
+        callbacks = run_manager.get_child() if run_manager else None
+        # on a pool thread, so the caller can stop waiting, with the caller's context for tracing
+        pool = get_tool_pool()
+        future = pool.submit(
+            contextvars.copy_context().run, self.tool.invoke, self._tool_input(args, kwargs), {"callbacks": callbacks}
+        )
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            abandon_call(pool, future)
+            raise self._timed_out() from None
+
+    async def _arun(
+        self, *args: Any, run_manager: Optional[AsyncCallbackManagerForToolRun] = None, **kwargs: Any
+    ) -> Any:
+        callbacks = run_manager.get_child() if run_manager else None
+        task = asyncio.ensure_future(self.tool.ainvoke(self._tool_input(args, kwargs), config={"callbacks": callbacks}))
+        try:
+            # shielded, the call is not cancelled when the step stops waiting for it
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out() from None
+
+
+def with_timeouts(
+    tools: List[BaseTool], timeouts: Optional[Dict[str, float]] = None, default: float = DEFAULT_TOOL_TIMEOUT
+) -> List[TimeoutTool]:
+    """Wraps tools with the timeout of their name in timeouts (TOOL_TIMEOUTS by default)"""
+    timeouts = TOOL_TIMEOUTS if timeouts is None else timeouts
+    return [TimeoutTool(tool, timeouts.get(tool.name, default)) for tool in tools]